@@ -23,15 +23,38 @@ Example:
 
 To generate ELF with signature and certificate chain according to directory:
 python elfimg-tool-auth-sec.py -d /path/to/dir-of-sample -s /path/to/dir-of-signature-tool -b kmod_auth_sec -i
+
+To generate them in pipeline, hashing in 8 processes and signing in 4 runs at most:
+python elfimg-tool-auth-sec.py -d /path/to/dir-of-sample -s /path/to/dir-of-signature-tool -b kmod_auth_sec -j 8 -t 4
+
+To skip signature tool for unchanged modules, with signing cache of 64 MiB at most:
+python elfimg-tool-auth-sec.py -d /path/to/dir-of-sample -s /path/to/dir-of-signature-tool -b kmod_auth_sec -c /path/to/cache -m 64
+
+To verify generated ELF files in 8 processes, add '-i' if they were modified in place:
+python elfimg-tool-auth-sec.py -d /path/to/dir-of-sample -v -j 8
+
+Kernel module (*.ko) is taken as one code segment, while each PT_LOAD segment of
+ELF executable (*.elf) is laid out and hashed as its own code segment.
+
+Signature tool runs in its own directory, or in scratch directory of each job
+in pipeline, and is expected to generate cert/*.zip in its working directory.
 '''
 
 import os, sys
 import getopt
+import mmap
+import time
+import shutil
 import struct
 import hashlib
+import tempfile
+import threading
 import subprocess
+import multiprocessing
+import multiprocessing.pool
+import Queue
 from stat import *
-from zipfile import ZipFile
+from zipfile import ZipFile, BadZipfile
 
 '''
 Global Variable Definition
@@ -46,11 +69,19 @@ banner = '''
 
 class FileType:
   KMODULE = 0
+  ELF     = 1
 
 filetype_table = {
-  'ko': [FileType.KMODULE, '.ko']
+  'ko': [FileType.KMODULE, '.ko'],
+  'elf': [FileType.ELF, '.elf']
 }
 
+'''
+Suffixes of files to build Auth-Sec ELF
+'''
+def get_filetype_suffixes():
+  return tuple([v[1] for v in filetype_table.itervalues()])
+
 '''
 Certificate Definitions
 '''
@@ -63,6 +94,9 @@ MI_BOOT_IMG_HDR_SIZE  = 40        # sizeof(mi_boot_image_header_type)
 BOOT_HEADER_LENGTH    = 20        # Boot Header Number of Elements
 FLASH_PARTI_VERSION   = 3         # Flash Partition Version Number
 MAX_PHDR_COUNT        = 10        # Maximum allowable program headers
+MAX_SIGNTOOL_RUNS     = 4         # Maximum concurrent runs of signature tool in pipeline
+SIGN_CACHE_MAXSIZE    = 64        # Maximum size of signing cache in MiB
+SIGN_CACHE_MAGIC      = 'ESC1'    # Magic of signing cache entry
 
 '''
 ELF Definitions
@@ -83,6 +117,8 @@ ELFINFO_CLASS_32        = '\x01'
 ELFINFO_VERSION_INDEX   = 6
 ELFINFO_VERSION_CURRENT = '\x01'
 ELF_BLOCK_ALIGN         = 0x1000
+ELF_COPY_CHUNK_SZ       = 0x100000
+ELF_HASH_PARALLEL_SZ    = 0x400000  # Segments of this size at least are hashed in parallel
 
 '''
 ELF Object File Types
@@ -289,6 +325,151 @@ class SegmentInfo:
     print >> sys.stdout, 'Flag: ' + str(self.flag)
     print >> sys.stdout, 'Start Address: ' + str(hex(self.start_addr))
 
+'''
+Hashing Writer Class, hash data while writing it to file
+'''
+class HashingWriter(object):
+  def __init__(self, fp, hash_alg = 'sha1'):
+    self.fp = fp
+    self.hash = hashlib.new(hash_alg)
+
+  def __del__(self):
+    pass
+
+  def write(self, data):
+    self.hash.update(data)
+    self.fp.write(data)
+
+  def digest(self):
+    return self.hash.digest()
+
+'''
+Signing Cache Class
+
+Signature and certificate chain are stored on disk, one file per entry,
+keyed by SHA-256 of base name, config of signature tool and hash table
+sent to it. Entry is laid out as magic, length of signature, length of
+certificate chain, then data. Access time of entry is refreshed by mtime
+on hit, and least recently used ones are evicted once cache exceeds size.
+
+Cache has to be cleared by hand once keys of signature tool are changed.
+'''
+class SignCache(object):
+  s_hdr = struct.Struct('<4sII')
+
+  def __init__(self, cachedir, maxsize = SIGN_CACHE_MAXSIZE * 1024 * 1024):
+    self.cachedir = cachedir
+    self.maxsize = maxsize
+    self.hits = 0
+    self.misses = 0
+    self.lock = threading.Lock()
+
+    if os.path.isdir(cachedir) is False:
+      os.makedirs(cachedir)
+
+  def __del__(self):
+    pass
+
+  def get_key(self, namebase, config, buf):
+    m = hashlib.sha256()
+    m.update(namebase + '\0')
+    m.update(hashlib.sha256(config).digest())
+    m.update(buf)
+    return m.hexdigest()
+
+  def get_path(self, key):
+    return os.path.sep.join((self.cachedir, key))
+
+  '''
+  Get (signature, certificate chain) of key, None if missed
+  '''
+  def get(self, key):
+    path = self.get_path(key)
+    entry = None
+
+    try:
+      fp = open(path, 'rb')
+      try:
+        data = fp.read()
+      finally:
+        fp.close()
+
+      if len(data) >= self.s_hdr.size:
+        magic, sig_len, chain_len = self.s_hdr.unpack_from(data)
+        off = self.s_hdr.size
+        if magic == SIGN_CACHE_MAGIC and len(data) == off + sig_len + chain_len:
+          entry = (data[off:off + sig_len], data[off + sig_len:])
+
+      if entry is None:
+        '''
+        Remove corrupted entry
+        '''
+        os.remove(path)
+      else:
+        os.utime(path, None)
+    except (IOError, os.error):
+      entry = None
+
+    with self.lock:
+      if entry is None:
+        self.misses += 1
+      else:
+        self.hits += 1
+
+    return entry
+
+  '''
+  Put signature and certificate chain of key, written to temporary file
+  and renamed, so that concurrent readers never see partial entry
+  '''
+  def put(self, key, signature, certchain):
+    try:
+      fd, tmpname = tempfile.mkstemp(dir = self.cachedir, prefix = '.tmp-')
+      fp = os.fdopen(fd, 'wb')
+      try:
+        fp.write(self.s_hdr.pack(SIGN_CACHE_MAGIC, len(signature), len(certchain)))
+        fp.write(signature)
+        fp.write(certchain)
+      finally:
+        fp.close()
+
+      os.rename(tmpname, self.get_path(key))
+    except (IOError, os.error), err:
+      print >> sys.stderr, str(err).replace('Errno', 'Warning')
+
+  '''
+  Evict least recently used entries until cache fits in maximum size
+  '''
+  def trim(self):
+    entries = []
+    size = 0
+
+    with self.lock:
+      for name in os.listdir(self.cachedir):
+        path = self.get_path(name)
+        try:
+          st = os.stat(path)
+        except os.error:
+          continue
+
+        if S_ISREG(st.st_mode) is False:
+          continue
+
+        entries.append((st.st_mtime, st.st_size, path))
+        size += st.st_size
+
+      entries.sort()
+
+      for mtime, sz, path in entries:
+        if size <= self.maxsize:
+          break
+
+        try:
+          os.remove(path)
+        except os.error:
+          pass
+        size -= sz
+
 '''
 Regular Boot Header Class
 '''
@@ -323,6 +504,19 @@ class Boot_Hdr:
 
   def getLength(self):
     return BOOT_HEADER_LENGTH
+
+  def readPackedData(self, data):
+    unpacked_data = (Boot_Hdr.s_part).unpack(data)
+    self.image_id        = unpacked_data[0]
+    self.flash_parti_ver = unpacked_data[1]
+    self.image_src       = unpacked_data[2]
+    self.image_dest_ptr  = unpacked_data[3]
+    self.image_size      = unpacked_data[4]
+    self.code_size       = unpacked_data[5]
+    self.sig_ptr         = unpacked_data[6]
+    self.sig_size        = unpacked_data[7]
+    self.cert_chain_ptr  = unpacked_data[8]
+    self.cert_chain_size = unpacked_data[9]
  
   def writePackedData(self, target, write_full_hdr):  
     values = [self.image_id,
@@ -363,23 +557,100 @@ class Boot_Hdr:
 
       return s.size
 
+'''
+Copy segment from source to destination file in chunks, hash it as written,
+and pad it to block aligned
+'''
+def copy_elf_seg(src_fp, dst_fp, src_offset, dst_offset, filesz, pad):
+  src_fp.seek(src_offset, os.SEEK_SET)
+  dst_fp.seek(dst_offset, os.SEEK_SET)
+
+  writer = HashingWriter(dst_fp)
+
+  length = filesz
+  while length > 0:
+    buf = src_fp.read(min(ELF_COPY_CHUNK_SZ, length))
+    if len(buf) == 0:
+      raise IOError, 'segment at 0x%x truncated' % src_offset
+    writer.write(buf)
+    length -= len(buf)
+
+  dst_fp.write('\0' * pad)
+
+  return writer.digest()
+
+'''
+Copy segment with its own files, run in thread of pool
+'''
+def copy_elf_seg_worker(args):
+  srcname, dstname, src_offset, dst_offset, filesz, pad = args
+
+  src_fp = open(srcname, 'rb')
+  try:
+    dst_fp = open(dstname, 'r+b')
+    try:
+      return copy_elf_seg(src_fp, dst_fp, src_offset, dst_offset, filesz, pad)
+    finally:
+      dst_fp.close()
+  finally:
+    src_fp.close()
+
 '''
 Class of ELF Builder
 '''
 class ElfBuilder(object):
-  def __init__(self, srcname, dstname, signtool = None, namebase = None):
+  def __init__(self, srcname, dstname, signtool = None, namebase = None, deferred = False, cache = None):
     self.ehdr = Elf32_Ehdr('\0' * ELF_HDR_SIZE)
     self.phdr = Elf32_Phdr('\0' * ELF_PHDR_SIZE)
     self.bhdr = Boot_Hdr(int('0x0', 16))
     self.src_fp = -1
     self.src_sz = os.stat(srcname).st_size
+    self.srcname = srcname
     self.dst_fp = -1
     self.signtool = signtool
     self.namebase = namebase
+    self.dstname = dstname
+
+    '''
+    Scratch directory for signature tool, signtool directory if None
+    '''
+    self.scratch = None
+
+    '''
+    Signing cache to skip signature tool for unchanged hash table, disabled if None
+    '''
+    self.cache = cache
+
+    '''
+    Signature and certificate chain read from output of signature tool
+    '''
+    self.signature = ''
+    self.certchain = ''
 
-    self.initialize(srcname, dstname)
+    '''
+    Headers and hash table are kept in memory once written,
+    so that nothing is read back from dst_fp for hashing
+    '''
+    self.hdr_writer = None
+    self.phdr_tbl = []
+    self.hash_tbl = []
+
+    '''
+    Program headers of segments in source file, and their hashes generated as written
+    '''
+    self.entry = 0
+    self.src_phdr_tbl = []
+    self.seg_hashes = []
+
+    self.initialize(srcname, dstname, deferred)
+
+  '''
+  Build ELF file, and sign it unless 'deferred' is True
 
-  def initialize(self, srcname, dstname):
+  If deferred, only hash segments are written and files are closed, so that
+  builder can be passed between processes, then sign() and assemble() later.
+  '''
+  def initialize(self, srcname, dstname, deferred = False):
     try:
       self.src_fp = open(srcname, 'rb')
       self.dst_fp = open(dstname, 'wb+')
@@ -389,13 +660,29 @@ class ElfBuilder(object):
 
     try:
       self.build()
-      self.flush()
+      if deferred is True:
+        self.prepare()
+      else:
+        self.flush()
     except OSError, err:
-      self.src_fp.close()
-      self.dst_fp.close()
+      self.close()
       os.remove(dstname)
       raise os.error, err
 
+  '''
+  Close files
+  '''
+  def close(self):
+    if self.src_fp != -1:
+      self.src_fp.close()
+      self.src_fp = -1
+
+    if self.dst_fp != -1:
+      self.dst_fp.close()
+      self.dst_fp = -1
+
+    self.hdr_writer = None
+
   def __del__(self):
     if self.src_fp != -1:
       self.src_fp.close()
@@ -417,16 +704,29 @@ class ElfBuilder(object):
     return m.digest()
 
   '''
-  Unzip .zip file
+  Read signature and certificate chain from .zip file in memory
+  Members are looked up by name, missing certificate is skipped
   '''
-  def unzip(self, zipname, dirname):
+  def read_signtool_zip(self, zipname):
+    prefix = 'QDST_Qualcomm_' + self.namebase
+
     z = ZipFile(zipname, 'r')
-    names = z.namelist()
-    for name in names:
-      outfile = file(os.path.sep.join((dirname, name)), 'wb+')
-      outfile.write(z.read(name))
-      outfile.close()
-    z.close()
+    try:
+      names = set(z.namelist())
+
+      if (prefix + '-signature.bin') not in names:
+        raise os.error, zipname + ": no signature found!"
+
+      signature = z.read(prefix + '-signature.bin')
+
+      certs = []
+      for suffix in ('-attestation_cert.cer', '-attestation_ca_cert.cer', '-root_cert.cer'):
+        if (prefix + suffix) in names:
+          certs.append(z.read(prefix + suffix))
+    finally:
+      z.close()
+
+    return (signature, ''.join(certs))
 
   '''
   Write ELF header
@@ -473,9 +773,13 @@ class ElfBuilder(object):
 
     packed_values = Elf32_Ehdr.s.pack(*values)
 
+    '''
+    ELF header and program header table are hashed as they are written
+    '''
     offset = 0
     self.dst_fp.seek(offset, os.SEEK_SET)
-    self.dst_fp.write(packed_values)
+    self.hdr_writer = HashingWriter(self.dst_fp)
+    self.hdr_writer.write(packed_values)
 
     return 0
 
@@ -509,14 +813,9 @@ class ElfBuilder(object):
     hash_tbl_size += MI_PROG_BOOT_DIGEST_SIZE
 
     '''
-    Add hash segment for code segment
-    '''
-    hash_tbl_size += MI_PROG_BOOT_DIGEST_SIZE
-
-    '''
-    Add other hash segment
-    Add code here
+    Add hash segment for each code segment
     '''
+    hash_tbl_size += MI_PROG_BOOT_DIGEST_SIZE * len(self.src_phdr_tbl)
 
     '''
     Add signature & certificate
@@ -543,10 +842,7 @@ class ElfBuilder(object):
 
     '''
     Write ELF code segment header
-    Add code here
     '''
-    type = NULL_TYPE
-
     '''
     Check if segment size is block aligned
     '''
@@ -554,32 +850,29 @@ class ElfBuilder(object):
     'if (hash_tbl_size > ELF_BLOCK_ALIGN)' disused due to customized definition
     '''
     size = self.ehdr.e_phoff + (self.ehdr.e_phnum * self.ehdr.e_phentsize) + hash_tbl_size
-    if (size > ELF_BLOCK_ALIGN):
-      off = size & (ELF_BLOCK_ALIGN - 1)
-      if (int(off) != 0):
-        pad = ELF_BLOCK_ALIGN - off
-    else:
-      pad = ELF_BLOCK_ALIGN - size
 
     '''
     'offset = ELF_BLOCK_ALIGN + hash_tbl_size + pad'
     disused due to customized definition
     '''
-    offset = size + pad
+    offset = size + get_elf_block_pad(size)
 
-    vaddr  = 0
-    paddr  = vaddr
-    filesz = self.src_sz
-    memsz  = 0
-    flags  = MI_PBT_ELF_PHDR_SEGMENT
-    ret = self.write_codeseg_phdr(type, offset, vaddr, paddr, filesz, memsz, flags)
-    if ret != 0:
-      return -1
+    for src_phdr in self.src_phdr_tbl:
+      '''
+      Keep alignment of segment if it is larger than block
+      '''
+      align = src_phdr.p_align
+      if align > ELF_BLOCK_ALIGN and (align & (align - 1)) == 0:
+        offset = (offset + align - 1) & ~(align - 1)
+      else:
+        align = ELF_BLOCK_ALIGN
 
-    '''
-    Write ELF other header
-    Add code here
-    '''
+      ret = self.write_codeseg_phdr(src_phdr.p_type, offset, src_phdr.p_vaddr, src_phdr.p_paddr, \
+          src_phdr.p_filesz, src_phdr.p_memsz, src_phdr.p_flags, align)
+      if ret != 0:
+        return -1
+
+      offset += src_phdr.p_filesz + get_elf_seg_pad(src_phdr)
 
     return 0
 
@@ -607,10 +900,11 @@ class ElfBuilder(object):
               ]
 
     packed_values = Elf32_Phdr.s.pack(*values)
+    self.phdr_tbl.append(Elf32_Phdr(packed_values))
 
     offset = self.ehdr.e_ehsize
     self.dst_fp.seek(offset, os.SEEK_SET)
-    self.dst_fp.write(packed_values)
+    self.hdr_writer.write(packed_values)
 
     return 0
 
@@ -638,17 +932,18 @@ class ElfBuilder(object):
               ]
 
     packed_values = Elf32_Phdr.s.pack(*values)
+    self.phdr_tbl.append(Elf32_Phdr(packed_values))
 
     offset = self.ehdr.e_phoff + self.ehdr.e_phentsize
     self.dst_fp.seek(offset, os.SEEK_SET)
-    self.dst_fp.write(packed_values)
+    self.hdr_writer.write(packed_values)
 
     return 0
 
   '''
   Write ELF code segment header
   '''
-  def write_codeseg_phdr(self, type, offset, vaddr, paddr, filesz, memsz, flags):
+  def write_codeseg_phdr(self, type, offset, vaddr, paddr, filesz, memsz, flags, align = ELF_BLOCK_ALIGN):
     self.phdr.p_type   = type
     self.phdr.p_offset = offset
     self.phdr.p_vaddr  = vaddr
@@ -656,7 +951,7 @@ class ElfBuilder(object):
     self.phdr.p_filesz = filesz
     self.phdr.p_memsz  = memsz
     self.phdr.p_flags  = flags
-    self.phdr.p_align  = ELF_BLOCK_ALIGN
+    self.phdr.p_align  = align
 
     values = [self.phdr.p_type,
               self.phdr.p_offset,
@@ -670,16 +965,18 @@ class ElfBuilder(object):
 
     packed_values = Elf32_Phdr.s.pack(*values)
 
-    offset = self.ehdr.e_phoff + (self.ehdr.e_phentsize * 2)
+    offset = self.ehdr.e_phoff + (self.ehdr.e_phentsize * len(self.phdr_tbl))
+    self.phdr_tbl.append(Elf32_Phdr(packed_values))
+
     self.dst_fp.seek(offset, os.SEEK_SET)
-    self.dst_fp.write(packed_values)
+    self.hdr_writer.write(packed_values)
 
     return 0
 
   '''
-  Write Hash table
+  Write boot header and hash segments of hash table
   '''
-  def write_hash_tbl(self):
+  def write_hash_segs(self):
     '''
     Write boot header
     '''
@@ -702,16 +999,24 @@ class ElfBuilder(object):
       return -1
 
     '''
-    Write hash segment for code segment
+    Write hash segment for each code segment
     '''
     ret = self.write_codeseg_hashseg()
     if ret != 0:
       return -1
 
+    return 0
+
+  '''
+  Write Hash table
+  '''
+  def write_hash_tbl(self):
     '''
-    Write other hash segment
-    Add code here
+    Write boot header and hash segments
     '''
+    ret = self.write_hash_segs()
+    if ret != 0:
+      return -1
 
     '''
     Write signature & certificate
@@ -720,27 +1025,25 @@ class ElfBuilder(object):
     if ret != 0:
       return -1
 
+    return self.write_hash_tbl_pad()
+
+  '''
+  Write padding of hash table
+  '''
+  def write_hash_tbl_pad(self):
     '''
     Check if segment size is block aligned
     '''
     '''
-    Read ELF header
-    '''
-    offset = 0
-    self.dst_fp.seek(offset, os.SEEK_SET)
-    ehdr = Elf32_Ehdr(self.dst_fp.read(ELF_HDR_SIZE))
-
-    '''
-    Read ELF hash table header
+    ELF hash table header in memory
     '''
-    offset = ehdr.e_phoff + ehdr.e_phentsize
-    self.dst_fp.seek(offset, os.SEEK_SET)
-    hashtbl_phdr = Elf32_Phdr(self.dst_fp.read(ehdr.e_phentsize))
+    hashtbl_phdr = self.phdr_tbl[1]
 
     '''
     'if (hashtbl_phdr.p_filesz > ELF_BLOCK_ALIGN)'
     disused due to customized definition
     '''
+    pad = 0
     size = self.ehdr.e_phoff + (self.ehdr.e_phnum * self.ehdr.e_phentsize) + hashtbl_phdr.p_filesz
     if (size > ELF_BLOCK_ALIGN):
       off = size & (ELF_BLOCK_ALIGN - 1)
@@ -789,6 +1092,7 @@ class ElfBuilder(object):
               ]
 
     packed_values = Boot_Hdr.s_part.pack(*values)
+    self.hash_tbl = [packed_values]
 
     '''
     'offset = ELF_BLOCK_ALIGN' disused due to customized definition
@@ -805,23 +1109,9 @@ class ElfBuilder(object):
   '''
   def write_progheader_hashseg(self):
     '''
-    Read ELF header
-    '''
-    offset = 0
-    self.dst_fp.seek(offset, os.SEEK_SET)
-    ehdr_buf = self.dst_fp.read(ELF_HDR_SIZE)
-
-    '''
-    Read ELF program header table
-    '''
-    offset = self.ehdr.e_phoff
-    self.dst_fp.seek(offset, os.SEEK_SET)
-    phdr_tbl_buf = self.dst_fp.read(self.ehdr.e_phnum * self.ehdr.e_phentsize)
-
-    '''
-    Generate hash
+    Hash of ELF header and program header table, generated as written
     '''
-    hash = self.gen_sha1_hash(ehdr_buf + phdr_tbl_buf)
+    hash = self.hdr_writer.digest()
 
     '''
     Write hash to file as hash segment
@@ -831,14 +1121,21 @@ class ElfBuilder(object):
     '''
     offset = self.ehdr.e_phoff + (self.ehdr.e_phnum * self.ehdr.e_phentsize) + MI_BOOT_IMG_HDR_SIZE
 
-    self.dst_fp.seek(offset, os.SEEK_SET)
-    self.dst_fp.write(hash)
+    return self.write_hashseg(offset, hash)
 
-    if len(hash) < MI_PROG_BOOT_DIGEST_SIZE:
-      self.dst_fp.write('\0' * (MI_PROG_BOOT_DIGEST_SIZE - len(hash)))
-    elif len(hash) > MI_PROG_BOOT_DIGEST_SIZE:
+  '''
+  Write hash segment at offset, padded to digest size, and keep it in memory
+  '''
+  def write_hashseg(self, offset, hash):
+    if len(hash) > MI_PROG_BOOT_DIGEST_SIZE:
       return -1
 
+    hash += '\0' * (MI_PROG_BOOT_DIGEST_SIZE - len(hash))
+
+    self.dst_fp.seek(offset, os.SEEK_SET)
+    self.dst_fp.write(hash)
+    self.hash_tbl.append(hash)
+
     return 0
 
   '''
@@ -858,52 +1155,26 @@ class ElfBuilder(object):
     '''
     offset = self.ehdr.e_phoff + (self.ehdr.e_phnum * self.ehdr.e_phentsize) + MI_BOOT_IMG_HDR_SIZE + MI_PROG_BOOT_DIGEST_SIZE
 
-    self.dst_fp.seek(offset, os.SEEK_SET)
-    self.dst_fp.write(hash)
-
-    return 0
+    return self.write_hashseg(offset, hash)
 
   '''
-  Write hash segment for code segment
+  Write hash segment for each code segment
   '''
   def write_codeseg_hashseg(self):
-    '''
-    Read ELF header
-    '''
-    offset = 0
-    self.dst_fp.seek(offset, os.SEEK_SET)
-    ehdr = Elf32_Ehdr(self.dst_fp.read(ELF_HDR_SIZE))
-
-    '''
-    Read ELF code segment header
-    '''
-    offset = ehdr.e_phoff + (ehdr.e_phentsize * 2)
-    self.dst_fp.seek(offset, os.SEEK_SET)
-    codeseg_phdr = Elf32_Phdr(self.dst_fp.read(ehdr.e_phentsize))
-
-    '''
-    Generate hash
-    '''
-    offset = codeseg_phdr.p_offset
-    self.dst_fp.seek(offset, os.SEEK_SET)
-    buf = self.dst_fp.read(codeseg_phdr.p_filesz)
-    hash = self.gen_sha1_hash(buf)
-
-    '''
-    Write hash to file as hash segment
-    '''
     '''
     'offset = ELF_BLOCK_ALIGN + MI_BOOT_IMG_HDR_SIZE + (MI_PROG_BOOT_DIGEST_SIZE * 2)' disused due to customized definition
     '''
     offset = self.ehdr.e_phoff + (self.ehdr.e_phnum * self.ehdr.e_phentsize) + MI_BOOT_IMG_HDR_SIZE + (MI_PROG_BOOT_DIGEST_SIZE * 2)
 
-    self.dst_fp.seek(offset, os.SEEK_SET)
-    self.dst_fp.write(hash)
+    '''
+    Hash of code segment, generated as written
+    '''
+    for hash in self.seg_hashes:
+      ret = self.write_hashseg(offset, hash)
+      if ret != 0:
+        return -1
 
-    if len(hash) < MI_PROG_BOOT_DIGEST_SIZE:
-      self.dst_fp.write('\0' * (MI_PROG_BOOT_DIGEST_SIZE - len(hash)))
-    elif len(hash) > MI_PROG_BOOT_DIGEST_SIZE:
-      return -1
+      offset += MI_PROG_BOOT_DIGEST_SIZE
 
     return 0
 
@@ -911,37 +1182,51 @@ class ElfBuilder(object):
   Write signature & certificate
   '''
   def write_hash_certchain(self):
-    '''
-    Read ELF header
-    '''
-    offset = 0
-    self.dst_fp.seek(offset, os.SEEK_SET)
-    ehdr = Elf32_Ehdr(self.dst_fp.read(ELF_HDR_SIZE))
+    ret = self.run_signtool()
+    if ret != 0:
+      return -1
+
+    return self.write_certchain()
 
+  '''
+  Get directory where signature tool works, scratch directory if any
+  '''
+  def get_signtool_workdir(self):
+    if self.scratch is not None:
+      return self.scratch
+
+    return self.signtool
+
+  '''
+  Run signature tool on hash table
+  '''
+  def run_signtool(self):
     '''
-    Read ELF hash table header
+    ELF hash table header in memory
     '''
-    offset = ehdr.e_phoff + ehdr.e_phentsize
-    self.dst_fp.seek(offset, os.SEEK_SET)
-    hashtbl_phdr = Elf32_Phdr(self.dst_fp.read(ehdr.e_phentsize))
+    hashtbl_phdr = self.phdr_tbl[1]
 
     '''
-    Read data of boot header
-                 + hash segment for program header
-                 + hash segment for the hash table itself
-                 + hash segment for code segment
-                 + other hash segments
-    for signature and certificate
+    Data of boot header
+            + hash segment for program header
+            + hash segment for the hash table itself
+            + hash segment for code segment
+            + other hash segments
+    for signature and certificate, kept in memory as written
     '''
+    length = hashtbl_phdr.p_filesz - SHA256_SIGNATURE_SIZE - CERT_CHAIN_MAXSIZE
+    buf = ''.join(self.hash_tbl)[:length]
+
     '''
-    'offset = ELF_BLOCK_ALIGN' disused due to customized definition
+    Look up signing cache before running signature tool
     '''
-    offset = self.ehdr.e_phoff + (self.ehdr.e_phnum * self.ehdr.e_phentsize)
-
-    self.dst_fp.seek(offset, os.SEEK_SET)
-
-    length = hashtbl_phdr.p_filesz - SHA256_SIGNATURE_SIZE - CERT_CHAIN_MAXSIZE
-    buf = self.dst_fp.read(length)
+    key = None
+    if self.cache is not None:
+      key = self.cache.get_key(self.namebase, self.get_signtool_config(), buf)
+      entry = self.cache.get(key)
+      if entry is not None:
+        self.signature, self.certchain = entry
+        return 0
 
     '''
     Create a temporary file and write data to it
@@ -950,9 +1235,11 @@ class ElfBuilder(object):
     ftemp = tempfile.NamedTemporaryFile()
     ftemp.write(buf)
     '''
+    workdir = self.get_signtool_workdir()
+
     ftemp_name = self.namebase + '.bin'
     try:
-      ftemp = open(os.path.sep.join((self.signtool, ftemp_name)), 'wb+')
+      ftemp = open(os.path.sep.join((workdir, ftemp_name)), 'wb+')
     except IOError, err:
       print >> sys.stderr, str(err)
       return -1
@@ -971,8 +1258,24 @@ class ElfBuilder(object):
     sign_tool = os.path.sep.join((self.signtool, 'QDST.py'))
     hashseg_file = 'image=' + ftemp_name
     config_file = 'xml=' + 'QDST_' + self.namebase + '.xml'
+
+    '''
+    Signature tool runs in work directory, and writes cert/ there:
+    signtool directory, or scratch directory, so that runs of concurrent
+    jobs do not overwrite each other
+    '''
+    sign_tool = os.path.abspath(sign_tool)
+    hashseg_file = 'image=' + os.path.abspath(os.path.sep.join((workdir, ftemp_name)))
+
+    if self.scratch is not None:
+      try:
+        self.link_signtool_entries(workdir, ('cert', ftemp_name))
+      except os.error, err:
+        print >> sys.stderr, str(err)
+        return -1
+
     cmd = ['python', sign_tool, hashseg_file, config_file]
-    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, cwd=workdir)
     out = proc.communicate()[0]
 
     '''
@@ -992,110 +1295,86 @@ class ElfBuilder(object):
     '''
     try:
       zipname = 'cert/' + 'QDST_Qualcomm_' + self.namebase + '.zip'
-      dirname = 'cert'
-      self.unzip(os.path.sep.join((self.signtool, zipname)), os.path.sep.join((self.signtool, dirname)))
-    except err:
+      self.signature, self.certchain = self.read_signtool_zip(os.path.sep.join((workdir, zipname)))
+    except (IOError, os.error, BadZipfile), err:
       print >> sys.stderr, str(err)
       return -1
 
-    '''
-    'offset = ELF_BLOCK_ALIGN + hashtbl_phdr.p_filesz - SHA256_SIGNATURE_SIZE - CERT_CHAIN_MAXSIZE'
-    disused due to customized definition
-    '''
-    offset = self.ehdr.e_phoff + (self.ehdr.e_phnum * self.ehdr.e_phentsize) + \
-        hashtbl_phdr.p_filesz - SHA256_SIGNATURE_SIZE - CERT_CHAIN_MAXSIZE
-
-    self.dst_fp.seek(offset, os.SEEK_SET)
-
-    for root, dirs, files in os.walk(os.path.sep.join((self.signtool, dirname))):
-      for name in files:
-        if name == 'QDST_Qualcomm_' + self.namebase + '-signature.bin':
-          try:
-            fp_read = open(os.path.sep.join((self.signtool, dirname, name)), 'rb')
-          except IOError, err:
-            print >> sys.stderr, str(err)
-            return -1
-
-          length = os.stat(os.path.sep.join((self.signtool, dirname, name))).st_size
-
-          buf = fp_read.read(length)
-          self.dst_fp.write(str(buf))
-          fp_read.close()
-
-          '''
-          Check if signature is size aligned
-          '''
-          if length > SHA256_SIGNATURE_SIZE:
-            off = length & (SHA256_SIGNATURE_SIZE - 1)
-            if (int(off) != 0):
-              pad = SHA256_SIGNATURE_SIZE - off
-          else:
-            pad = SHA256_SIGNATURE_SIZE - length
-
-          self.dst_fp.seek(offset + length, os.SEEK_SET)
-          self.dst_fp.write('\0' * pad)
+    if key is not None:
+      self.cache.put(key, self.signature, self.certchain)
 
-          break
-
-      len_certchain = 0
-
-      for name in files:
-        if name == 'QDST_Qualcomm_' + self.namebase + '-attestation_cert.cer':
-          try:
-            fp_read = open(os.path.sep.join((self.signtool, dirname, name)), 'rb')
-          except IOError, err:
-            print >> sys.stderr, str(err)
-            return -1
+    return 0
 
-          length = os.stat(os.path.sep.join((self.signtool, dirname, name))).st_size
+  '''
+  Read config of signature tool, empty if not found
+  '''
+  def get_signtool_config(self):
+    config = os.path.sep.join((self.signtool, 'QDST_' + self.namebase + '.xml'))
 
-          buf = fp_read.read(length)
-          self.dst_fp.write(str(buf))
-          fp_read.close()
+    try:
+      fp = open(config, 'rb')
+    except IOError:
+      return ''
 
-          len_certchain += length
+    try:
+      return fp.read()
+    finally:
+      fp.close()
 
-          break
+  '''
+  Link entries of signtool directory into scratch directory, except ones
+  written per job, so that config, keys and anything else opened by relative
+  path from signature tool are found as if it runs in signtool directory
+  '''
+  def link_signtool_entries(self, workdir, excludes):
+    signtool = os.path.abspath(self.signtool)
 
-      for name in files:
-        if name == 'QDST_Qualcomm_' + self.namebase + '-attestation_ca_cert.cer':
-          try:
-            fp_read = open(os.path.sep.join((self.signtool, dirname, name)), 'rb')
-          except IOError, err:
-            print >> sys.stderr, str(err)
-            return -1
+    for name in os.listdir(signtool):
+      if name in excludes:
+        continue
 
-          length = os.stat(os.path.sep.join((self.signtool, dirname, name))).st_size
+      link = os.path.sep.join((workdir, name))
+      if os.path.lexists(link) is False:
+        os.symlink(os.path.sep.join((signtool, name)), link)
 
-          buf = fp_read.read(length)
-          self.dst_fp.write(str(buf))
-          fp_read.close()
+  '''
+  Write signature and certificate chain generated by signature tool
+  '''
+  def write_certchain(self):
+    '''
+    ELF hash table header in memory
+    '''
+    hashtbl_phdr = self.phdr_tbl[1]
 
-          len_certchain += length
-          break
-
-      for name in files:
-        if name == 'QDST_Qualcomm_' + self.namebase + '-root_cert.cer':
-          try:
-            fp_read = open(os.path.sep.join((self.signtool, dirname, name)), 'rb')
-          except IOError, err:
-            print >> sys.stderr, str(err)
-            return -1
-
-          length = os.stat(os.path.sep.join((self.signtool, dirname, name))).st_size
+    '''
+    'offset = ELF_BLOCK_ALIGN + hashtbl_phdr.p_filesz - SHA256_SIGNATURE_SIZE - CERT_CHAIN_MAXSIZE'
+    disused due to customized definition
+    '''
+    offset = self.ehdr.e_phoff + (self.ehdr.e_phnum * self.ehdr.e_phentsize) + \
+        hashtbl_phdr.p_filesz - SHA256_SIGNATURE_SIZE - CERT_CHAIN_MAXSIZE
 
-          buf = fp_read.read(length)
-          self.dst_fp.write(str(buf))
-          fp_read.close()
+    '''
+    Check if signature is size aligned
+    '''
+    length = len(self.signature)
+    pad = 0
 
-          len_certchain += length
-          break
+    if length > SHA256_SIGNATURE_SIZE:
+      off = length & (SHA256_SIGNATURE_SIZE - 1)
+      if (int(off) != 0):
+        pad = SHA256_SIGNATURE_SIZE - off
+    else:
+      pad = SHA256_SIGNATURE_SIZE - length
 
-      break
+    buf = [self.signature, '\0' * pad]
 
     '''
+    Certificate chain is in order of attestation, attestation CA and root
     Check if certificate chain is size aligned
     '''
+    len_certchain = len(self.certchain)
+    pad = 0
+
     if len_certchain > CERT_CHAIN_MAXSIZE:
       off = len_certchain & (CERT_CHAIN_MAXSIZE - 1)
       if (int(off) != 0):
@@ -1103,17 +1382,15 @@ class ElfBuilder(object):
     else:
       pad = CERT_CHAIN_MAXSIZE - len_certchain
 
-    self.dst_fp.seek(offset + SHA256_SIGNATURE_SIZE + len_certchain, os.SEEK_SET)
-    self.dst_fp.write(chr(0xFF) * pad)
+    buf.append(self.certchain)
+    buf.append(chr(0xFF) * pad)
+
+    self.dst_fp.seek(offset, os.SEEK_SET)
+    self.dst_fp.write(''.join(buf))
 
     '''
     Clean up the following files:
 
-    *_attest.key
-    *-signature.bin
-    *-attestation_cert.cer
-    *-attestation_ca_cert.cer
-    *-root_cert.cer
     temporary file
     '''
     '''
@@ -1123,49 +1400,93 @@ class ElfBuilder(object):
     return 0
 
   '''
-  Write code segment
+  Read program headers of segments in source file
+
+  Every PT_LOAD segment of ELF executable is taken, otherwise the whole file
+  is taken as one code segment, e.g. kernel module without program header.
   '''
-  def write_code_seg(self):
-    pad = 0
+  def read_src_phdr_tbl(self):
+    self.entry = 0
+    self.src_phdr_tbl = []
 
-    '''
-    Read ELF header
-    '''
-    offset = 0
-    self.dst_fp.seek(offset, os.SEEK_SET)
-    ehdr = Elf32_Ehdr(self.dst_fp.read(ELF_HDR_SIZE))
+    try:
+      self.src_fp.seek(0, os.SEEK_SET)
+      data = self.src_fp.read(ELF_HDR_SIZE)
 
-    '''
-    Read ELF code segment header
-    '''
-    offset = ehdr.e_phoff + (ehdr.e_phentsize * 2)
-    self.dst_fp.seek(offset, os.SEEK_SET)
-    codeseg_phdr = Elf32_Phdr(self.dst_fp.read(ehdr.e_phentsize))
+      if len(data) == ELF_HDR_SIZE \
+          and data[:4] == ELFINFO_MAG0 + ELFINFO_MAG1 + ELFINFO_MAG2 + ELFINFO_MAG3 \
+          and data[ELFINFO_CLASS_INDEX] == ELFINFO_CLASS_32 \
+          and data[ELFINFO_CLASS_INDEX + 1] == '\x01':
+        ehdr = Elf32_Ehdr(data)
 
-    '''
-    Write code to file as code segment
-    '''
-    offset = codeseg_phdr.p_offset
-    self.dst_fp.seek(offset, os.SEEK_SET)
+        if ehdr.e_phnum != 0 and ehdr.e_phentsize == ELF_PHDR_SIZE \
+            and ehdr.e_phoff + (ehdr.e_phnum * ehdr.e_phentsize) <= self.src_sz:
+          self.src_fp.seek(ehdr.e_phoff, os.SEEK_SET)
 
-    try:
-      buf = self.src_fp.read(self.src_sz)
-      self.dst_fp.write(str(buf))
+          for i in range(ehdr.e_phnum):
+            phdr = Elf32_Phdr(self.src_fp.read(ELF_PHDR_SIZE))
+            if phdr.p_type != PT_LOAD:
+              continue
+
+            if phdr.p_offset + phdr.p_filesz > self.src_sz:
+              print >> sys.stderr, 'segment %d out of file' % i
+              return -1
+
+            self.src_phdr_tbl.append(phdr)
+
+          self.entry = ehdr.e_entry
     except IOError, err:
       print >> sys.stderr, str(err)
       return -1
 
+    if len(self.src_phdr_tbl) == 0:
+      self.entry = 0
+      self.src_phdr_tbl.append(Elf32_Phdr(Elf32_Phdr.s.pack(NULL_TYPE, 0, 0, 0, self.src_sz, 0, \
+          MI_PBT_ELF_PHDR_SEGMENT, ELF_BLOCK_ALIGN)))
+
     '''
-    Check if segment size is block aligned
+    Program header and hash table take two program headers
     '''
-    if codeseg_phdr.p_filesz > ELF_BLOCK_ALIGN:
-      off = codeseg_phdr.p_filesz & (ELF_BLOCK_ALIGN - 1)
-      if (int(off) != 0):
-        pad = ELF_BLOCK_ALIGN - off
-    else:
-      pad = ELF_BLOCK_ALIGN - codeseg_phdr.p_filesz
+    if len(self.src_phdr_tbl) + 2 > MAX_PHDR_COUNT:
+      print >> sys.stderr, 'too many segments %d' % len(self.src_phdr_tbl)
+      return -1
 
-    self.dst_fp.write('\0' * pad)
+    return 0
+
+  '''
+  Write code segments
+
+  Large segments are copied and hashed in parallel, each with its own files,
+  and the others are copied and hashed in turn.
+  '''
+  def write_code_seg(self):
+    segs = zip(self.src_phdr_tbl, self.phdr_tbl[2:])
+    self.seg_hashes = [None] * len(segs)
+
+    large = [i for i, (src_phdr, dst_phdr) in enumerate(segs) if src_phdr.p_filesz >= ELF_HASH_PARALLEL_SZ]
+
+    try:
+      if len(large) > 1:
+        args = [(self.srcname, self.dstname, segs[i][0].p_offset, segs[i][1].p_offset, segs[i][0].p_filesz, \
+            get_elf_seg_pad(segs[i][1])) for i in large]
+
+        pool = multiprocessing.pool.ThreadPool(min(len(large), multiprocessing.cpu_count()))
+        try:
+          hashes = pool.map(copy_elf_seg_worker, args)
+        finally:
+          pool.close()
+          pool.join()
+
+        for i, hash in zip(large, hashes):
+          self.seg_hashes[i] = hash
+
+      for i, (src_phdr, dst_phdr) in enumerate(segs):
+        if self.seg_hashes[i] is None:
+          self.seg_hashes[i] = copy_elf_seg(self.src_fp, self.dst_fp, src_phdr.p_offset, dst_phdr.p_offset, \
+              src_phdr.p_filesz, get_elf_seg_pad(dst_phdr))
+    except IOError, err:
+      print >> sys.stderr, str(err)
+      return -1
 
     return 0
 
@@ -1177,11 +1498,14 @@ class ElfBuilder(object):
     Write ELF header
     '''
     '''
-    Add code here
-    entry
+    Read segments of source file, program header and hash table ahead of them
     '''
-    entry = 0
-    phnum = 3
+    ret = self.read_src_phdr_tbl()
+    if ret != 0:
+      raise os.error, "failed to read program header table!"
+
+    entry = self.entry
+    phnum = 2 + len(self.src_phdr_tbl)
 
     ret = self.write_exec_ehdr(entry, phnum)
     if ret != 0:
@@ -1200,17 +1524,12 @@ class ElfBuilder(object):
     '''
 
     '''
-    Write code segment
+    Write code segments
     '''
     ret = self.write_code_seg()
     if ret != 0:
       raise os.error, "failed to write code segment!"
 
-    '''
-    Write other segments
-    Add code here
-    '''
-
   '''
   Flush content of file to disk
   '''
@@ -1223,19 +1542,361 @@ class ElfBuilder(object):
     if ret != 0:
       raise os.error, "failed to write hash table!"
 
+  '''
+  Write hash segments and close files, for deferred signing
+  '''
+  def prepare(self):
+    ret = self.write_hash_segs()
+    if ret != 0:
+      raise os.error, "failed to write hash table!"
+
+    self.close()
+
+  '''
+  Run signature tool in scratch directory, for deferred signing
+  '''
+  def sign(self, scratch):
+    self.scratch = scratch
+
+    ret = self.run_signtool()
+    if ret != 0:
+      raise os.error, "failed to run signature tool!"
+
+  '''
+  Write signature, certificate chain and padding of hash table, for deferred signing
+  '''
+  def assemble(self):
+    try:
+      self.dst_fp = open(self.dstname, 'r+b')
+    except IOError, err:
+      raise os.error, err
+
+    try:
+      ret = self.write_certchain()
+      if ret == 0:
+        ret = self.write_hash_tbl_pad()
+    finally:
+      self.close()
+
+    if ret != 0:
+      raise os.error, "failed to write signature and certificate chain!"
+
+'''
+Get padding of size to block alignment, as written by ELF builder
+'''
+def get_elf_block_pad(size):
+  pad = 0
+
+  if size > ELF_BLOCK_ALIGN:
+    off = size & (ELF_BLOCK_ALIGN - 1)
+    if (int(off) != 0):
+      pad = ELF_BLOCK_ALIGN - off
+  else:
+    pad = ELF_BLOCK_ALIGN - size
+
+  return pad
+
+'''
+Get padding of code segment after its data, as laid out by ELF builder
+
+PT_LOAD segment without data in file takes no space, while the whole file
+taken as one code segment is always padded, even if it is empty.
+'''
+def get_elf_seg_pad(phdr):
+  if phdr.p_type == PT_LOAD and phdr.p_filesz == 0:
+    return 0
+
+  return get_elf_block_pad(phdr.p_filesz)
+
+'''
+Class of ELF Verifier
+
+Check Auth-Sec ELF generated by ELF builder, without rebuilding it:
+layout of headers, hash table and segments, digests of hash segments,
+signature, certificate chain and paddings. File is mapped into memory.
+'''
+class ElfVerifier(object):
+  def __init__(self, fname):
+    self.fname = fname
+    self.fp = -1
+    self.mm = None
+    self.ehdr = None
+    self.phdr_tbl = []
+    self.bhdr = Boot_Hdr(int('0x0', 16))
+    self.errors = []
+
+    try:
+      self.fp = open(fname, 'rb')
+      if os.fstat(self.fp.fileno()).st_size != 0:
+        self.mm = mmap.mmap(self.fp.fileno(), 0, access = mmap.ACCESS_READ)
+    except (IOError, mmap.error), err:
+      self.close()
+      raise os.error, err
+
+  def __del__(self):
+    self.close()
+
+  '''
+  Close file and unmap it
+  '''
+  def close(self):
+    if self.mm is not None:
+      self.mm.close()
+      self.mm = None
+
+    if self.fp != -1:
+      self.fp.close()
+      self.fp = -1
+
+  def error(self, msg):
+    self.errors.append(msg)
+
+  '''
+  Get SHA-1 hash of range in file, in chunks without copying whole range
+  '''
+  def gen_sha1_hash(self, offset, length):
+    m = hashlib.sha1()
+
+    while length > 0:
+      size = min(ELF_COPY_CHUNK_SZ, length)
+      m.update(buffer(self.mm, offset, size))
+      offset += size
+      length -= size
+
+    return m.digest()
+
+  '''
+  Check if range in file is filled with byte
+  '''
+  def is_filled(self, offset, length, byte):
+    return self.mm[offset:offset + length] == byte * length
+
+  '''
+  Verify ELF header and program header table
+  '''
+  def verify_hdrs(self):
+    if self.mm is None or len(self.mm) < ELF_HDR_SIZE:
+      self.error('file too small for ELF header')
+      return -1
+
+    self.ehdr = Elf32_Ehdr(self.mm[:ELF_HDR_SIZE])
+
+    if self.ehdr.e_ident[:4] != ELFINFO_MAG0 + ELFINFO_MAG1 + ELFINFO_MAG2 + ELFINFO_MAG3 \
+        or self.ehdr.e_ident[ELFINFO_CLASS_INDEX] != ELFINFO_CLASS_32:
+      self.error('not 32-bit ELF file')
+      return -1
+
+    if self.ehdr.e_phentsize != ELF_PHDR_SIZE or self.ehdr.e_phoff != self.ehdr.e_ehsize:
+      self.error('unexpected program header table at 0x%x' % self.ehdr.e_phoff)
+      return -1
+
+    if self.ehdr.e_phnum < 3 or self.ehdr.e_phnum > MAX_PHDR_COUNT:
+      self.error('invalid number of program headers %d' % self.ehdr.e_phnum)
+      return -1
+
+    hdrs_size = self.ehdr.e_phoff + (self.ehdr.e_phnum * self.ehdr.e_phentsize)
+    if len(self.mm) < hdrs_size:
+      self.error('file too small for program header table')
+      return -1
+
+    for i in range(self.ehdr.e_phnum):
+      offset = self.ehdr.e_phoff + (i * self.ehdr.e_phentsize)
+      phdr = Elf32_Phdr(self.mm[offset:offset + ELF_PHDR_SIZE])
+      if phdr.p_offset + phdr.p_filesz > len(self.mm):
+        self.error('segment %d out of file' % i)
+        return -1
+      self.phdr_tbl.append(phdr)
+
+    '''
+    Program header, then hash table right after program header table
+    '''
+    phdr = self.phdr_tbl[0]
+    if phdr.p_flags != MI_PBT_ELF_PHDR_SEGMENT or phdr.p_offset != 0 or phdr.p_filesz != hdrs_size:
+      self.error('invalid program header segment')
+      return -1
+
+    phdr = self.phdr_tbl[1]
+    if phdr.p_type != LOAD_TYPE or phdr.p_flags != MI_PBT_ELF_HASH_SEGMENT or phdr.p_offset != hdrs_size:
+      self.error('invalid hash table segment')
+      return -1
+
+    return 0
+
+  '''
+  Verify boot header and hash segments of hash table
+  '''
+  def verify_hash_segs(self):
+    hashtbl_phdr = self.phdr_tbl[1]
+    offset = hashtbl_phdr.p_offset
+
+    if hashtbl_phdr.p_filesz < MI_BOOT_IMG_HDR_SIZE:
+      self.error('hash table too small for boot header')
+      return -1
+
+    self.bhdr.readPackedData(self.mm[offset:offset + MI_BOOT_IMG_HDR_SIZE])
+
+    if self.bhdr.code_size != self.ehdr.e_phnum * MI_PROG_BOOT_DIGEST_SIZE \
+        or self.bhdr.sig_size != SHA256_SIGNATURE_SIZE \
+        or self.bhdr.cert_chain_size != CERT_CHAIN_MAXSIZE \
+        or self.bhdr.image_size != self.bhdr.code_size + self.bhdr.sig_size + self.bhdr.cert_chain_size:
+      self.error('invalid boot header')
+      return -1
+
+    if hashtbl_phdr.p_filesz != MI_BOOT_IMG_HDR_SIZE + self.bhdr.image_size:
+      self.error('hash table size mismatched with boot header')
+      return -1
+
+    '''
+    Hash segment of each program header, zeros for the hash table itself
+    '''
+    offset += MI_BOOT_IMG_HDR_SIZE
+
+    for i, phdr in enumerate(self.phdr_tbl):
+      if i == 1:
+        hash = '\0' * MI_PROG_BOOT_DIGEST_SIZE
+      else:
+        hash = self.gen_sha1_hash(phdr.p_offset, phdr.p_filesz)
+
+      if self.mm[offset:offset + MI_PROG_BOOT_DIGEST_SIZE] != hash:
+        self.error('hash segment %d mismatched' % i)
+
+      offset += MI_PROG_BOOT_DIGEST_SIZE
+
+    return 0
+
+  '''
+  Verify signature and certificate chain, and their paddings
+  '''
+  def verify_certchain(self):
+    hashtbl_phdr = self.phdr_tbl[1]
+    offset = hashtbl_phdr.p_offset + MI_BOOT_IMG_HDR_SIZE + self.bhdr.code_size
+
+    if self.is_filled(offset, SHA256_SIGNATURE_SIZE, '\0') is True:
+      self.error('no signature')
+
+    '''
+    Certificates are DER sequences back to back, padded with 0xFF
+    '''
+    offset += SHA256_SIGNATURE_SIZE
+    end = offset + CERT_CHAIN_MAXSIZE
+    num = 0
+
+    while offset < end and self.mm[offset] == '\x30':
+      length = get_der_length(self.mm, offset, end)
+      if length <= 0:
+        self.error('invalid certificate %d in chain' % num)
+        return -1
+
+      offset += length
+      num += 1
+
+    if num == 0:
+      self.error('no certificate chain')
+    elif self.is_filled(offset, end - offset, chr(PAD_BYTE_1)) is False:
+      self.error('invalid padding of certificate chain')
+
+    return 0
+
+  '''
+  Verify paddings between segments and at end of file
+  '''
+  def verify_segs_pad(self):
+    '''
+    Segments in file with their paddings, program header is covered by hash
+    table ahead. Padding follows the rule of ELF builder: hash table is padded
+    by its end offset, and code segment by its own size. Segment which takes
+    no space in file is left out.
+    '''
+    hashtbl_phdr = self.phdr_tbl[1]
+    segs = [(hashtbl_phdr.p_offset, hashtbl_phdr.p_filesz, \
+        get_elf_block_pad(hashtbl_phdr.p_offset + hashtbl_phdr.p_filesz))]
+
+    for phdr in self.phdr_tbl[2:]:
+      pad = get_elf_seg_pad(phdr)
+      if phdr.p_filesz + pad != 0:
+        segs.append((phdr.p_offset, phdr.p_filesz, pad))
+
+    segs.sort()
+
+    offset = hashtbl_phdr.p_offset
+    size = offset
+    for seg_offset, seg_size, seg_pad in segs:
+      if seg_offset < offset:
+        self.error('segment at 0x%x overlapped' % seg_offset)
+        return -1
+
+      if self.is_filled(offset, seg_offset - offset, '\0') is False:
+        self.error('invalid padding at 0x%x' % offset)
+
+      offset = seg_offset + seg_size
+      size = offset + seg_pad
+
+    '''
+    Segments after hash table are block aligned, and last one is padded
+    '''
+    for seg_offset, seg_size, seg_pad in segs[1:]:
+      if seg_offset & (ELF_BLOCK_ALIGN - 1) != 0:
+        self.error('segment at 0x%x misaligned' % seg_offset)
+
+    if len(self.mm) != size:
+      self.error('file size 0x%x, expected 0x%x' % (len(self.mm), size))
+    elif self.is_filled(offset, size - offset, '\0') is False:
+      self.error('invalid padding at 0x%x' % offset)
+
+    return 0
+
+  '''
+  Verify ELF file, and return list of errors found
+  '''
+  def verify(self):
+    try:
+      if self.verify_hdrs() == 0 and self.verify_hash_segs() == 0:
+        self.verify_certchain()
+        self.verify_segs_pad()
+    finally:
+      self.close()
+
+    return self.errors
+
+'''
+Get total length of DER element at offset, -1 if invalid
+'''
+def get_der_length(data, offset, end):
+  if offset + 2 > end:
+    return -1
+
+  length = ord(data[offset + 1])
+  offset += 2
+  hdr_len = 2
+
+  if length & 0x80:
+    num = length & 0x7F
+    if num == 0 or num > 4 or offset + num > end:
+      return -1
+
+    length = 0
+    for c in data[offset:offset + num]:
+      length = (length << 8) | ord(c)
+    hdr_len += num
+
+  if offset - 2 + hdr_len + length > end:
+    return -1
+
+  return hdr_len + length
+
 '''
 Build Auth-Sec ELF
 '''
-def build_auth_sec_elf(directory, signtool = None, namebase = None, inplace = False):
-  ft = filetype_table['ko'][1]
+def build_auth_sec_elf(directory, signtool = None, namebase = None, inplace = False, cache = None):
+  ft = get_filetype_suffixes()
 
   for dir, dirs, files in os.walk(directory):
     for f in files:
       try:
-        if f.rfind(ft) != -1 and f[f.rfind(ft):] == ft:
+        if f.endswith(ft):
           fname = os.path.sep.join((dir, f))
           if S_ISREG(os.stat(fname).st_mode):
-            ElfBuilder(fname, fname + '.sec', signtool, namebase)
+            ElfBuilder(fname, fname + '.sec', signtool, namebase, False, cache)
             '''
             Remove original file if 'inplace' is True
             '''
@@ -1250,6 +1911,238 @@ def build_auth_sec_elf(directory, signtool = None, namebase = None, inplace = Fa
 
   return 0
 
+'''
+Get list of files to build Auth-Sec ELF in directory
+'''
+def get_auth_sec_elf_list(directory, ft = None):
+  if ft is None:
+    ft = get_filetype_suffixes()
+  flist = []
+
+  for dir, dirs, files in os.walk(directory):
+    for f in files:
+      try:
+        if f.endswith(ft):
+          fname = os.path.sep.join((dir, f))
+          if S_ISREG(os.stat(fname).st_mode):
+            flist.append(fname)
+      except os.error, err:
+        print >> sys.stderr, str(err).replace('Errno', 'Warning')
+
+  return flist
+
+'''
+Write hash segments of Auth-Sec ELF, run in process of pool
+'''
+def prepare_auth_sec_elf_worker(args):
+  fname, signtool, namebase = args
+  start = time.time()
+
+  try:
+    builder = ElfBuilder(fname, fname + '.sec', signtool, namebase, True)
+  except os.error, err:
+    return (fname, None, time.time() - start, str(err))
+
+  return (fname, builder, time.time() - start, None)
+
+'''
+Sign Auth-Sec ELF in scratch directory, run in thread of signer pool
+Result is always put into queue, even if signing fails
+'''
+def sign_auth_sec_elf_worker(fname, builder, queue):
+  start = time.time()
+  scratch = None
+  error = None
+
+  try:
+    scratch = tempfile.mkdtemp(prefix = 'elfimg-')
+    builder.sign(scratch)
+  except Exception, err:
+    error = str(err)
+
+  queue.put((fname, builder, scratch, time.time() - start, error))
+
+'''
+Assemble signed Auth-Sec ELF, and clean up scratch directory
+'''
+def assemble_auth_sec_elf(item, inplace, stage_time):
+  fname, builder, scratch, sign_time, error = item
+  stage_time['sign'] += sign_time
+  start = time.time()
+
+  try:
+    if error is not None:
+      raise os.error, error
+
+    builder.assemble()
+
+    '''
+    Remove original file if 'inplace' is True
+    '''
+    if inplace is True:
+      os.remove(fname)
+      os.rename(fname + '.sec', fname)
+  except os.error, err:
+    print >> sys.stderr, fname + ': ' + str(err).replace('Errno', 'Warning')
+    if os.access(fname + '.sec', os.F_OK) is True:
+      os.remove(fname + '.sec')
+    return False
+  finally:
+    if scratch is not None:
+      shutil.rmtree(scratch, True)
+    stage_time['assemble'] += time.time() - start
+
+  return True
+
+'''
+Build Auth-Sec ELF in pipeline
+
+Hash segments are written in process pool, signature tool runs in thread
+pool with bounded concurrency, and each ELF is assembled once it is signed.
+'''
+def build_auth_sec_elf_pipeline(directory, signtool = None, namebase = None, inplace = False, jobs = 0, signers = MAX_SIGNTOOL_RUNS, cache = None):
+  start = time.time()
+
+  flist = get_auth_sec_elf_list(directory)
+  if len(flist) == 0:
+    return 0
+
+  if jobs == 0:
+    jobs = multiprocessing.cpu_count()
+  jobs = min(jobs, len(flist))
+  signers = min(signers, len(flist))
+
+  signtool = os.path.abspath(signtool)
+  stage_time = {'hash': 0.0, 'sign': 0.0, 'assemble': 0.0}
+  built = 0
+  pending = 0
+  queue = Queue.Queue()
+
+  '''
+  Fork process pool before any thread is started
+  '''
+  pool = multiprocessing.Pool(jobs)
+  signer_pool = multiprocessing.pool.ThreadPool(signers)
+
+  try:
+    args = [(fname, signtool, namebase) for fname in flist]
+
+    for fname, builder, hash_time, error in pool.imap_unordered(prepare_auth_sec_elf_worker, args):
+      stage_time['hash'] += hash_time
+
+      if builder is None:
+        print >> sys.stderr, fname + ': ' + error.replace('Errno', 'Warning')
+      else:
+        '''
+        Cache is shared by signer threads, not passed to hash processes
+        '''
+        builder.cache = cache
+        signer_pool.apply_async(sign_auth_sec_elf_worker, (fname, builder, queue))
+        pending += 1
+
+      '''
+      Assemble ones signed so far without waiting
+      '''
+      while pending > 0:
+        try:
+          item = queue.get_nowait()
+        except Queue.Empty:
+          break
+
+        pending -= 1
+        if assemble_auth_sec_elf(item, inplace, stage_time) is True:
+          built += 1
+
+    while pending > 0:
+      try:
+        item = queue.get(True, 1)
+      except Queue.Empty:
+        continue
+
+      pending -= 1
+      if assemble_auth_sec_elf(item, inplace, stage_time) is True:
+        built += 1
+  finally:
+    pool.close()
+    pool.join()
+    signer_pool.close()
+    signer_pool.join()
+
+  print >> sys.stdout, 'files built       : %d of %d' % (built, len(flist))
+  print >> sys.stdout, 'hash stage        : %.2fs in %d processes' % (stage_time['hash'], jobs)
+  print >> sys.stdout, 'sign stage        : %.2fs in %d runs at most' % (stage_time['sign'], signers)
+  print >> sys.stdout, 'assemble stage    : %.2fs' % stage_time['assemble']
+  print >> sys.stdout, 'wall-clock        : %.2fs' % (time.time() - start)
+
+  if built != len(flist):
+    return -1
+
+  return 0
+
+'''
+Verify Auth-Sec ELF, run in process of pool
+'''
+def verify_auth_sec_elf_worker(fname):
+  start = time.time()
+
+  try:
+    errors = ElfVerifier(fname).verify()
+  except os.error, err:
+    errors = [str(err)]
+
+  return (fname, errors, time.time() - start)
+
+'''
+Verify Auth-Sec ELF in directory
+
+Files of '.ko.sec' and '.elf.sec' are verified, or '.ko' and '.elf' if they
+are modified in place.
+'''
+def verify_auth_sec_elf(directory, inplace = False, jobs = 0):
+  start = time.time()
+
+  ft = get_filetype_suffixes()
+  if inplace is False:
+    ft = tuple([t + '.sec' for t in ft])
+
+  flist = sorted(get_auth_sec_elf_list(directory, ft))
+  if len(flist) == 0:
+    print >> sys.stderr, 'error: no ELF file found to verify, add \'-i\' if they were modified in place!'
+    return -1
+
+  if jobs == 0:
+    jobs = multiprocessing.cpu_count()
+  jobs = min(jobs, len(flist))
+
+  verify_time = 0.0
+  failed = 0
+
+  pool = multiprocessing.Pool(jobs)
+
+  try:
+    chunksize = max(1, len(flist) / (jobs * 4))
+
+    for fname, errors, elapsed in pool.imap(verify_auth_sec_elf_worker, flist, chunksize):
+      verify_time += elapsed
+
+      if len(errors) == 0:
+        print >> sys.stdout, fname + ': OK'
+      else:
+        print >> sys.stdout, fname + ': FAILED, ' + '; '.join(errors)
+        failed += 1
+  finally:
+    pool.close()
+    pool.join()
+
+  print >> sys.stdout, 'files verified    : %d of %d' % (len(flist) - failed, len(flist))
+  print >> sys.stdout, 'verify stage      : %.2fs in %d processes' % (verify_time, jobs)
+  print >> sys.stdout, 'wall-clock        : %.2fs' % (time.time() - start)
+
+  if failed != 0:
+    return -1
+
+  return 0
+
 '''
 Print Usage
 '''
@@ -1261,6 +2154,11 @@ def print_usage():
     print >> sys.stdout, '  -s, --sign       Directory of signature tool to sign ELF file'
     print >> sys.stdout, '  -b, --base       Base name of signature and certificate chain'
     print >> sys.stdout, '  -i, --inplace    Modify ELF file in place'
+    print >> sys.stdout, '  -j, --jobs       Build in pipeline with processes to hash, 0 for all CPUs'
+    print >> sys.stdout, '  -t, --signers    Maximum concurrent runs of signature tool in pipeline'
+    print >> sys.stdout, '  -c, --cache      Directory of signing cache to skip signature tool'
+    print >> sys.stdout, '  -m, --cachesize  Maximum size of signing cache in MiB'
+    print >> sys.stdout, '  -v, --verify     Verify ELF file in directory instead of building it'
     print >> sys.stdout, '  -h, --help       Display help message'
     print >> sys.stdout, ''
 
@@ -1272,6 +2170,12 @@ def main():
   signtool = ''
   basename = ''
   inplace = False
+  jobs = -1
+  signers = MAX_SIGNTOOL_RUNS
+  cachedir = ''
+  cachesize = SIGN_CACHE_MAXSIZE
+  cache = None
+  verify = False
   ret = 0
 
   '''
@@ -1283,7 +2187,7 @@ def main():
   Get args list
   '''
   try:
-    opts, args = getopt.getopt(sys.argv[1:], 'd:s:b:ih', ['dir', 'sign', 'base', 'inplace', 'help'])
+    opts, args = getopt.getopt(sys.argv[1:], 'd:s:b:ij:t:c:m:vh', ['dir', 'sign', 'base', 'inplace', 'jobs=', 'signers=', 'cache=', 'cachesize=', 'verify', 'help'])
   except getopt.GetoptError, err:
     print >> sys.stderr, err
     print_usage()
@@ -1298,6 +2202,37 @@ def main():
       basename = a
     elif o in ('-i', '--inplace'):
       inplace = True
+    elif o in ('-j', '--jobs'):
+      try:
+        jobs = int(a)
+      except ValueError:
+        jobs = -1
+
+      if jobs < 0:
+        print >> sys.stderr, 'error: invalid number of jobs!'
+        exit(1)
+    elif o in ('-t', '--signers'):
+      try:
+        signers = int(a)
+      except ValueError:
+        signers = 0
+
+      if signers <= 0:
+        print >> sys.stderr, 'error: invalid number of signers!'
+        exit(1)
+    elif o in ('-c', '--cache'):
+      cachedir = a
+    elif o in ('-m', '--cachesize'):
+      try:
+        cachesize = int(a)
+      except ValueError:
+        cachesize = -1
+
+      if cachesize < 0:
+        print >> sys.stderr, 'error: invalid size of signing cache!'
+        exit(1)
+    elif o in ('-v', '--verify'):
+      verify = True
     elif o in ('-h', '--help'):
       print_usage()
       sys.exit(0)
@@ -1311,6 +2246,18 @@ def main():
     print >> sys.stderr, 'error: failed to open directory!'
     exit(1)
 
+  '''
+  Verify auth-sec ELF, signature tool is not required
+  '''
+  if verify is True:
+    ret = verify_auth_sec_elf(directory, inplace, max(jobs, 0))
+    if ret != 0:
+      print >> sys.stderr, 'error: failed to verify auth-sec ELF file!'
+      exit(1)
+
+    print >> sys.stdout, 'done.'
+    return
+
   if len(signtool) == 0 or os.access(signtool, os.F_OK | os.R_OK | os.X_OK) is False:
     print >> sys.stderr, 'error: failed to access signature tool!'
     exit(1)
@@ -1319,10 +2266,26 @@ def main():
     print >> sys.stderr, 'error: invalid base name!'
     exit(1)
 
+  if len(cachedir) != 0:
+    try:
+      cache = SignCache(cachedir, cachesize * 1024 * 1024)
+    except os.error, err:
+      print >> sys.stderr, str(err)
+      print >> sys.stderr, 'error: failed to open signing cache!'
+      exit(1)
+
   '''
   Build auth-sec ELF with signature and certificate chain
   '''
-  ret = build_auth_sec_elf(directory, signtool, basename, inplace)
+  if jobs >= 0:
+    ret = build_auth_sec_elf_pipeline(directory, signtool, basename, inplace, jobs, signers, cache)
+  else:
+    ret = build_auth_sec_elf(directory, signtool, basename, inplace, cache)
+
+  if cache is not None:
+    cache.trim()
+    print >> sys.stdout, 'signing cache     : %d hits, %d misses' % (cache.hits, cache.misses)
+
   if ret != 0:
     print >> sys.stderr, 'error: failed to build auth-sec ELF file!'
     exit(1)
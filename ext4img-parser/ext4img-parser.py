@@ -18,11 +18,27 @@
 # To parse Ext4 image:
 # python ext4img-parser.py -v -f ext4.img -d ext4-dump
 #
+# Android sparse image is read as is, no simg2img needed:
+# python ext4img-parser.py -f system.img -d system-dump
+#
+# To read file from Ext4 image by path:
+# parser = Ext4Parser(unsparse_image(mmap_image("ext4.img")))
+# parser.load()
+# data = parser.open("/system/build.prop").read()
+#
 
 import os, sys
+import errno
 import getopt
 import math
 import time
+import mmap
+import struct
+import binascii
+import StringIO
+import bisect
+import collections
+import multiprocessing
 
 #
 # Global Variable Definition
@@ -46,6 +62,16 @@ is_pr_verb = False
 is_ext4_dumped = False
 ext4_dumpdir = ""
 
+#
+# Number of processes to parse Ext4 block groups
+#
+ext4_jobs = 1
+
+#
+# Ext4 parser shared with pool workers
+#
+ext4_pool_parser = None
+
 #
 # Ext4 Parameters
 #
@@ -148,7 +174,8 @@ EXT4_FEATURE_RO_COMPAT = {
     'EXT4_FEATURE_RO_COMPAT_HUGE_FILE'    : 0x0008,
     'EXT4_FEATURE_RO_COMPAT_GDT_CSUM'     : 0x0010,
     'EXT4_FEATURE_RO_COMPAT_DIR_NLINK'    : 0x0020,
-    'EXT4_FEATURE_RO_COMPAT_EXTRA_ISIZE'  : 0x0040
+    'EXT4_FEATURE_RO_COMPAT_EXTRA_ISIZE'  : 0x0040,
+    'EXT4_FEATURE_RO_COMPAT_METADATA_CSUM': 0x0400
     }
 
 EXT4_DEFAULT_MOUNT_OPTS = {
@@ -259,6 +286,28 @@ EXT4_INODE_FLAGS = {
 #
 EXT4_EXTENT_TREE_MAGIC = 0xF30A
 
+EXT4_EXTENT_TREE_MAX_DEPTH = 5
+
+#
+# Extents longer than this are uninitialized, 'ee_len' minus it is the length
+#
+EXT4_EXT_INIT_MAX_LEN = 32768
+
+#
+# Extent maps of inodes cached in LRU
+#
+EXT4_EXTENT_CACHE_SZ = 256
+
+#
+# Ext4 file data copied to dump directory in chunks
+#
+EXT4_DUMP_CHUNK_SZ = 4 * 1024 * 1024
+
+#
+# Max symbolic links followed in path resolution
+#
+EXT4_MAX_SYMLINKS = 40
+
 #
 # Ext4 Directory Entries
 #
@@ -337,16 +386,652 @@ EXT4_HASH_VERSION = {
     'DX_HASH_TEA_UNSIGNED'      : 0x5
     }
 
+#
+# Ext4 Record Layouts
+#
+# Each layout lists (field name, struct format) in on-disk order, all fields
+# little-endian. Byte array fields ('Ns') are folded into an integer the same
+# way as str2int_le(), except the ones listed as text, which are cut at NUL.
+#
+class Ext4Layout(object):
+    def __init__(self, fields, text_fields = ()):
+        self.fields = fields
+        self.names = [f[0] for f in fields]
+        self.sizes = [struct.calcsize('<' + f[1]) for f in fields]
+        self.s = struct.Struct('<' + ''.join([f[1] for f in fields]))
+        self.size = self.s.size
+
+        self.wide = []
+        for i in range(0, len(fields), 1):
+            if fields[i][1].endswith('s'):
+                self.wide.append((i, fields[i][0] in text_fields))
+
+    #
+    # Unpack a whole record from buffer at offset
+    #
+    def unpack_from(self, buf, offset):
+        values = ext4_unpack_from(self.s, buf, offset)
+
+        if len(self.wide) != 0:
+            values = list(values)
+            for i, is_text in self.wide:
+                if is_text is True:
+                    values[i] = values[i].split("\x00")[0]
+                else:
+                    values[i] = lestr2int(values[i])
+
+        return values
+
+    #
+    # Unpack a whole record from buffer at offset into dict
+    #
+    def unpack_into(self, record, buf, offset):
+        record.update(zip(self.names, self.unpack_from(buf, offset)))
+        return record
+
+#
+# Convert little-endian byte string of any length to integer
+#
+def lestr2int(data):
+    if len(data) == 0:
+        return 0
+
+    return int(binascii.hexlify(data[::-1]), 16)
+
+#
+# Unpack struct from image at offset, either mapped image or sparse image
+#
+def ext4_unpack_from(s, buf, offset):
+    if isinstance(buf, Ext4SparseImage):
+        return s.unpack(buf[offset:offset+s.size])
+
+    return s.unpack_from(buf, offset)
+
+#
+# Struct of little-endian array, compiled once per type and count
+#
+ext4_array_struct_cache = {}
+
+def get_ext4_array_struct(fmt, count):
+    key = (fmt, count)
+
+    s = ext4_array_struct_cache.get(key)
+    if s is None:
+        s = struct.Struct('<%d%s' % (count, fmt))
+        ext4_array_struct_cache[key] = s
+
+    return s
+
+#
+# Ext4 directory hash, refer to fs/ext4/hash.c in Linux kernel
+#
+EXT4_HASH_DEFAULT_SEED = [0x67452301, 0xEFCDAB89, 0x98BADCFE, 0x10325476]
+
+EXT4_HTREE_EOF_32BIT = 0x7FFFFFFF
+
+#
+# Fold name into hash buffer of 'num' 32-bit words
+#
+def ext4_str2hashbuf(name, num, is_unsigned):
+    length = len(name)
+
+    pad = (length | (length << 8)) & 0xFFFFFFFF
+    pad = (pad | (pad << 16)) & 0xFFFFFFFF
+
+    val = pad
+    buf = []
+
+    for i in range(0, min(length, num * 4), 1):
+        c = ord(name[i])
+        if is_unsigned is False and c >= 0x80:
+            c -= 0x100
+
+        val = (c + (val << 8)) & 0xFFFFFFFF
+
+        if (i % 4) == 3:
+            buf.append(val)
+            val = pad
+
+    if len(buf) < num:
+        buf.append(val)
+
+    while len(buf) < num:
+        buf.append(pad)
+
+    return buf
+
+#
+# Legacy hash
+#
+def ext4_dx_hack_hash(name, is_unsigned):
+    hash0 = 0x12A3FE2D
+    hash1 = 0x37ABE8F9
+
+    for ch in name:
+        c = ord(ch)
+        if is_unsigned is False and c >= 0x80:
+            c -= 0x100
+
+        h = (hash1 + (hash0 ^ ((c * 7152373) & 0xFFFFFFFF))) & 0xFFFFFFFF
+        if h & 0x80000000 != 0:
+            h = (h - 0x7FFFFFFF) & 0xFFFFFFFF
+
+        hash1 = hash0
+        hash0 = h
+
+    return (hash0 << 1) & 0xFFFFFFFF
+
+#
+# Half MD4 transform, 3 rounds of 8 steps
+#
+EXT4_HALF_MD4_STEPS = (
+    (0, 0x00000000, ((0, 3), (1, 7), (2, 11), (3, 19), (4, 3), (5, 7), (6, 11), (7, 19))),
+    (1, 0x5A827999, ((1, 3), (3, 5), (5, 9), (7, 13), (0, 3), (2, 5), (4, 9), (6, 13))),
+    (2, 0x6ED9EBA1, ((3, 3), (7, 9), (2, 11), (6, 15), (1, 3), (5, 9), (0, 11), (4, 15))),
+    )
+
+def ext4_half_md4_transform(buf, data):
+    state = list(buf)
+
+    for r, k, steps in EXT4_HALF_MD4_STEPS:
+        for j in range(0, len(steps), 1):
+            i, n = steps[j]
+            a, b, c, d = state[-j % 4], state[(1 - j) % 4], state[(2 - j) % 4], state[(3 - j) % 4]
+
+            if r == 0:
+                f = d ^ (b & (c ^ d))
+            elif r == 1:
+                f = (b & c) + ((b ^ c) & d)
+            else:
+                f = b ^ c ^ d
+
+            a = (a + f + data[i] + k) & 0xFFFFFFFF
+            state[-j % 4] = ((a << n) | (a >> (32 - n))) & 0xFFFFFFFF
+
+    return [(buf[i] + state[i]) & 0xFFFFFFFF for i in range(0, 4, 1)]
+
+#
+# TEA transform, 16 rounds
+#
+def ext4_tea_transform(buf, data):
+    s = 0
+    b0, b1 = buf[0], buf[1]
+    a, b, c, d = data
+
+    for i in range(0, 16, 1):
+        s = (s + 0x9E3779B9) & 0xFFFFFFFF
+        b0 = (b0 + ((((b1 << 4) + a) & 0xFFFFFFFF) ^ ((b1 + s) & 0xFFFFFFFF) ^ (((b1 >> 5) + b) & 0xFFFFFFFF))) & 0xFFFFFFFF
+        b1 = (b1 + ((((b0 << 4) + c) & 0xFFFFFFFF) ^ ((b0 + s) & 0xFFFFFFFF) ^ (((b0 >> 5) + d) & 0xFFFFFFFF))) & 0xFFFFFFFF
+
+    return [(buf[0] + b0) & 0xFFFFFFFF, (buf[1] + b1) & 0xFFFFFFFF, buf[2], buf[3]]
+
+#
+# Hash directory entry name, return (major hash, minor hash)
+#
+def ext4_dirhash(name, hash_version, seed):
+    if seed is not None and any(seed):
+        buf = list(seed)
+    else:
+        buf = list(EXT4_HASH_DEFAULT_SEED)
+
+    is_unsigned = hash_version >= EXT4_HASH_VERSION['DX_HASH_LEGACY_UNSIGNED']
+    hash_version = hash_version % 3
+
+    if hash_version == EXT4_HASH_VERSION['DX_HASH_LEGACY']:
+        major, minor = ext4_dx_hack_hash(name, is_unsigned), 0
+    elif hash_version == EXT4_HASH_VERSION['DX_HASH_HALF_MD4']:
+        for i in range(0, len(name), 32):
+            buf = ext4_half_md4_transform(buf, ext4_str2hashbuf(name[i:], 8, is_unsigned))
+        major, minor = buf[1], buf[2]
+    else:
+        for i in range(0, len(name), 16):
+            buf = ext4_tea_transform(buf, ext4_str2hashbuf(name[i:], 4, is_unsigned))
+        major, minor = buf[0], buf[1]
+
+    major &= ~1 & 0xFFFFFFFF
+    if major == (EXT4_HTREE_EOF_32BIT << 1):
+        major = (EXT4_HTREE_EOF_32BIT - 1) << 1
+
+    return (major, minor)
+
+EXT4_SUPER_BLOCK_LAYOUT = Ext4Layout([
+    ('s_inodes_count',           'I'),
+    ('s_blocks_count_lo',        'I'),
+    ('s_r_blocks_count_lo',      'I'),
+    ('s_free_blocks_count_lo',   'I'),
+    ('s_free_inodes_count',      'I'),
+    ('s_first_data_block',       'I'),
+    ('s_log_block_size',         'I'),
+    ('s_obso_log_frag_size',     'I'),
+    ('s_blocks_per_group',       'I'),
+    ('s_obso_frags_per_group',   'I'),
+    ('s_inodes_per_group',       'I'),
+    ('s_mtime',                  'I'),
+    ('s_wtime',                  'I'),
+    ('s_mnt_count',              'H'),
+    ('s_max_mnt_count',          'H'),
+    ('s_magic',                  'H'),
+    ('s_state',                  'H'),
+    ('s_errors',                 'H'),
+    ('s_minor_rev_level',        'H'),
+    ('s_lastcheck',              'I'),
+    ('s_checkinterval',          'I'),
+    ('s_creator_os',             'I'),
+    ('s_rev_level',              'I'),
+    ('s_def_resuid',             'H'),
+    ('s_def_resgid',             'H'),
+    ('s_first_ino',              'I'),
+    ('s_inode_size',             'H'),
+    ('s_block_group_nr',         'H'),
+    ('s_feature_compat',         'I'),
+    ('s_feature_incompat',       'I'),
+    ('s_feature_ro_compat',      'I'),
+    ('s_uuid',                   '16s'),
+    ('s_volume_name',            '16s'),
+    ('s_last_mounted',           '64s'),
+    ('s_algorithm_usage_bitmap', 'I'),
+    ('s_prealloc_blocks',        'B'),
+    ('s_prealloc_dir_blocks',    'B'),
+    ('s_reserved_gdt_blocks',    'H'),
+    ('s_journal_uuid',           '16s'),
+    ('s_journal_inum',           'I'),
+    ('s_journal_dev',            'I'),
+    ('s_last_orphan',            'I'),
+    ('s_hash_seed',              '16s'),
+    ('s_def_hash_version',       'B'),
+    ('s_reserved_char_pad',      'B'),
+    ('s_desc_size',              'H'),
+    ('s_default_mount_opts',     'I'),
+    ('s_first_meta_bg',          'I'),
+    ('s_mkfs_time',              'I'),
+    ('s_jnl_blocks',             '68s'),
+    ('s_blocks_count_hi',        'I'),
+    ('s_r_blocks_count_hi',      'I'),
+    ('s_free_blocks_count_hi',   'I'),
+    ('s_min_extra_isize',        'H'),
+    ('s_want_extra_isize',       'H'),
+    ('s_flags',                  'I'),
+    ('s_raid_stride',            'H'),
+    ('s_mmp_interval',           'H'),
+    ('s_mmp_block',              'Q'),
+    ('s_raid_stripe_width',      'I'),
+    ('s_log_groups_per_flex',    'B'),
+    ('s_reserved_char_pad2',     'B'),
+    ('s_reserved_pad',           'H'),
+    ('s_kbytes_written',         'Q'),
+    ('s_reserved',               '640s'),
+    ], ('s_volume_name', 's_last_mounted'))
+
+#
+# 32-byte block group descriptor, and the upper half of the 64-byte one
+# if 'EXT4_FEATURE_INCOMPAT_64BIT' set and 's_desc_size' > 32
+#
+EXT4_BG_DESC_LAYOUT = Ext4Layout([
+    ('bg_block_bitmap_lo',      'I'),
+    ('bg_inode_bitmap_lo',      'I'),
+    ('bg_inode_table_lo',       'I'),
+    ('bg_free_blocks_count_lo', 'H'),
+    ('bg_free_inodes_count_lo', 'H'),
+    ('bg_used_dirs_count_lo',   'H'),
+    ('bg_flags',                'H'),
+    ('bg_exclude_bitmap_lo',    'I'),
+    ('bg_reserved1',            'I'),
+    ('bg_itable_unused_lo',     'H'),
+    ('bg_checksum',             'H'),
+    ])
+
+EXT4_BG_DESC_64BIT_LAYOUT = Ext4Layout([
+    ('bg_block_bitmap_hi',      'I'),
+    ('bg_inode_bitmap_hi',      'I'),
+    ('bg_inode_table_hi',       'I'),
+    ('bg_free_blocks_count_hi', 'H'),
+    ('bg_free_inodes_count_hi', 'H'),
+    ('bg_used_dirs_count_hi',   'H'),
+    ('bg_itable_unused_hi',     'H'),
+    ('bg_exclude_bitmap_hi',    'I'),
+    ('bg_reserved2',            'I'),
+    ('bg_reserved3',            '4s'),
+    ])
+
+#
+# 128-byte inode, and the extra fields following it
+# if 's_inode_size' > 128
+#
+EXT4_INODE_LAYOUT = Ext4Layout([
+    ('i_mode',            'H'),
+    ('i_uid',             'H'),
+    ('i_size_lo',         'I'),
+    ('i_atime',           'I'),
+    ('i_ctime',           'I'),
+    ('i_mtime',           'I'),
+    ('i_dtime',           'I'),
+    ('i_gid',             'H'),
+    ('i_links_count',     'H'),
+    ('i_blocks_lo',       'I'),
+    ('i_flags',           'I'),
+    ('l_i_version',       'I'),
+    ('i_block',           '60s'),
+    ('i_generation',      'I'),
+    ('i_file_acl_lo',     'I'),
+    ('i_size_high',       'I'),
+    ('i_obso_faddr',      'I'),
+    ('l_i_blocks_high',   'H'),
+    ('l_i_file_acl_high', 'H'),
+    ('l_i_uid_high',      'H'),
+    ('l_i_gid_high',      'H'),
+    ('l_i_reserved2',     'I'),
+    ])
+
+EXT4_INODE_EXTRA_LAYOUT = Ext4Layout([
+    ('i_extra_isize',  'H'),
+    ('i_pad1',         'H'),
+    ('i_ctime_extra',  'I'),
+    ('i_mtime_extra',  'I'),
+    ('i_atime_extra',  'I'),
+    ('i_crtime',       'I'),
+    ('i_crtime_extra', 'I'),
+    ('i_version_hi',   'I'),
+    ])
+
+#
+# Offset of 'i_block' in inode
+#
+EXT4_INODE_I_BLOCK_OFFSET = 40
+
+#
+# Extent header, index node and leaf node
+#
+EXT4_EXTENT_HEADER_LAYOUT = Ext4Layout([
+    ('eh_magic',      'H'),
+    ('eh_entries',    'H'),
+    ('eh_max',        'H'),
+    ('eh_depth',      'H'),
+    ('eh_generation', 'I'),
+    ])
+
+EXT4_EXTENT_IDX_LAYOUT = Ext4Layout([
+    ('ei_block',   'I'),
+    ('ei_leaf_lo', 'I'),
+    ('ei_leaf_hi', 'H'),
+    ('ei_unused',  'H'),
+    ])
+
+EXT4_EXTENT_LAYOUT = Ext4Layout([
+    ('ee_block',    'I'),
+    ('ee_len',      'H'),
+    ('ee_start_hi', 'H'),
+    ('ee_start_lo', 'I'),
+    ])
+
+#
+# Extent tree entries fitting in 'i_block' after the header
+#
+EXT4_EXTENT_ROOT_ENTRIES = 4
+
+#
+# Linear directory entry 2, 'name' follows
+#
+EXT4_DIR_ENTRY_2_LAYOUT = Ext4Layout([
+    ('inode',     'I'),
+    ('rec_len',   'H'),
+    ('name_len',  'B'),
+    ('file_type', 'B'),
+    ])
+
+#
+# Hash tree directory root and interior node, 'dx_entry' array follows
+#
+EXT4_DX_ROOT_LAYOUT = Ext4Layout([
+    ('dot_inode',         'I'),
+    ('dot_rec_len',       'H'),
+    ('dot_name_len',      'B'),
+    ('dot_file_type',     'B'),
+    ('dot_name',          '4s'),
+    ('dot_dot_inode',     'I'),
+    ('dot_dot_rec_len',   'H'),
+    ('dot_dot_name_len',  'B'),
+    ('dot_dot_file_type', 'B'),
+    ('dot_dot_name',      '4s'),
+    ('reserved_zero',     'I'),
+    ('hash_version',      'B'),
+    ('info_length',       'B'),
+    ('indirect_levels',   'B'),
+    ('unused_flags',      'B'),
+    ('limit',             'H'),
+    ('count',             'H'),
+    ('block',             'I'),
+    ], text_fields = ('dot_name', 'dot_dot_name'))
+
+EXT4_DX_NODE_LAYOUT = Ext4Layout([
+    ('fake_inode',     'I'),
+    ('fake_rec_len',   'H'),
+    ('fake_name_len',  'B'),
+    ('fake_file_type', 'B'),
+    ('limit',          'H'),
+    ('count',          'H'),
+    ('block',          'I'),
+    ])
+
+#
+# Offset of 'limit' in 'dx_root' following 'info_length' and in 'dx_node'
+#
+EXT4_DX_ROOT_INFO_OFFSET = 24
+EXT4_DX_NODE_LIMIT_OFFSET = 8
+
+#
+# Depth of htree, 3 levels allowed with 'EXT4_FEATURE_INCOMPAT_LARGEDIR'
+#
+EXT4_HTREE_LEVEL = 3
+
+#
+# Low 28 bits of 'dx_entry' block are the block number
+#
+EXT4_DX_BLOCK_MASK = 0x0FFFFFFF
+
+EXT4_DX_COUNTLIMIT_STRUCT = struct.Struct('<HH')
+
+#
+# Extended attributes header and entry, 'e_name' follows entry
+#
+EXT4_XATTR_HEADER_LAYOUT = Ext4Layout([
+    ('h_magic',    'I'),
+    ('h_refcount', 'I'),
+    ('h_blocks',   'I'),
+    ('h_hash',     'I'),
+    ('h_reserved', '16s'),
+    ])
+
+EXT4_XATTR_ENTRY_LAYOUT = Ext4Layout([
+    ('e_name_len',    'B'),
+    ('e_name_index',  'B'),
+    ('e_value_offs',  'H'),
+    ('e_value_block', 'I'),
+    ('e_value_size',  'I'),
+    ('e_hash',        'I'),
+    ])
+
+#
+# Android sparse image, refer to system/core/libsparse/sparse_format.h in AOSP
+#
+SPARSE_HEADER_MAGIC = 0xED26FF3A
+
+SPARSE_HEADER_LAYOUT = Ext4Layout([
+    ('magic',          'I'),
+    ('major_version',  'H'),
+    ('minor_version',  'H'),
+    ('file_hdr_sz',    'H'),
+    ('chunk_hdr_sz',   'H'),
+    ('blk_sz',         'I'),
+    ('total_blks',     'I'),
+    ('total_chunks',   'I'),
+    ('image_checksum', 'I'),
+    ])
+
+SPARSE_CHUNK_HEADER_LAYOUT = Ext4Layout([
+    ('chunk_type', 'H'),
+    ('reserved1',  'H'),
+    ('chunk_sz',   'I'),
+    ('total_sz',   'I'),
+    ])
+
+SPARSE_CHUNK_TYPE = {
+    'CHUNK_TYPE_RAW'       : 0xCAC1,
+    'CHUNK_TYPE_FILL'      : 0xCAC2,
+    'CHUNK_TYPE_DONT_CARE' : 0xCAC3,
+    'CHUNK_TYPE_CRC32'     : 0xCAC4
+    }
+
+#
+# Class Definition For Android Sparse Image
+#
+# Reads of expanded image are served from chunks of sparse image through
+# offset index, RAW chunks sliced from sparse image, FILL and DONT_CARE
+# chunks synthesized. Sliced like str or mmap.
+#
+class Ext4SparseImage(object):
+    def __init__(self, data):
+        self.data = data
+        self.size = 0
+
+        #
+        # Sparse image header
+        #
+        self.sparse_header = {}
+
+        #
+        # Offset index of chunks, chunk is tuple of (chunk type, offset in expanded
+        # image, length, offset of RAW data or FILL pattern)
+        #
+        self.chunk_offsets = []
+        self.chunks = []
+
+    #
+    # Check if image data is Android sparse image
+    #
+    @staticmethod
+    def is_sparse(data):
+        return len(data) >= SPARSE_HEADER_LAYOUT.size and struct.unpack_from('<I', data, 0)[0] == SPARSE_HEADER_MAGIC
+
+    #
+    # Parse sparse image header and chunk headers into offset index
+    #
+    def parse(self):
+        SPARSE_HEADER_LAYOUT.unpack_into(self.sparse_header, self.data, 0)
+
+        if self.sparse_header['magic'] != SPARSE_HEADER_MAGIC or self.sparse_header['major_version'] != 1:
+            print("\nERROR: invalid sparse image header!\n")
+            return False
+
+        blk_sz = self.sparse_header['blk_sz']
+        chunk_hdr_sz = self.sparse_header['chunk_hdr_sz']
+
+        offset = self.sparse_header['file_hdr_sz']
+        out = 0
+
+        for i in range(0, self.sparse_header['total_chunks'], 1):
+            if offset + chunk_hdr_sz > len(self.data):
+                print("\nERROR: truncated sparse image at chunk #%d!\n" % i)
+                return False
+
+            chunk_type, reserved1, chunk_sz, total_sz = SPARSE_CHUNK_HEADER_LAYOUT.unpack_from(self.data, offset)
+            body = offset + chunk_hdr_sz
+            length = chunk_sz * blk_sz
+
+            if chunk_type == SPARSE_CHUNK_TYPE['CHUNK_TYPE_RAW']:
+                value = body
+                is_valid = total_sz == chunk_hdr_sz + length
+            elif chunk_type == SPARSE_CHUNK_TYPE['CHUNK_TYPE_FILL']:
+                value = self.data[body:body+4]
+                is_valid = total_sz == chunk_hdr_sz + 4
+            elif chunk_type == SPARSE_CHUNK_TYPE['CHUNK_TYPE_DONT_CARE']:
+                value = None
+                is_valid = total_sz == chunk_hdr_sz
+            elif chunk_type == SPARSE_CHUNK_TYPE['CHUNK_TYPE_CRC32']:
+                offset += total_sz
+                continue
+            else:
+                is_valid = False
+
+            if is_valid is False or offset + total_sz > len(self.data):
+                print("\nERROR: invalid sparse chunk #%d!\n" % i)
+                return False
+
+            if length > 0:
+                self.chunk_offsets.append(out)
+                self.chunks.append((chunk_type, out, length, value))
+
+            out += length
+            offset += total_sz
+
+        if out != self.sparse_header['total_blks'] * blk_sz:
+            print("\nERROR: sparse image size mismatch!\n")
+            return False
+
+        self.size = out
+
+        return True
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.size)
+            if step != 1:
+                raise ValueError("slice step not supported")
+
+            return self.read(start, stop - start)
+
+        if key < 0:
+            key += self.size
+        if key < 0 or key >= self.size:
+            raise IndexError("sparse image index out of range")
+
+        return self.read(key, 1)
+
+    #
+    # Read expanded image at offset
+    #
+    def read(self, offset, length):
+        data = []
+
+        i = bisect.bisect_right(self.chunk_offsets, offset) - 1
+
+        while length > 0 and i < len(self.chunks):
+            chunk_type, start, size, value = self.chunks[i]
+
+            rel = offset - start
+            n = min(length, size - rel)
+
+            if chunk_type == SPARSE_CHUNK_TYPE['CHUNK_TYPE_RAW']:
+                data.append(self.data[value+rel:value+rel+n])
+            elif chunk_type == SPARSE_CHUNK_TYPE['CHUNK_TYPE_FILL']:
+                k = rel % 4
+                data.append((value * ((k + n + 3) / 4))[k:k+n])
+            else:
+                data.append("\x00" * n)
+
+            offset += n
+            length -= n
+            i += 1
+
+        return "".join(data)
+
 #
 # Class Definition For Ext4 Parser
 #
 class Ext4Parser(object):
-    def __init__(self, img):
+    def __init__(self, img, jobs = 1):
         #
         # Init class member
         #
         self.image = img
 
+        #
+        # Number of processes to parse inode tables of block groups
+        #
+        self.jobs = jobs
+
         #
         # Ext4 block size
         #
@@ -483,6 +1168,27 @@ class Ext4Parser(object):
             'bg_reserved3'            : 0,  # Padding to 64 bytes, u32[2]
             }
 
+        #
+        # Ext4 block group descriptors, one record per block group
+        #
+        self.ext4_bg_desc_list = []
+
+        #
+        # Ext4 inode index of inodes in use, keyed by inode number
+        #
+        self.ext4_inode_index = {}
+
+        #
+        # Ext4 dentry table of resolved paths, keyed by normalized path
+        #
+        self.ext4_dentry_cache = {'/' : EXT4_ROOT_INO}
+
+        #
+        # Ext4 extent maps of inodes in LRU order, keyed by inode number
+        #
+        self.ext4_extent_cache = collections.OrderedDict()
+        self.ext4_extent_cache_sz = EXT4_EXTENT_CACHE_SZ
+
         #
         # Ext4 inode table
         #
@@ -804,6 +1510,17 @@ class Ext4Parser(object):
 
         return data
 
+    #
+    # Decode record field by field with str2int_le(), for benchmark only
+    #
+    def unpack_into_legacy(self, layout, record, offset):
+        for i in range(0, len(layout.names), 1):
+            size = layout.sizes[i]
+            record[layout.names[i]] = self.str2int_le(self.image[offset:offset+size])
+            offset += size
+
+        return record
+
     #
     # Check if a is a power of b
     #
@@ -862,23 +1579,25 @@ class Ext4Parser(object):
         return 1
 
     #
-    # Get block group descriptor's blocks
+    # Get block group descriptor's size
     #
-    def get_bg_desc_blocks(self):
+    def get_bg_desc_sz(self):
         if self.ext4_super_block['s_feature_incompat'] & EXT4_FEATURE_INCOMPAT['EXT4_FEATURE_INCOMPAT_64BIT'] != 0 and self.ext4_super_block['s_desc_size'] > 32:
-            return self.div_round_up(self.get_bg_count() * 64, EXT4_BLOCK_SZ)
+            return self.ext4_super_block['s_desc_size']
         else:
-            #
-            # Refer to 's_desc_size'
-            # if 'EXT4_FEATURE_COMPAT_HAS_JOURNAL' is set
-            #
-            return self.div_round_up(self.get_bg_count() * 32, EXT4_BLOCK_SZ)
+            return 32
+
+    #
+    # Get block group descriptor's blocks
+    #
+    def get_bg_desc_blocks(self):
+        return self.div_round_up(self.get_bg_count() * self.get_bg_desc_sz(), self.ext4_block_sz)
 
     #
     # Get reserved GDT's blocks
     #
     def get_bg_desc_reserve_blocks(self):
-        return self.div_round_up(self.get_bg_count() * 1024 * self.get_bg_desc_sz(), EXT4_BLOCK_SZ) - self.get_bg_desc_blocks()
+        return self.div_round_up(self.get_bg_count() * 1024 * self.get_bg_desc_sz(), self.ext4_block_sz) - self.get_bg_desc_blocks()
 
     #
     # Get data block bitmap's blocks
@@ -902,556 +1621,359 @@ class Ext4Parser(object):
     # Parse Ext4 super block
     #
     def parse_ext4_sb(self, offset):
-        self.ext4_super_block['s_inodes_count'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_super_block['s_blocks_count_lo'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_super_block['s_r_blocks_count_lo'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_super_block['s_free_blocks_count_lo'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_super_block['s_free_inodes_count'] = self.str2int_le(self.image[offset:offset+4])
+        self.parse_ext4_sb_internal(offset)
 
-        offset += 4
-        self.ext4_super_block['s_first_data_block'] = self.str2int_le(self.image[offset:offset+4])
+        #
+        # Print Ext4 super block info
+        #
+        self.print_ext4_sb_info()
 
-        offset += 4
-        self.ext4_super_block['s_log_block_size'] = self.str2int_le(self.image[offset:offset+4])
+    #
+    # Parse Ext4 super block internally
+    #
+    def parse_ext4_sb_internal(self, offset):
+        EXT4_SUPER_BLOCK_LAYOUT.unpack_into(self.ext4_super_block, self.image, offset)
         self.ext4_block_sz = int(math.pow(2, (10 + self.ext4_super_block['s_log_block_size'])))
 
-        offset += 4
-        self.ext4_super_block['s_obso_log_frag_size'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_super_block['s_blocks_per_group'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_super_block['s_obso_frags_per_group'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_super_block['s_inodes_per_group'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_super_block['s_mtime'] = self.str2int_le(self.image[offset:offset+4])
+    #
+    # Parse Ext4 block group descriptor internally
+    #
+    def parse_ext4_bg_desc_internal(self, offset):
+        desc = dict.fromkeys(EXT4_BG_DESC_LAYOUT.names + EXT4_BG_DESC_64BIT_LAYOUT.names, 0)
 
-        offset += 4
-        self.ext4_super_block['s_wtime'] = self.str2int_le(self.image[offset:offset+4])
+        EXT4_BG_DESC_LAYOUT.unpack_into(desc, self.image, offset)
 
-        offset += 4
-        self.ext4_super_block['s_mnt_count'] = self.str2int_le(self.image[offset:offset+2])
+        if self.get_bg_desc_sz() > EXT4_BG_DESC_LAYOUT.size:
+            EXT4_BG_DESC_64BIT_LAYOUT.unpack_into(desc, self.image, offset + EXT4_BG_DESC_LAYOUT.size)
 
-        offset += 2
-        self.ext4_super_block['s_max_mnt_count'] = self.str2int_le(self.image[offset:offset+2])
+        self.ext4_block_group_desc = desc
 
-        offset += 2
-        self.ext4_super_block['s_magic'] = self.str2int_le(self.image[offset:offset+2])
+        return desc
 
-        offset += 2
-        self.ext4_super_block['s_state'] = self.str2int_le(self.image[offset:offset+2])
+    #
+    # Parse Ext4 extent tree
+    #
+    def parse_ext4_extent_tree(self, offset):
+        EXT4_EXTENT_HEADER_LAYOUT.unpack_into(self.ext4_extent_header, self.image, offset)
 
-        offset += 2
-        self.ext4_super_block['s_errors'] = self.str2int_le(self.image[offset:offset+2])
+        if self.ext4_extent_header['eh_magic'] != EXT4_EXTENT_TREE_MAGIC:
+            return
 
-        offset += 2
-        self.ext4_super_block['s_minor_rev_level'] = self.str2int_le(self.image[offset:offset+2])
+        offset += EXT4_EXTENT_HEADER_LAYOUT.size
 
-        offset += 2
-        self.ext4_super_block['s_lastcheck'] = self.str2int_le(self.image[offset:offset+4])
+        for i in range(0, min(self.ext4_extent_header['eh_entries'], EXT4_EXTENT_ROOT_ENTRIES), 1):
+            if self.ext4_extent_header['eh_depth'] > 0:
+                EXT4_EXTENT_IDX_LAYOUT.unpack_into(self.ext4_extent_idx, self.image, offset + i * EXT4_EXTENT_IDX_LAYOUT.size)
 
-        offset += 4
-        self.ext4_super_block['s_checkinterval'] = self.str2int_le(self.image[offset:offset+4])
+                #
+                # Ext4 extent tree's leaf nodes are resolved by get_ext4_extent_map()
+                #
+            else:
+                EXT4_EXTENT_LAYOUT.unpack_into(self.ext4_extent, self.image, offset + i * EXT4_EXTENT_LAYOUT.size)
 
-        offset += 4
-        self.ext4_super_block['s_creator_os'] = self.str2int_le(self.image[offset:offset+4])
+    #
+    # Parse Ext4 extent tree node and its children, append extents of leaf nodes
+    #
+    # Extent is tuple of (logical block, blocks num, physical block, uninitialized)
+    #
+    def parse_ext4_extent_node(self, offset, max_entries, extents, depth):
+        eh_magic, eh_entries, eh_max, eh_depth, eh_generation = EXT4_EXTENT_HEADER_LAYOUT.unpack_from(self.image, offset)
 
-        offset += 4
-        self.ext4_super_block['s_rev_level'] = self.str2int_le(self.image[offset:offset+4])
+        if eh_magic != EXT4_EXTENT_TREE_MAGIC or eh_depth != depth or depth > EXT4_EXTENT_TREE_MAX_DEPTH:
+            return False
 
-        offset += 4
-        self.ext4_super_block['s_def_resuid'] = self.str2int_le(self.image[offset:offset+2])
+        offset += EXT4_EXTENT_HEADER_LAYOUT.size
+        entries = min(eh_entries, max_entries)
 
-        offset += 2
-        self.ext4_super_block['s_def_resgid'] = self.str2int_le(self.image[offset:offset+2])
+        if eh_depth > 0:
+            max_entries = (self.ext4_block_sz - EXT4_EXTENT_HEADER_LAYOUT.size) / EXT4_EXTENT_IDX_LAYOUT.size
 
-        offset += 2
-        self.ext4_super_block['s_first_ino'] = self.str2int_le(self.image[offset:offset+4])
+            for i in range(0, entries, 1):
+                ei_block, ei_leaf_lo, ei_leaf_hi, ei_unused = EXT4_EXTENT_IDX_LAYOUT.unpack_from(self.image, offset + i * EXT4_EXTENT_IDX_LAYOUT.size)
 
-        offset += 4
-        self.ext4_super_block['s_inode_size'] = self.str2int_le(self.image[offset:offset+2])
+                if self.parse_ext4_extent_node(((ei_leaf_hi << 32) + ei_leaf_lo) * self.ext4_block_sz, max_entries, extents, eh_depth - 1) is False:
+                    return False
+        else:
+            for i in range(0, entries, 1):
+                ee_block, ee_len, ee_start_hi, ee_start_lo = EXT4_EXTENT_LAYOUT.unpack_from(self.image, offset + i * EXT4_EXTENT_LAYOUT.size)
 
-        offset += 2
-        self.ext4_super_block['s_block_group_nr'] = self.str2int_le(self.image[offset:offset+2])
+                if ee_len > EXT4_EXT_INIT_MAX_LEN:
+                    extents.append((ee_block, ee_len - EXT4_EXT_INIT_MAX_LEN, (ee_start_hi << 32) + ee_start_lo, True))
+                else:
+                    extents.append((ee_block, ee_len, (ee_start_hi << 32) + ee_start_lo, False))
 
-        offset += 2
-        self.ext4_super_block['s_feature_compat'] = self.str2int_le(self.image[offset:offset+4])
+        return True
 
-        offset += 4
-        self.ext4_super_block['s_feature_incompat'] = self.str2int_le(self.image[offset:offset+4])
+    #
+    # Get offset of inode in inode table by inode number
+    #
+    def get_ext4_inode_offset(self, inode_num):
+        if inode_num in self.ext4_inode_index:
+            return self.ext4_inode_index[inode_num]['offset']
 
-        offset += 4
-        self.ext4_super_block['s_feature_ro_compat'] = self.str2int_le(self.image[offset:offset+4])
+        bg_num = (inode_num - 1) / self.ext4_super_block['s_inodes_per_group']
+        index = (inode_num - 1) % self.ext4_super_block['s_inodes_per_group']
 
-        offset += 4
-        self.ext4_super_block['s_uuid'] = self.str2int_le(self.image[offset:offset+16])
+        if inode_num < 1 or bg_num >= len(self.ext4_bg_desc_list):
+            return -1
 
-        offset += 16
-        self.ext4_super_block['s_volume_name'] = self.image[offset:offset+16].split("\x00")[0]
+        desc = self.ext4_bg_desc_list[bg_num]
 
-        offset += 16
-        self.ext4_super_block['s_last_mounted'] = self.image[offset:offset+64].split("\x00")[0]
+        return ((desc['bg_inode_table_hi'] << 32) + desc['bg_inode_table_lo']) * self.ext4_block_sz + index * self.ext4_super_block['s_inode_size']
 
-        offset += 64
-        self.ext4_super_block['s_algorithm_usage_bitmap'] = self.str2int_le(self.image[offset:offset+4])
+    #
+    # Get extent map of inode, which is the sorted list of all extents in its extent tree
+    #
+    # Resolved maps are cached in LRU keyed by inode number
+    #
+    def get_ext4_extent_map(self, inode_num):
+        if inode_num in self.ext4_extent_cache:
+            extents = self.ext4_extent_cache.pop(inode_num)
+            self.ext4_extent_cache[inode_num] = extents
+            return extents
 
-        offset += 4
-        self.ext4_super_block['s_prealloc_blocks'] = self.str2int_le(self.image[offset:offset+1])
+        offset = self.get_ext4_inode_offset(inode_num)
+        if offset < 0:
+            return []
 
-        offset += 1
-        self.ext4_super_block['s_prealloc_dir_blocks'] = self.str2int_le(self.image[offset:offset+1])
+        extents = []
+        offset += EXT4_INODE_I_BLOCK_OFFSET
+        depth = EXT4_EXTENT_HEADER_LAYOUT.unpack_from(self.image, offset)[3]
 
-        offset += 1
-        self.ext4_super_block['s_reserved_gdt_blocks'] = self.str2int_le(self.image[offset:offset+2])
+        if self.parse_ext4_extent_node(offset, EXT4_EXTENT_ROOT_ENTRIES, extents, depth) is False:
+            extents = []
 
-        offset += 2
-        self.ext4_super_block['s_journal_uuid'] = self.str2int_le(self.image[offset:offset+16])
+        extents.sort()
 
-        offset += 16
-        self.ext4_super_block['s_journal_inum'] = self.str2int_le(self.image[offset:offset+4])
+        self.ext4_extent_cache[inode_num] = extents
+        if len(self.ext4_extent_cache) > self.ext4_extent_cache_sz:
+            self.ext4_extent_cache.popitem(last = False)
 
-        offset += 4
-        self.ext4_super_block['s_journal_dev'] = self.str2int_le(self.image[offset:offset+4])
+        return extents
 
-        offset += 4
-        self.ext4_super_block['s_last_orphan'] = self.str2int_le(self.image[offset:offset+4])
+    #
+    # Parse Ext4 inode in inode table internally
+    #
+    def parse_ext4_bg_inode_internal(self, offset):
+        EXT4_INODE_LAYOUT.unpack_into(self.ext4_inode_table, self.image, offset)
 
-        offset += 4
-        self.ext4_super_block['s_hash_seed'] = self.str2int_le(self.image[offset:offset+16])
+        #
+        # Parse Ext4 extent tree
+        #
+        # 'EXT4_FEATURE_INCOMPAT['EXT4_FEATURE_INCOMPAT_EXTENTS']' MUST set for Ext4
+        #
+        self.parse_ext4_extent_tree(offset + EXT4_INODE_I_BLOCK_OFFSET)
 
-        offset += 16
-        self.ext4_super_block['s_def_hash_version'] = self.str2int_le(self.image[offset:offset+1])
+        #
+        # Extra fields exist only in inodes larger than 128 bytes
+        #
+        if self.ext4_super_block['s_inode_size'] > EXT4_INODE_ENTRY_SZ:
+            EXT4_INODE_EXTRA_LAYOUT.unpack_into(self.ext4_inode_table, self.image, offset + EXT4_INODE_ENTRY_SZ)
+        else:
+            for name in EXT4_INODE_EXTRA_LAYOUT.names:
+                self.ext4_inode_table[name] = 0
 
-        offset += 1
-        self.ext4_super_block['s_reserved_char_pad'] = self.str2int_le(self.image[offset:offset+1])
+    #
+    # Get summary of inode just parsed for inode index
+    #
+    def get_ext4_inode_summary(self, offset, inode = None):
+        if inode is None:
+            inode = self.ext4_inode_table
 
-        offset += 1
-        self.ext4_super_block['s_desc_size'] = self.str2int_le(self.image[offset:offset+2])
+        return {
+            'offset'        : offset,  # Offset of inode in image
+            'i_mode'        : inode['i_mode'],
+            'i_uid'         : (inode['l_i_uid_high'] << 16) + inode['i_uid'],
+            'i_gid'         : (inode['l_i_gid_high'] << 16) + inode['i_gid'],
+            'i_size'        : (inode['i_size_high'] << 32) + inode['i_size_lo'],
+            'i_links_count' : inode['i_links_count'],
+            'i_flags'       : inode['i_flags'],
+            'i_mtime'       : inode['i_mtime'],
+            }
 
-        offset += 2
-        self.ext4_super_block['s_default_mount_opts'] = self.str2int_le(self.image[offset:offset+4])
+    #
+    # Parse Ext4 extended attributes, especially for ACLs
+    #
+    def parse_ext4_xattr(self, offset):
+        EXT4_XATTR_HEADER_LAYOUT.unpack_into(self.ext4_xattr_header, self.image, offset)
 
-        offset += 4
-        self.ext4_super_block['s_first_meta_bg'] = self.str2int_le(self.image[offset:offset+4])
+        if self.ext4_xattr_header['h_magic'] != EXT4_XATTR_MAGIC:
+            return
 
-        offset += 4
-        self.ext4_super_block['s_mkfs_time'] = self.str2int_le(self.image[offset:offset+4])
+        offset += EXT4_XATTR_HEADER_LAYOUT.size
+        EXT4_XATTR_ENTRY_LAYOUT.unpack_into(self.ext4_xattr_entry, self.image, offset)
 
-        offset += 4
-        self.ext4_super_block['s_jnl_blocks'] = self.str2int_le(self.image[offset:offset+68])
-
-        offset += 68
-        self.ext4_super_block['s_blocks_count_hi'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_super_block['s_r_blocks_count_hi'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_super_block['s_free_blocks_count_hi'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_super_block['s_min_extra_isize'] = self.str2int_le(self.image[offset:offset+2])
-
-        offset += 2
-        self.ext4_super_block['s_want_extra_isize'] = self.str2int_le(self.image[offset:offset+2])
-
-        offset += 2
-        self.ext4_super_block['s_flags'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_super_block['s_raid_stride'] = self.str2int_le(self.image[offset:offset+2])
-
-        offset += 2
-        self.ext4_super_block['s_mmp_interval'] = self.str2int_le(self.image[offset:offset+2])
-
-        offset += 2
-        self.ext4_super_block['s_mmp_block'] = self.str2int_le(self.image[offset:offset+8])
-
-        offset += 8
-        self.ext4_super_block['s_raid_stripe_width'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_super_block['s_log_groups_per_flex'] = self.str2int_le(self.image[offset:offset+1])
-
-        offset += 1
-        self.ext4_super_block['s_reserved_char_pad2'] = self.str2int_le(self.image[offset:offset+1])
-
-        offset += 1
-        self.ext4_super_block['s_reserved_pad'] = self.str2int_le(self.image[offset:offset+2])
-
-        offset += 2
-        self.ext4_super_block['s_kbytes_written'] = self.str2int_le(self.image[offset:offset+8])
-
-        offset += 8
-        self.ext4_super_block['s_reserved'] = self.str2int_le(self.image[offset:offset+640])
+        offset += EXT4_XATTR_ENTRY_LAYOUT.size
+        self.ext4_xattr_entry['e_name'] = self.image[offset:offset+self.ext4_xattr_entry['e_name_len']] + '\x00'
 
         #
-        # Print Ext4 super block info
+        # Print Ext4 extended attributes info
         #
-        self.print_ext4_sb_info()
+        if is_pr_verb is True:
+            self.print_ext4_xattr_info()
 
     #
-    # Parse Ext4 block group descriptor internally
+    # Parse Ext4 directory entries internally
     #
-    def parse_ext4_bg_desc_internal(self, offset):
-        self.ext4_block_group_desc['bg_block_bitmap_lo'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_block_group_desc['bg_inode_bitmap_lo'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_block_group_desc['bg_inode_table_lo'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_block_group_desc['bg_free_blocks_count_lo'] = self.str2int_le(self.image[offset:offset+2])
-
-        offset += 2
-        self.ext4_block_group_desc['bg_free_inodes_count_lo'] = self.str2int_le(self.image[offset:offset+2])
-
-        offset += 2
-        self.ext4_block_group_desc['bg_used_dirs_count_lo'] = self.str2int_le(self.image[offset:offset+2])
-
-        offset += 2
-        self.ext4_block_group_desc['bg_flags'] = self.str2int_le(self.image[offset:offset+2])
-
-        offset += 2
-        self.ext4_block_group_desc['bg_exclude_bitmap_lo'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_block_group_desc['bg_reserved1'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_block_group_desc['bg_itable_unused_lo'] = self.str2int_le(self.image[offset:offset+2])
-
-        offset += 2
-        self.ext4_block_group_desc['bg_checksum'] = self.str2int_le(self.image[offset:offset+2])
-
-        if self.ext4_super_block['s_feature_incompat'] & EXT4_FEATURE_INCOMPAT['EXT4_FEATURE_INCOMPAT_64BIT'] != 0 and self.ext4_super_block['s_desc_size'] > 32:
-            offset += 2
-            self.ext4_block_group_desc['bg_block_bitmap_hi'] = self.str2int_le(self.image[offset:offset+4])
-
-            offset += 4
-            self.ext4_block_group_desc['bg_inode_bitmap_hi'] = self.str2int_le(self.image[offset:offset+4])
-
-            offset += 4
-            self.ext4_block_group_desc['bg_inode_table_hi'] = self.str2int_le(self.image[offset:offset+4])
-
-            offset += 4
-            self.ext4_block_group_desc['bg_free_blocks_count_hi'] = self.str2int_le(self.image[offset:offset+2])
-
-            offset += 2
-            self.ext4_block_group_desc['bg_free_inodes_count_hi'] = self.str2int_le(self.image[offset:offset+2])
-
-            offset += 2
-            self.ext4_block_group_desc['bg_used_dirs_count_hi'] = self.str2int_le(self.image[offset:offset+2])
-
-            offset += 2
-            self.ext4_block_group_desc['bg_itable_unused_hi'] = self.str2int_le(self.image[offset:offset+2])
+    def parse_ext4_dir_entry_internal(self, offset):
+        #
+        # Parse Ext4 linear directory entries, also leaf entries of htree
+        #
+        EXT4_DIR_ENTRY_2_LAYOUT.unpack_into(self.ext4_dir_entry_2, self.image, offset)
+        rec_len = self.ext4_dir_entry_2['rec_len']
 
-            offset += 2
-            self.ext4_block_group_desc['bg_exclude_bitmap_hi'] = self.str2int_le(self.image[offset:offset+4])
+        self.ext4_dir_entry_2['name'] = self.image[offset+EXT4_DIR_ENTRY_2_LAYOUT.size:offset+EXT4_DIR_ENTRY_2_LAYOUT.size+self.ext4_dir_entry_2['name_len']]
 
-            offset += 4
-            self.ext4_block_group_desc['bg_reserved2'] = self.str2int_le(self.image[offset:offset+4])
+        if self.ext4_inode_table['i_flags'] & EXT4_INODE_FLAGS['EXT4_INDEX_FL'] != 0:
+            #
+            # Parse Ext4 htree directory root, hidden behind '.' and '..' in first block
+            #
+            if self.ext4_dir_entry_2['name'] == ".":
+                self.parse_ext4_dx_root(offset)
 
-            offset += 4
-            self.ext4_block_group_desc['bg_reserved3'] = self.str2int_le(self.image[offset:offset+8])
+        return rec_len
 
     #
-    # Parse Ext4 extent tree
+    # Parse Ext4 htree directory root
     #
-    def parse_ext4_extent_tree(self, offset):
-        self.ext4_inode_table['i_block'] = self.str2int_le(self.image[offset:offset+60])
-
-        self.ext4_extent_header['eh_magic'] = self.str2int_le(self.image[offset:offset+2])
-
-        offset += 2
-        self.ext4_extent_header['eh_entries'] = self.str2int_le(self.image[offset:offset+2])
-
-        offset += 2
-        self.ext4_extent_header['eh_max'] = self.str2int_le(self.image[offset:offset+2])
-
-        offset += 2
-        self.ext4_extent_header['eh_depth'] = self.str2int_le(self.image[offset:offset+2])
+    def parse_ext4_dx_root(self, offset):
+        EXT4_DX_ROOT_LAYOUT.unpack_into(self.dx_root, self.image, offset)
 
-        offset += 2
-        self.ext4_extent_header['eh_generation'] = self.str2int_le(self.image[offset:offset+4])
-
-        for i in range(0, self.ext4_extent_header['eh_entries'], 1):
-            if self.ext4_extent_header['eh_depth'] > 0:
-                offset += 4
-                self.ext4_extent_idx['ei_block'] = self.str2int_le(self.image[offset:offset+4])
-
-                offset += 4
-                self.ext4_extent_idx['ei_leaf_lo'] = self.str2int_le(self.image[offset:offset+4])
-
-                offset += 4
-                self.ext4_extent_idx['ei_leaf_hi'] = self.str2int_le(self.image[offset:offset+2])
-
-                offset += 2
-                self.ext4_extent_idx['ei_unused'] = self.str2int_le(self.image[offset:offset+2])
-
-                #
-                # Parse Ext4 extent tree's leaf nodes
-                #
-                '''
-                Add code here
-                '''
-            elif self.ext4_extent_header['eh_depth'] == 0:
-                offset += 4
-                self.ext4_extent['ee_block'] = self.str2int_le(self.image[offset:offset+4])
-
-                offset += 4
-                self.ext4_extent['ee_len'] = self.str2int_le(self.image[offset:offset+2])
-
-                offset += 2
-                self.ext4_extent['ee_start_hi'] = self.str2int_le(self.image[offset:offset+2])
-
-                offset += 2
-                self.ext4_extent['ee_start_lo'] = self.str2int_le(self.image[offset:offset+4])
-            else:
-                pass
+        self.dx_root['entries'] = self.get_ext4_dx_entries(offset + EXT4_DX_ROOT_INFO_OFFSET + self.dx_root['info_length'])
 
     #
-    # Parse Ext4 inode in inode table internally
+    # Get 'dx_entry' array following 'limit' and 'count'
     #
-    def parse_ext4_bg_inode_internal(self, offset):
-        self.ext4_inode_table['i_mode'] = self.str2int_le(self.image[offset:offset+2])
-
-        offset += 2
-        self.ext4_inode_table['i_uid'] = self.str2int_le(self.image[offset:offset+2])
-
-        offset += 2
-        self.ext4_inode_table['i_size_lo'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_inode_table['i_atime'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_inode_table['i_ctime'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_inode_table['i_mtime'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_inode_table['i_dtime'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_inode_table['i_gid'] = self.str2int_le(self.image[offset:offset+2])
-
-        offset += 2
-        self.ext4_inode_table['i_links_count'] = self.str2int_le(self.image[offset:offset+2])
-
-        offset += 2
-        self.ext4_inode_table['i_blocks_lo'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_inode_table['i_flags'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_inode_table['l_i_version'] = self.str2int_le(self.image[offset:offset+4])
-
-        #
-        # Parse Ext4 extent tree
-        #
-        # 'EXT4_FEATURE_INCOMPAT['EXT4_FEATURE_INCOMPAT_EXTENTS']' MUST set for Ext4
-        #
-        offset += 4
-        self.parse_ext4_extent_tree(offset)
-
-        offset += 60
-        self.ext4_inode_table['i_generation'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_inode_table['i_file_acl_lo'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_inode_table['i_size_high'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_inode_table['i_obso_faddr'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_inode_table['l_i_blocks_high'] = self.str2int_le(self.image[offset:offset+2])
-
-        offset += 2
-        self.ext4_inode_table['l_i_file_acl_high'] = self.str2int_le(self.image[offset:offset+2])
-
-        offset += 2
-        self.ext4_inode_table['l_i_uid_high'] = self.str2int_le(self.image[offset:offset+2])
-
-        offset += 2
-        self.ext4_inode_table['l_i_gid_high'] = self.str2int_le(self.image[offset:offset+2])
-
-        offset += 2
-        self.ext4_inode_table['l_i_reserved2'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_inode_table['i_extra_isize'] = self.str2int_le(self.image[offset:offset+2])
-
-        offset += 2
-        self.ext4_inode_table['i_pad1'] = self.str2int_le(self.image[offset:offset+2])
+    # Entry is tuple of (hash, block), hash of first entry is 0 since its place holds 'limit' and 'count'
+    #
+    def get_ext4_dx_entries(self, offset):
+        limit, count = ext4_unpack_from(EXT4_DX_COUNTLIMIT_STRUCT, self.image, offset)
+        count = min(count, limit)
 
-        offset += 2
-        self.ext4_inode_table['i_ctime_extra'] = self.str2int_le(self.image[offset:offset+4])
+        if count == 0:
+            return []
 
-        offset += 4
-        self.ext4_inode_table['i_mtime_extra'] = self.str2int_le(self.image[offset:offset+4])
+        values = ext4_unpack_from(get_ext4_array_struct('I', count * 2), self.image, offset)
 
-        offset += 4
-        self.ext4_inode_table['i_atime_extra'] = self.str2int_le(self.image[offset:offset+4])
+        entries = [(0, values[1] & EXT4_DX_BLOCK_MASK)]
+        for i in range(1, count, 1):
+            entries.append((values[i * 2], values[i * 2 + 1] & EXT4_DX_BLOCK_MASK))
 
-        offset += 4
-        self.ext4_inode_table['i_crtime'] = self.str2int_le(self.image[offset:offset+4])
+        return entries
 
-        offset += 4
-        self.ext4_inode_table['i_crtime_extra'] = self.str2int_le(self.image[offset:offset+4])
+    #
+    # Parse Ext4 journal
+    #
+    def parse_ext4_journal(self, inode_index):
+        pass
 
-        offset += 4
-        self.ext4_inode_table['i_version_hi'] = self.str2int_le(self.image[offset:offset+4])
+        if is_pr_verb is True:
+            self.print_ext4_journal_info(inode_index)
 
     #
-    # Parse Ext4 extended attributes, especially for ACLs
+    # Parse Ext4 directory entries
     #
-    def parse_ext4_xattr(self, offset):
-        self.ext4_xattr_header['h_magic'] = self.str2int_le(self.image[offset:offset+4])
-
-        if self.ext4_xattr_header['h_magic'] != EXT4_XATTR_MAGIC:
+    def parse_ext4_dir_entry(self, inode_index):
+        if (self.ext4_inode_table['i_mode'] & 0xF000) != EXT4_INODE_MODE['S_IFDIR']:
             return
 
-        offset += 4
-        self.ext4_xattr_header['h_refcount'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_xattr_header['h_blocks'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_xattr_header['h_hash'] = self.str2int_le(self.image[offset:offset+4])
+        for ee_block, ee_len, ee_start, ee_uninit in self.get_ext4_extent_map(inode_index + 1):
+            if ee_uninit is True:
+                continue
 
-        offset += 4
-        self.ext4_xattr_header['h_reserved'] = self.str2int_le(self.image[offset:offset+16])
+            offset = ee_start * self.ext4_block_sz
+            length = ee_len * self.ext4_block_sz
 
-        offset += 16
-        self.ext4_xattr_entry['e_name_len'] = self.str2int_le(self.image[offset:offset+1])
+            i = 0
+            while i < length:
+                dent_len = self.parse_ext4_dir_entry_internal(offset + i)
 
-        offset += 1
-        self.ext4_xattr_entry['e_name_index'] = self.str2int_le(self.image[offset:offset+1])
+                if is_pr_verb is True:
+                    if self.ext4_dir_entry_2['inode'] != 0:
+                        self.print_ext4_linear_dir_entry_info(inode_index)
 
-        offset += 1
-        self.ext4_xattr_entry['e_value_offs'] = self.str2int_le(self.image[offset:offset+2])
-
-        offset += 2
-        self.ext4_xattr_entry['e_value_block'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_xattr_entry['e_value_size'] = self.str2int_le(self.image[offset:offset+4])
-
-        offset += 4
-        self.ext4_xattr_entry['e_hash'] = self.str2int_le(self.image[offset:offset+4])
+                    if self.ext4_inode_table['i_flags'] & EXT4_INODE_FLAGS['EXT4_INDEX_FL'] != 0:
+                        if self.ext4_dir_entry_2['name'] == "." and self.dx_root['dot_inode'] != 0:
+                            self.print_ext4_htree_dir_entry_info(inode_index)
 
-        offset += 4
-        self.ext4_xattr_entry['e_name'] = self.image[offset:offset+self.ext4_xattr_entry['e_name_len']] + '\x00'
+                #
+                # Stop at corrupted directory entry
+                #
+                if dent_len == 0:
+                    break
 
-        #
-        # Print Ext4 extended attributes info
-        #
-        if is_pr_verb is True:
-            self.print_ext4_xattr_info()
+                i += dent_len
 
     #
-    # Parse Ext4 directory entries internally
+    # Check if block group descriptors have checksum, then 'bg_flags' and 'bg_itable_unused' are valid
     #
-    def parse_ext4_dir_entry_internal(self, offset):
-        rec_len = 0
+    def is_ext4_bg_desc_has_csum(self):
+        csum = EXT4_FEATURE_RO_COMPAT['EXT4_FEATURE_RO_COMPAT_GDT_CSUM'] | EXT4_FEATURE_RO_COMPAT['EXT4_FEATURE_RO_COMPAT_METADATA_CSUM']
 
-        if self.ext4_inode_table['i_flags'] & EXT4_INODE_FLAGS['EXT4_INDEX_FL'] != 0:
-            #
-            # Parse Ext4 htree directory entries
-            #
-            '''
-            Add code here
-            '''
-        else:
-            #
-            # Parse Ext4 linear directory entries
-            #
-            self.ext4_dir_entry_2['inode'] = self.str2int_le(self.image[offset:offset+4])
+        return self.ext4_super_block['s_feature_ro_compat'] & csum != 0
 
-            offset += 4
-            self.ext4_dir_entry_2['rec_len'] = self.str2int_le(self.image[offset:offset+2])
-            rec_len = self.ext4_dir_entry_2['rec_len']
+    #
+    # Get indexes of inodes in use in inode table of block group, from its inode bitmap
+    #
+    # Bitmap is scanned 64 bits at a time, zero words skipped and set bits
+    # of other words picked lowest first
+    #
+    def get_ext4_bg_inodes_used(self, bg_num):
+        desc = self.ext4_bg_desc_list[bg_num]
+        length = self.ext4_super_block['s_inodes_per_group']
 
-            offset += 2
-            self.ext4_dir_entry_2['name_len'] = self.str2int_le(self.image[offset:offset+1])
+        if self.is_ext4_bg_desc_has_csum() is True:
+            if desc['bg_flags'] & EXT4_BG_FLAGS['EXT2_BG_INODE_UNINIT'] != 0:
+                return []
 
-            offset += 1
-            self.ext4_dir_entry_2['file_type'] = self.str2int_le(self.image[offset:offset+1])
+            length -= (desc['bg_itable_unused_hi'] << 16) + desc['bg_itable_unused_lo']
 
-            offset += 1
-            self.ext4_dir_entry_2['name'] = self.image[offset:offset+self.ext4_dir_entry_2['name_len']]
+        if length <= 0:
+            return []
 
-        return rec_len
+        offset = ((desc['bg_inode_bitmap_hi'] << 32) + desc['bg_inode_bitmap_lo']) * self.ext4_block_sz
+        words = ext4_unpack_from(get_ext4_array_struct('Q', (length + 63) / 64), self.image, offset)
 
-    #
-    # Parse Ext4 journal
-    #
-    def parse_ext4_journal(self, inode_index):
-        pass
-
-        if is_pr_verb is True:
-            self.print_ext4_journal_info(inode_index)
+        used = []
 
-    #
-    # Parse Ext4 directory entries
-    #
-    def parse_ext4_dir_entry(self, inode_index):
-        offset = ((self.ext4_extent['ee_start_hi'] << 32) + self.ext4_extent['ee_start_lo']) * EXT4_BLOCK_SZ
-        length = self.ext4_extent['ee_len'] * EXT4_BLOCK_SZ
+        for i in range(0, len(words), 1):
+            w = words[i]
 
-        i = 0
-        while i < length:
-            dent_len = self.parse_ext4_dir_entry_internal(offset + i)
+            while w != 0:
+                bit = w & -w
+                used.append(i * 64 + bit.bit_length() - 1)
+                w ^= bit
 
-            if is_pr_verb is True:
-                if (self.ext4_inode_table['i_mode'] & 0xF000) == EXT4_INODE_MODE['S_IFDIR']:
-                    if self.ext4_inode_table['i_flags'] & EXT4_INODE_FLAGS['EXT4_INDEX_FL'] != 0:
-                        if self.dx_root['dot_inode'] != 0:
-                            self.print_ext4_htree_dir_entry_info(inode_index)
-                    else:
-                        if self.ext4_dir_entry_2['inode'] != 0:
-                            self.print_ext4_linear_dir_entry_info(inode_index)
+        while len(used) > 0 and used[-1] >= length:
+            used.pop()
 
-            i += dent_len
+        return used
 
     #
     # Parse Ext4 inode in inode table
     #
     def parse_ext4_bg_inode(self, bg_num):
-        offset = ((self.ext4_block_group_desc['bg_inode_table_hi'] << 32) + self.ext4_block_group_desc['bg_inode_table_lo']) * EXT4_BLOCK_SZ
+        desc = self.ext4_bg_desc_list[bg_num]
+        self.ext4_block_group_desc = desc
 
-        length = self.ext4_super_block['s_inodes_per_group'] - ((self.ext4_block_group_desc['bg_free_inodes_count_hi'] << 32) + self.ext4_block_group_desc['bg_free_inodes_count_lo'])
+        offset = ((desc['bg_inode_table_hi'] << 32) + desc['bg_inode_table_lo']) * self.ext4_block_sz
 
-        for i in range(0, length, 1):
+        for i in self.get_ext4_bg_inodes_used(bg_num):
             inode_index = (bg_num * self.ext4_super_block['s_inodes_per_group']) + i
+            inode_offset = offset + i * self.ext4_super_block['s_inode_size']
+
+            self.parse_ext4_bg_inode_internal(inode_offset)
 
-            self.parse_ext4_bg_inode_internal(offset + i * self.ext4_super_block['s_inode_size'])
+            #
+            # Add inode in use to inode index
+            #
+            if self.ext4_inode_table['i_mode'] != 0:
+                self.ext4_inode_index[inode_index + 1] = self.get_ext4_inode_summary(inode_offset)
 
             #
             # Parse Ext4 extended attributes, especially for ACLs
             #
-            self.parse_ext4_xattr(offset + EXT4_INODE_ENTRY_SZ + self.ext4_inode_table['i_extra_isize'] + i * self.ext4_super_block['s_inode_size'])
+            self.parse_ext4_xattr(inode_offset + EXT4_INODE_ENTRY_SZ + self.ext4_inode_table['i_extra_isize'])
 
             #
             # Print Ext4 inode info in inode table
@@ -1463,7 +1985,7 @@ class Ext4Parser(object):
             #
             # Parse Ext4 directory entries, journal inode igored
             #
-            if self.ext4_extent_header['eh_magic'] == EXT4_EXTENT_TREE_MAGIC and self.ext4_extent_header['eh_depth'] == 0:
+            if self.ext4_extent_header['eh_magic'] == EXT4_EXTENT_TREE_MAGIC:
                 if (inode_index + 1) == EXT4_JOURNAL_INO:
                     self.parse_ext4_journal(inode_index)
                 else:
@@ -1472,37 +1994,22 @@ class Ext4Parser(object):
     #
     # Parse Ext4 block group descriptor
     #
+    # All descriptors are read from the primary group descriptor table,
+    # which follows the super block in block group #0
+    #
     def parse_ext4_bg_desc(self, bg_num):
-        blocks_per_group = self.ext4_super_block['s_blocks_per_group']
+        offset = (self.ext4_super_block['s_first_data_block'] + self.get_sb_blocks()) * self.ext4_block_sz
 
-        if self.is_ext4_bg_has_sb(bg_num) is True:
-            if bg_num == 0:
-                #
-                # Offset = Super Block Size (Group 0 Padding is included)
-                #
-                offset = self.get_sb_blocks() * EXT4_BLOCK_SZ
-            else:
-                #
-                # Offset = Super Block Size
-                #
-                offset = (bg_num * blocks_per_group + self.get_sb_blocks()) * EXT4_BLOCK_SZ
-        else:
-            offset = bg_num * blocks_per_group * EXT4_BLOCK_SZ
-
-        bg_count = self.get_bg_count()
+        return self.parse_ext4_bg_desc_internal(offset + bg_num * self.get_bg_desc_sz())
 
-        for i in range(0, bg_count, 1):
-            self.parse_ext4_bg_desc_internal(offset + i * self.ext4_super_block['s_desc_size'])
+    #
+    # Parse Ext4 block group descriptor, one record per block group
+    #
+    def parse_ext4_bg_desc_list(self):
+        self.ext4_bg_desc_list = []
 
-            #
-            # Print Ext4 block group descriptor info according to block group #0
-            #
-            self.print_ext4_bg_desc_info(i)
-
-            #
-            # Parse Ext4 inode in inode table
-            #
-            self.parse_ext4_bg_inode(i)
+        for i in range(0, self.get_bg_count(), 1):
+            self.ext4_bg_desc_list.append(self.parse_ext4_bg_desc(i))
 
     #
     # Parse Ext4 block group
@@ -1510,12 +2017,46 @@ class Ext4Parser(object):
     def parse_ext4_bg(self):
         bg_count = self.get_bg_count()
 
-        for i in range(0, bg_count, 1):
-            #
-            # Parse Ext4 block group descriptor according to block group #0
-            #
-            if i == 0:
-                self.parse_ext4_bg_desc(i)
+        self.parse_ext4_bg_desc_list()
+
+        #
+        # Parse Ext4 inode in inode table of each block group
+        #
+        if self.jobs > 1 and bg_count > 1:
+            self.parse_ext4_bg_inode_pool(bg_count)
+        else:
+            for i in range(0, bg_count, 1):
+                self.ext4_block_group_desc = self.ext4_bg_desc_list[i]
+                self.print_ext4_bg_desc_info(i)
+
+                self.parse_ext4_bg_inode(i)
+
+    #
+    # Parse Ext4 inode in inode table of block groups with process pool
+    #
+    # Workers are forked with the image mapped, so they share its pages
+    # with each other. Output of each block group is printed in order.
+    #
+    def parse_ext4_bg_inode_pool(self, bg_count):
+        global ext4_pool_parser
+
+        ext4_pool_parser = self
+
+        pool = multiprocessing.Pool(min(self.jobs, bg_count))
+
+        try:
+            for bg_num, inode_index, output in pool.imap(parse_ext4_bg_inode_worker, range(0, bg_count, 1)):
+                self.ext4_block_group_desc = self.ext4_bg_desc_list[bg_num]
+                self.print_ext4_bg_desc_info(bg_num)
+
+                sys.stdout.write(output)
+
+                self.ext4_inode_index.update(inode_index)
+        finally:
+            pool.close()
+            pool.join()
+
+            ext4_pool_parser = None
 
     #
     # Print Ext4 super block info
@@ -1697,9 +2238,9 @@ class Ext4Parser(object):
         print("Block bitmap at           : " + str((self.ext4_block_group_desc['bg_block_bitmap_hi'] << 32) + self.ext4_block_group_desc['bg_block_bitmap_lo']))
         print("Inode bitmap at           : " + str((self.ext4_block_group_desc['bg_inode_bitmap_hi'] << 32) + self.ext4_block_group_desc['bg_inode_bitmap_lo']))
         print("Inode table at            : " + str((self.ext4_block_group_desc['bg_inode_table_hi'] << 32) + self.ext4_block_group_desc['bg_inode_table_lo']))
-        print("Free blocks count         : " + str((self.ext4_block_group_desc['bg_free_blocks_count_hi'] << 32) + self.ext4_block_group_desc['bg_free_blocks_count_lo']))
-        print("Free inodes count         : " + str((self.ext4_block_group_desc['bg_free_inodes_count_hi'] << 32) + self.ext4_block_group_desc['bg_free_inodes_count_lo']))
-        print("Used directories count    : " + str((self.ext4_block_group_desc['bg_used_dirs_count_hi'] << 32) + self.ext4_block_group_desc['bg_used_dirs_count_lo']))
+        print("Free blocks count         : " + str((self.ext4_block_group_desc['bg_free_blocks_count_hi'] << 16) + self.ext4_block_group_desc['bg_free_blocks_count_lo']))
+        print("Free inodes count         : " + str((self.ext4_block_group_desc['bg_free_inodes_count_hi'] << 16) + self.ext4_block_group_desc['bg_free_inodes_count_lo']))
+        print("Used directories count    : " + str((self.ext4_block_group_desc['bg_used_dirs_count_hi'] << 16) + self.ext4_block_group_desc['bg_used_dirs_count_lo']))
 
         bg_flags = ""
         for k, v in EXT4_BG_FLAGS.items():
@@ -1709,7 +2250,7 @@ class Ext4Parser(object):
         print("Block group flags         : " + bg_flags)
 
         print("Exclusion bitmap at       : " + str((self.ext4_block_group_desc['bg_exclude_bitmap_hi'] << 32) + self.ext4_block_group_desc['bg_exclude_bitmap_lo']))
-        print("Unused inode count        : " + str((self.ext4_block_group_desc['bg_itable_unused_hi'] << 32) + self.ext4_block_group_desc['bg_itable_unused_lo']))
+        print("Unused inode count        : " + str((self.ext4_block_group_desc['bg_itable_unused_hi'] << 16) + self.ext4_block_group_desc['bg_itable_unused_lo']))
         print("Group descriptor checksum : " + str(self.ext4_block_group_desc['bg_checksum']))
 
     #
@@ -1824,7 +2365,26 @@ class Ext4Parser(object):
     # Print Ext4 hash tree directory entries info
     #
     def print_ext4_htree_dir_entry_info(self, inode_index):
-        pass
+        s = lambda x : x == "" and "n/a" or x
+
+        print("\n----------------------------------------")
+        print("Hash tree root of directory inode #%d" % (inode_index + 1))
+
+        hash_version = ""
+        for k, v in EXT4_HASH_VERSION.items():
+            if v == self.dx_root['hash_version']:
+                hash_version = k
+                break
+        hash_version = s(hash_version)
+        print("Hash version         : " + hash_version)
+
+        print("Tree info length     : " + str(self.dx_root['info_length']))
+        print("Indirect levels      : " + str(self.dx_root['indirect_levels']))
+        print("Max index entries    : " + str(self.dx_root['limit']))
+        print("Index entries        : " + str(self.dx_root['count']))
+
+        for h, block in self.dx_root['entries']:
+            print("  Hash 0x%08X -> block %d" % (h, block))
 
     #
     # Print Ext4 journal info
@@ -1832,6 +2392,12 @@ class Ext4Parser(object):
     def print_ext4_journal_info(self, inode_index):
         pass
 
+    #
+    # Get Ext4 inode index
+    #
+    def get_inode_index(self):
+        return self.ext4_inode_index
+
     #
     # Run routine
     #
@@ -1856,28 +2422,595 @@ class Ext4Parser(object):
         #
         self.parse_ext4_bg()
 
+    #
+    # Get Ext4 inode by inode number, without touching parsed inode
+    #
+    def get_ext4_inode(self, inode_num):
+        offset = self.get_ext4_inode_offset(inode_num)
+        if offset < 0:
+            return None
+
+        inode = dict(zip(EXT4_INODE_LAYOUT.names, EXT4_INODE_LAYOUT.unpack_from(self.image, offset)))
+        inode['offset'] = offset
+        inode['i_size'] = (inode['i_size_high'] << 32) + inode['i_size_lo']
+
+        return inode
+
+    #
+    # Get Ext4 directory entries by inode number of directory
+    #
+    # Directory entry is tuple of (name, inode number, file type), '.' and '..' excluded.
+    # Blocks of hash tree directory are walked as linear, since 'dx_root' and 'dx_node'
+    # are hidden in fake directory entries.
+    #
+    def get_ext4_dir_entries(self, inode_num):
+        dentries = []
+
+        for ee_block, ee_len, ee_start, ee_uninit in self.get_ext4_extent_map(inode_num):
+            if ee_uninit is True:
+                continue
+
+            offset = ee_start * self.ext4_block_sz
+            end = offset + ee_len * self.ext4_block_sz
+
+            while offset < end:
+                inode, rec_len, name_len, file_type = EXT4_DIR_ENTRY_2_LAYOUT.unpack_from(self.image, offset)
+
+                if rec_len < EXT4_DIR_ENTRY_2_LAYOUT.size:
+                    break
+
+                if inode != 0:
+                    name = self.image[offset+EXT4_DIR_ENTRY_2_LAYOUT.size:offset+EXT4_DIR_ENTRY_2_LAYOUT.size+name_len]
+                    if name != "." and name != "..":
+                        dentries.append((name, inode, file_type))
+
+                offset += rec_len
+
+        return dentries
+
+    #
+    # Get physical block of logical block in file, -1 for hole
+    #
+    def get_ext4_file_block(self, inode_num, lblk):
+        extents = self.get_ext4_extent_map(inode_num)
+
+        i = bisect.bisect_right(extents, (lblk, EXT4_EXT_INIT_MAX_LEN * 2)) - 1
+        if i < 0:
+            return -1
+
+        ee_block, ee_len, ee_start, ee_uninit = extents[i]
+        if ee_uninit is True or lblk >= ee_block + ee_len:
+            return -1
+
+        return ee_start + lblk - ee_block
+
+    #
+    # Find Ext4 directory entry by name in one directory block
+    #
+    def find_ext4_dir_entry_in_block(self, block, name):
+        offset = block * self.ext4_block_sz
+        end = offset + self.ext4_block_sz
+
+        while offset < end:
+            inode, rec_len, name_len, file_type = EXT4_DIR_ENTRY_2_LAYOUT.unpack_from(self.image, offset)
+
+            if rec_len < EXT4_DIR_ENTRY_2_LAYOUT.size:
+                break
+
+            if inode != 0 and name_len == len(name):
+                if self.image[offset+EXT4_DIR_ENTRY_2_LAYOUT.size:offset+EXT4_DIR_ENTRY_2_LAYOUT.size+name_len] == name:
+                    return (name, inode, file_type)
+
+            offset += rec_len
+
+        return None
+
+    #
+    # Look up Ext4 htree directory entry by name
+    #
+    # Only index blocks on the path and the leaf block of hash are read. False is returned
+    # if htree is unusable, so caller falls back to linear lookup.
+    #
+    def lookup_ext4_dx_dir_entry(self, inode_num, name):
+        block = self.get_ext4_file_block(inode_num, 0)
+        if block < 0:
+            return False
+
+        root = dict(zip(EXT4_DX_ROOT_LAYOUT.names, EXT4_DX_ROOT_LAYOUT.unpack_from(self.image, block * self.ext4_block_sz)))
+
+        if root['reserved_zero'] != 0 or root['indirect_levels'] >= EXT4_HTREE_LEVEL or root['unused_flags'] & 0x1 != 0:
+            return False
+
+        hash_version = root['hash_version']
+        if hash_version <= EXT4_HASH_VERSION['DX_HASH_TEA'] and self.ext4_super_block['s_flags'] & EXT4_MISC_FLAGS['EXT2_FLAGS_UNSIGNED_HASH'] != 0:
+            hash_version += EXT4_HASH_VERSION['DX_HASH_LEGACY_UNSIGNED']
+
+        seed = [(self.ext4_super_block['s_hash_seed'] >> (i * 32)) & 0xFFFFFFFF for i in range(0, 4, 1)]
+        h = ext4_dirhash(name, hash_version, seed)[0]
+
+        #
+        # Walk down index nodes to leaf block
+        #
+        # Frame of each level is [entries, index of entry walked into]
+        #
+        entries = self.get_ext4_dx_entries(block * self.ext4_block_sz + EXT4_DX_ROOT_INFO_OFFSET + root['info_length'])
+        frames = []
+
+        for level in range(0, root['indirect_levels'] + 1, 1):
+            if len(entries) == 0:
+                return False
+
+            i = bisect.bisect_right([e[0] for e in entries], h) - 1
+            frames.append([entries, i])
+
+            block = self.get_ext4_file_block(inode_num, entries[i][1])
+            if block < 0:
+                return False
+
+            if level < root['indirect_levels']:
+                entries = self.get_ext4_dx_entries(block * self.ext4_block_sz + EXT4_DX_NODE_LIMIT_OFFSET)
+
+        while True:
+            dentry = self.find_ext4_dir_entry_in_block(block, name)
+            if dentry is not None:
+                return dentry
+
+            #
+            # Names of colliding hash continue in next leaf block, marked by low bit of hash
+            #
+            # Step up to the nearest level with entry left, then down to first leaf under it,
+            # as ext4_htree_next_block() in Linux kernel
+            #
+            level = len(frames) - 1
+            while level >= 0 and frames[level][1] + 1 >= len(frames[level][0]):
+                level -= 1
+
+            if level < 0:
+                return None
+
+            frames[level][1] += 1
+            entries, i = frames[level]
+
+            if entries[i][0] & 0x1 == 0 or (entries[i][0] & ~0x1) != h:
+                return None
+
+            block = self.get_ext4_file_block(inode_num, entries[i][1])
+            if block < 0:
+                return None
+
+            for level in range(level + 1, len(frames), 1):
+                entries = self.get_ext4_dx_entries(block * self.ext4_block_sz + EXT4_DX_NODE_LIMIT_OFFSET)
+                if len(entries) == 0:
+                    return False
+
+                frames[level] = [entries, 0]
+
+                block = self.get_ext4_file_block(inode_num, entries[0][1])
+                if block < 0:
+                    return None
+
+    #
+    # Look up Ext4 directory entry by name, return tuple of (name, inode number, file type) or None
+    #
+    def lookup_ext4_dir_entry(self, inode_num, name):
+        inode = self.get_ext4_inode(inode_num)
+        if inode is None or (inode['i_mode'] & 0xF000) != EXT4_INODE_MODE['S_IFDIR']:
+            return None
+
+        if inode['i_flags'] & EXT4_INODE_FLAGS['EXT4_INDEX_FL'] != 0:
+            dentry = self.lookup_ext4_dx_dir_entry(inode_num, name)
+            if dentry is not False:
+                return dentry
+
+        for dentry in self.get_ext4_dir_entries(inode_num):
+            if dentry[0] == name:
+                return dentry
+
+        return None
+
+    #
+    # Dump Ext4 regular file to path
+    #
+    # Data is copied extent by extent in chunks, holes and uninitialized extents are skipped by seeking
+    #
+    def dump_ext4_file(self, inode_num, inode, path):
+        fp = open(path, "wb")
+
+        try:
+            for ee_block, ee_len, ee_start, ee_uninit in self.get_ext4_extent_map(inode_num):
+                pos = ee_block * self.ext4_block_sz
+                if ee_uninit is True or pos >= inode['i_size']:
+                    continue
+
+                offset = ee_start * self.ext4_block_sz
+                length = min(ee_len * self.ext4_block_sz, inode['i_size'] - pos)
+
+                fp.seek(pos)
+
+                i = 0
+                while i < length:
+                    n = min(EXT4_DUMP_CHUNK_SZ, length - i)
+                    fp.write(self.image[offset+i:offset+i+n])
+                    i += n
+
+            fp.truncate(inode['i_size'])
+        finally:
+            fp.close()
+
+    #
+    # Dump Ext4 symbolic link to path
+    #
+    def dump_ext4_symlink(self, inode_num, inode, path):
+        if inode['i_flags'] & EXT4_INODE_FLAGS['EXT4_EXTENTS_FL'] == 0:
+            #
+            # Fast symbolic link, target stored in 'i_block'
+            #
+            offset = inode['offset'] + EXT4_INODE_I_BLOCK_OFFSET
+            target = self.image[offset:offset+inode['i_size']]
+        else:
+            target = ""
+            for ee_block, ee_len, ee_start, ee_uninit in self.get_ext4_extent_map(inode_num):
+                offset = ee_start * self.ext4_block_sz
+                target += self.image[offset:offset+ee_len*self.ext4_block_sz]
+            target = target[0:inode['i_size']]
+
+        os.symlink(target, path)
+
+    #
+    # Load Ext4 super block and block group descriptors only, enough for path access
+    #
+    def load(self):
+        if self.is_ext4_has_magic_sig() is False:
+            return False
+
+        self.parse_ext4_sb_internal(EXT4_GROUP_0_PAD_SZ)
+        self.parse_ext4_bg_desc_list()
+
+        return True
+
+    #
+    # Resolve path in Ext4 image to inode number
+    #
+    # Paths are resolved component by component from the longest cached parent, each
+    # component looked up by name in its directory. Symbolic links are followed.
+    #
+    def resolve(self, path, links = 0):
+        if len(self.ext4_bg_desc_list) == 0 and self.load() is False:
+            raise IOError(errno.EINVAL, "Invalid Ext4 image")
+
+        path = os.path.normpath("/" + path).replace("//", "/")
+
+        if path in self.ext4_dentry_cache:
+            return self.ext4_dentry_cache[path]
+
+        parent, name = os.path.split(path)
+        inode_num = self.resolve(parent, links)
+
+        dentry = self.lookup_ext4_dir_entry(inode_num, name)
+        if dentry is None:
+            inode = self.get_ext4_inode(inode_num)
+            if (inode['i_mode'] & 0xF000) != EXT4_INODE_MODE['S_IFDIR']:
+                raise OSError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), parent)
+            raise OSError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+
+        inode_num = dentry[1]
+
+        inode = self.get_ext4_inode(inode_num)
+        if inode is not None and (inode['i_mode'] & 0xF000) == EXT4_INODE_MODE['S_IFLNK']:
+            if links >= EXT4_MAX_SYMLINKS:
+                raise OSError(errno.ELOOP, os.strerror(errno.ELOOP), path)
+
+            target = self.readlink(path)
+            if target.startswith("/") is False:
+                target = os.path.join(parent, target)
+
+            #
+            # Symbolic link is never cached, so its target is resolved on each access
+            #
+            return self.resolve(target, links + 1)
+
+        self.ext4_dentry_cache[path] = inode_num
+
+        return inode_num
+
+    #
+    # Get target of symbolic link in Ext4 image
+    #
+    def readlink(self, path):
+        parent, name = os.path.split(os.path.normpath("/" + path))
+
+        dentry = self.lookup_ext4_dir_entry(self.resolve(parent), name)
+        if dentry is None:
+            raise OSError(errno.ENOENT, os.strerror(errno.ENOENT), path)
+
+        inode = self.get_ext4_inode(dentry[1])
+        if (inode['i_mode'] & 0xF000) != EXT4_INODE_MODE['S_IFLNK']:
+            raise OSError(errno.EINVAL, os.strerror(errno.EINVAL), path)
+
+        if inode['i_flags'] & EXT4_INODE_FLAGS['EXT4_EXTENTS_FL'] == 0:
+            offset = inode['offset'] + EXT4_INODE_I_BLOCK_OFFSET
+            return self.image[offset:offset+inode['i_size']]
+
+        return Ext4File(self, dentry[1], inode).read()
+
+    #
+    # Get inode summary of path in Ext4 image, symbolic links followed
+    #
+    def stat(self, path):
+        inode_num = self.resolve(path)
+
+        inode = self.get_ext4_inode(inode_num)
+        summary = self.get_ext4_inode_summary(inode['offset'], inode)
+        summary['inode'] = inode_num
+        summary['i_atime'] = inode['i_atime']
+        summary['i_ctime'] = inode['i_ctime']
+
+        return summary
+
+    #
+    # List names in directory of path in Ext4 image
+    #
+    def listdir(self, path):
+        inode_num = self.resolve(path)
+
+        inode = self.get_ext4_inode(inode_num)
+        if (inode['i_mode'] & 0xF000) != EXT4_INODE_MODE['S_IFDIR']:
+            raise OSError(errno.ENOTDIR, os.strerror(errno.ENOTDIR), path)
+
+        return [dentry[0] for dentry in self.get_ext4_dir_entries(inode_num)]
+
+    #
+    # Open regular file of path in Ext4 image for reading
+    #
+    def open(self, path):
+        inode_num = self.resolve(path)
+
+        inode = self.get_ext4_inode(inode_num)
+        if (inode['i_mode'] & 0xF000) == EXT4_INODE_MODE['S_IFDIR']:
+            raise IOError(errno.EISDIR, os.strerror(errno.EISDIR), path)
+
+        return Ext4File(self, inode_num, inode, path)
+
     #
     # Dump Ext4 image file to directory
     #
     def dumpto(self, dumpdir):
+        root_dir = os.path.join(os.getcwd(), dumpdir)
+
+        try:
+            if os.path.isdir(root_dir) is False:
+                os.makedirs(root_dir)
+        except OSError, err:
+            print("ERROR: " + str(err))
+            return False
+
+        #
+        # Walk directory tree from root inode, paths of dumped inodes kept for hard links
+        #
+        dumped = {EXT4_ROOT_INO : root_dir}
+        dirs = [(EXT4_ROOT_INO, root_dir)]
+        stack = [(EXT4_ROOT_INO, root_dir)]
+
+        while len(stack) > 0:
+            dir_inode_num, dir_path = stack.pop()
+
+            for name, inode_num, file_type in self.get_ext4_dir_entries(dir_inode_num):
+                path = os.path.join(dir_path, name)
+
+                inode = self.get_ext4_inode(inode_num)
+                if inode is None:
+                    continue
+
+                mode = inode['i_mode'] & 0xF000
+
+                try:
+                    if mode == EXT4_INODE_MODE['S_IFDIR']:
+                        if inode_num in dumped:
+                            continue
+
+                        if os.path.isdir(path) is False:
+                            os.mkdir(path)
+
+                        dumped[inode_num] = path
+                        dirs.append((inode_num, path))
+                        stack.append((inode_num, path))
+                        continue
+                    elif inode_num in dumped:
+                        os.link(dumped[inode_num], path)
+                        continue
+                    elif mode == EXT4_INODE_MODE['S_IFREG']:
+                        self.dump_ext4_file(inode_num, inode, path)
+                    elif mode == EXT4_INODE_MODE['S_IFLNK']:
+                        self.dump_ext4_symlink(inode_num, inode, path)
+                        dumped[inode_num] = path
+                        continue
+                    else:
+                        #
+                        # Device, FIFO and socket files ignored
+                        #
+                        continue
+
+                    os.chmod(path, inode['i_mode'] & 0xFFF)
+                    os.utime(path, (inode['i_atime'], inode['i_mtime']))
+                except (OSError, IOError), err:
+                    print("ERROR: " + str(err))
+                    return False
+
+                dumped[inode_num] = path
+
+        #
+        # Set directory attributes after all files in it dumped
+        #
+        for inode_num, path in reversed(dirs):
+            inode = self.get_ext4_inode(inode_num)
+
+            try:
+                os.chmod(path, inode['i_mode'] & 0xFFF)
+                os.utime(path, (inode['i_atime'], inode['i_mtime']))
+            except OSError, err:
+                print("ERROR: " + str(err))
+                return False
+
         return True
 
+#
+# Class Definition For Ext4 File
+#
+# Read-only, seekable file object backed by extent map of inode, holes read as zeros
+#
+class Ext4File(object):
+    def __init__(self, parser, inode_num, inode, name = ""):
+        self.parser = parser
+        self.inode_num = inode_num
+        self.name = name
+        self.size = inode['i_size']
+        self.extents = parser.get_ext4_extent_map(inode_num)
+        self.pos = 0
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.closed = True
+
+    def tell(self):
+        return self.pos
+
+    def seek(self, offset, whence = os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self.pos
+        elif whence == os.SEEK_END:
+            offset += self.size
+
+        if offset < 0:
+            raise IOError(errno.EINVAL, os.strerror(errno.EINVAL))
+
+        self.pos = offset
+
+    def read(self, size = -1):
+        if self.closed is True:
+            raise ValueError("I/O operation on closed file")
+
+        if size < 0:
+            end = self.size
+        else:
+            end = min(self.size, self.pos + size)
+
+        block_sz = self.parser.ext4_block_sz
+        data = []
+
+        while self.pos < end:
+            lblk = self.pos / block_sz
+
+            i = bisect.bisect_right(self.extents, (lblk, EXT4_EXT_INIT_MAX_LEN * 2)) - 1
+
+            if i >= 0 and lblk < self.extents[i][0] + self.extents[i][1]:
+                ee_block, ee_len, ee_start, ee_uninit = self.extents[i]
+                n = min(end, (ee_block + ee_len) * block_sz) - self.pos
+
+                if ee_uninit is True:
+                    data.append("\x00" * n)
+                else:
+                    offset = ee_start * block_sz + self.pos - ee_block * block_sz
+                    data.append(self.parser.image[offset:offset+n])
+            else:
+                #
+                # Hole up to next extent
+                #
+                if i + 1 < len(self.extents):
+                    n = min(end, self.extents[i + 1][0] * block_sz) - self.pos
+                else:
+                    n = end - self.pos
+
+                data.append("\x00" * n)
+
+            self.pos += n
+
+        return "".join(data)
+
 #
 # Function Definition
 #
 
+#
+# Parse Ext4 inode in inode table of block group in pool worker
+#
+def parse_ext4_bg_inode_worker(bg_num):
+    parser = ext4_pool_parser
+    parser.ext4_inode_index = {}
+
+    stdout = sys.stdout
+    sys.stdout = StringIO.StringIO()
+
+    try:
+        parser.parse_ext4_bg_inode(bg_num)
+        output = sys.stdout.getvalue()
+    finally:
+        sys.stdout = stdout
+
+    return (bg_num, parser.ext4_inode_index, output)
+
+#
+# Map image file into memory read-only
+#
+# Pages are read in only when touched, so resident memory follows what
+# is parsed rather than the image size.
+#
+def mmap_image(image_file):
+    fp = open(image_file, "rb")
+
+    try:
+        image_data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        #
+        # Empty file can not be mapped
+        #
+        image_data = ""
+
+    fp.close()
+
+    return image_data
+
+#
+# Unmap image mapped by mmap_image()
+#
+def munmap_image(image_data):
+    if isinstance(image_data, mmap.mmap):
+        image_data.close()
+
+#
+# Wrap Android sparse image for reading as expanded, others returned as is
+#
+def unsparse_image(image_data):
+    if Ext4SparseImage.is_sparse(image_data) is False:
+        return image_data
+
+    image = Ext4SparseImage(image_data)
+    if image.parse() is False:
+        return None
+
+    return image
+
 #
 # Parse image
 #
 def parse_ext4img(image_file):
     global is_ext4_dumped
     global ext4_dumpdir
+    global ext4_jobs
 
-    fp = open(image_file, "rb")
-    image_data = fp.read()
-    fp.close()
+    image_data = mmap_image(image_file)
+
+    image = unsparse_image(image_data)
+    if image is None:
+        munmap_image(image_data)
+        return False
 
-    parser = Ext4Parser(image_data)
+    parser = Ext4Parser(image, ext4_jobs)
     parser.run()
 
     if is_ext4_dumped is True:
@@ -1889,6 +3022,8 @@ def parse_ext4img(image_file):
         else:
             print("Failed to dump files!")
 
+    munmap_image(image_data)
+
     ''' test only
     print(hex(ord(image_data[0])))
     data_hex = binascii.b2a_hex(image_data[1])
@@ -1897,6 +3032,80 @@ def parse_ext4img(image_file):
 
     return True
 
+#
+# Benchmark inode decoding in inode table of block group #0
+#
+def benchmark_ext4img(image_file):
+    image_data = mmap_image(image_file)
+
+    image = unsparse_image(image_data)
+    if image is None:
+        munmap_image(image_data)
+        return False
+
+    parser = Ext4Parser(image)
+
+    #
+    # Parse super block and descriptor of block group #0 silently
+    #
+    EXT4_SUPER_BLOCK_LAYOUT.unpack_into(parser.ext4_super_block, parser.image, EXT4_GROUP_0_PAD_SZ)
+    parser.ext4_block_sz = int(math.pow(2, (10 + parser.ext4_super_block['s_log_block_size'])))
+    parser.parse_ext4_bg_desc_internal((parser.ext4_super_block['s_first_data_block'] + 1) * parser.ext4_block_sz)
+
+    inode_sz = parser.ext4_super_block['s_inode_size']
+    inode_num = parser.ext4_super_block['s_inodes_per_group']
+    offset = ((parser.ext4_block_group_desc['bg_inode_table_hi'] << 32) + parser.ext4_block_group_desc['bg_inode_table_lo']) * parser.ext4_block_sz
+
+    #
+    # Field by field with str2int_le()
+    #
+    legacy_list = []
+    start = time.time()
+    for i in range(0, inode_num, 1):
+        inode_offset = offset + i * inode_sz
+        inode = parser.unpack_into_legacy(EXT4_INODE_LAYOUT, {}, inode_offset)
+        parser.unpack_into_legacy(EXT4_EXTENT_HEADER_LAYOUT, {}, inode_offset + EXT4_INODE_I_BLOCK_OFFSET)
+        if inode_sz > EXT4_INODE_ENTRY_SZ:
+            parser.unpack_into_legacy(EXT4_INODE_EXTRA_LAYOUT, inode, inode_offset + EXT4_INODE_ENTRY_SZ)
+        else:
+            for name in EXT4_INODE_EXTRA_LAYOUT.names:
+                inode[name] = 0
+        legacy_list.append(inode)
+    legacy_time = time.time() - start
+
+    #
+    # Whole record with Ext4Layout
+    #
+    layout_list = []
+    start = time.time()
+    for i in range(0, inode_num, 1):
+        parser.parse_ext4_bg_inode_internal(offset + i * inode_sz)
+        layout_list.append(dict(parser.ext4_inode_table))
+    layout_time = time.time() - start
+
+    mismatched = 0
+    for i in range(0, inode_num, 1):
+        if legacy_list[i] != layout_list[i]:
+            mismatched += 1
+
+    rate = lambda t : t > 0 and "%.0f" % (inode_num / t) or "n/a"
+
+    print("\n----------------------------------------")
+    print("EXT4 INODE DECODING BENCHMARK\n")
+
+    print("Inodes decoded            : " + str(inode_num))
+    print("str2int_le per field      : " + rate(legacy_time) + " inodes/s")
+    print("Ext4Layout per record     : " + rate(layout_time) + " inodes/s")
+
+    if layout_time > 0:
+        print("Speedup                   : %.1fx" % (legacy_time / layout_time))
+
+    print("Mismatched inodes         : " + str(mismatched))
+
+    munmap_image(image_data)
+
+    return mismatched == 0
+
 #
 # Print usage
 #
@@ -1909,6 +3118,8 @@ def print_usage():
     print("OPTIONS:")
     print("  -f, --file       Image file to be parsed")
     print("  -d, --dump       Dump image file to directory")
+    print("  -j, --jobs       Processes to parse block groups, 0 for all CPUs")
+    print("  -b, --benchmark  Benchmark inode decoding")
     print("  -v, --verbose    Verbose messages")
     print("  -h, --help       Display help message")
     print("")
@@ -1920,8 +3131,10 @@ def main():
     global is_pr_verb
     global is_ext4_dumped
     global ext4_dumpdir
+    global ext4_jobs
 
     image_file = ""
+    is_benchmarked = False
 
     #
     # Display banner
@@ -1932,7 +3145,7 @@ def main():
     # Get args list
     #
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "f:d:vh", ["file=", "dump=", "verbose", "help"])
+        opts, args = getopt.getopt(sys.argv[1:], "f:d:j:bvh", ["file=", "dump=", "jobs=", "benchmark", "verbose", "help"])
     except getopt.GetoptError, err:
         print str(err)
         print_usage()
@@ -1944,6 +3157,20 @@ def main():
         elif o in ("-d", "--dump"):
             is_ext4_dumped = True
             ext4_dumpdir = a
+        elif o in ("-j", "--jobs"):
+            try:
+                ext4_jobs = int(a)
+            except ValueError:
+                ext4_jobs = -1
+
+            if ext4_jobs < 0:
+                print("\nERROR: invalid parameter '%s' !\n" % a)
+                print_usage()
+                sys.exit(1)
+            elif ext4_jobs == 0:
+                ext4_jobs = multiprocessing.cpu_count()
+        elif o in ("-b", "--benchmark"):
+            is_benchmarked = True
         elif o in ("-v", "--verbose"):
             is_pr_verb = True
         elif o in ("-h", "--help"):
@@ -1978,8 +3205,12 @@ def main():
     # Parse Ext4 image
     #
     if os.access(os.path.join(os.getcwd(), image_file), os.F_OK) is True:
-        print("\nParsing Ext4 image...\n")
-        ret = parse_ext4img(os.path.join(os.getcwd(), image_file))
+        if is_benchmarked is True:
+            print("\nBenchmarking Ext4 image...\n")
+            ret = benchmark_ext4img(os.path.join(os.getcwd(), image_file))
+        else:
+            print("\nParsing Ext4 image...\n")
+            ret = parse_ext4img(os.path.join(os.getcwd(), image_file))
         if ret is True:
             print("\nDone!\n")
         else:
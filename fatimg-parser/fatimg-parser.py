@@ -18,9 +18,20 @@
 # To parse FAT image:
 # python fatimg-parser.py -f fat.img -v -s sigverify-list.txt -c compverify-list.txt -d fat-dump
 #
+# Entries in compverify list are separated by white space, and each entry
+# may carry expected size and SHA-256 digest of file, either is optional:
+# modem.mdt modem.b00:40000 modem.b01:100:<sha256> modem.b02::<sha256>
+#
 
 import os, sys
 import getopt
+import time
+import hashlib
+import mmap
+import array
+import collections
+import multiprocessing
+import multiprocessing.pool
 
 #
 # Global Variable Definition
@@ -50,6 +61,11 @@ compverify_list = ""
 is_fat_dumped = False
 fat_dumpdir = ""
 
+#
+# Number of threads to dump and verify FAT files
+#
+fat_jobs = 4
+
 #
 # FAT Parameters
 #
@@ -66,6 +82,22 @@ FAT_FILE_ATTR = {
     'ARCHIVE'     : 0x20
 }
 
+FAT_DIRENT_DELETED = '\xE5'
+
+#
+# Lower case flags of Windows NT in user attribute
+#
+FAT_NT_LOWER_NAME = 0x08
+FAT_NT_LOWER_EXT  = 0x10
+
+#
+# VFAT long file name entry
+#
+FAT_LFN_ATTR      = 0x0F
+FAT_LFN_ATTR_MASK = 0x3F
+FAT_LFN_LAST      = 0x40
+FAT_LFN_SEQ_MASK  = 0x1F
+
 #
 # FAT16 Parameters
 #
@@ -78,16 +110,54 @@ FAT16_CLUSTER_NUM = (64 * 1024 * 1024) / FAT16_CLUSTER_SZ
 
 FAT16_SECTOR_NUM = (64 * 1024 * 1024) / FAT_SECTOR_SZ
 
+#
+# FAT16 cluster values, clusters from 'FAT16_BAD_CLUSTER' on end cluster chain
+#
+FAT16_BAD_CLUSTER = 0xFFF7
+FAT16_EOC         = 0xFFF8
+
+#
+# FAT32 Parameters
+#
+FAT32_ENTRY_SZ = 4
+
+#
+# Only low 28 bits of FAT32 entry are cluster number
+#
+FAT32_ENTRY_MASK  = 0x0FFFFFFF
+FAT32_BAD_CLUSTER = 0x0FFFFFF7
+FAT32_EOC         = 0x0FFFFFF8
+
+#
+# Only one FAT copy is active if bit 7 of extended flags set, bits 0-3 for its index
+#
+FAT32_EXTFLAGS_MIRROR_OFF = 0x80
+FAT32_EXTFLAGS_ACTIVE_FAT = 0x0F
+
+FAT32_FSINFO_LEAD_SIG   = 0x41615252
+FAT32_FSINFO_STRUCT_SIG = 0x61417272
+FAT32_FSINFO_TRAIL_SIG  = 0xAA550000
+
+#
+# FAT file data copied to dump directory in chunks
+#
+FAT_DUMP_CHUNK_SZ = 4 * 1024 * 1024
+
 #
 # Class Definition For FAT Parser
 #
 class FATParser(object):
-    def __init__(self, img):
+    def __init__(self, img, jobs = 4):
         #
         # Init class member
         #
         self.image = img
 
+        #
+        # Number of threads to write dumped files
+        #
+        self.jobs = jobs
+
         #
         # FAT common header
         #
@@ -128,6 +198,36 @@ class FATParser(object):
         #
         self.offset_fat16_hdr = 0
 
+        #
+        # FAT32 header
+        #
+        self.fat32_hdr_secperfat = 0
+        self.fat32_hdr_extflags = 0
+        self.fat32_hdr_fsver = 0
+        self.fat32_hdr_rootcluster = 0
+        self.fat32_hdr_fsinfo_sec = 0
+        self.fat32_hdr_bkboot_sec = 0
+        self.fat32_hdr_logicaldrive_num = 0
+        self.fat32_hdr_ext_sign = 0
+        self.fat32_hdr_ser_num = 0
+        self.fat32_hdr_vol_name = ""
+        self.fat32_hdr_fat_name = ""
+        self.fat32_hdr_exec_marker = []
+
+        #
+        # FAT32 FSInfo sector
+        #
+        self.fat32_fsinfo_lead_sig = 0
+        self.fat32_fsinfo_struct_sig = 0
+        self.fat32_fsinfo_free_count = 0
+        self.fat32_fsinfo_next_free = 0
+        self.fat32_fsinfo_trail_sig = 0
+
+        #
+        # FAT type, 'FAT16' or 'FAT32'
+        #
+        self.fat_type = ""
+
         #
         # FAT directory entry
         #
@@ -144,7 +244,8 @@ class FATParser(object):
             'file_timelastmodified' : 0,
             'file_datelastmodified' : 0,
             'file_firstcluster'     : 0,
-            'file_bytesize'         : 0
+            'file_bytesize'         : 0,
+            'file_lname'            : ""
             }
 
         #
@@ -154,9 +255,28 @@ class FATParser(object):
         self.fat_file_list = []
 
         #
-        # FAT binary list
+        # FAT directory index, names in each directory keyed by full path
+        #
+        self.fat_dir_index = {}
+
+        #
+        # FAT full paths keyed by lower case path, for case-insensitive lookup
+        #
+        self.fat_path_lookup = {}
+
         #
-        self.fat_bin_list = {}
+        # FAT binary list, directory entry with extents of each file and directory keyed
+        # by full path, content read on demand
+        #
+        self.fat_bin_list = collections.OrderedDict()
+
+        #
+        # FAT table decoded once, one entry per cluster
+        #
+        self.fat_table = None
+        self.fat_table_typecode = 'H'
+        self.fat_entry_mask = 0xFFFF
+        self.fat_bad_cluster = FAT16_BAD_CLUSTER
         
         ''' test only
         self.fat16_table_sz = FAT16_CLUSTER_NUM * FAT16_ENTRY_SZ
@@ -228,27 +348,174 @@ class FATParser(object):
         length = self.fat_common_hdr_secpercluster * self.fat_common_hdr_bytespersec
         return self.image[offset:offset+length]
 
+    #
+    # Load FAT table of first FAT copy
+    #
+    def load_fat_table(self):
+        offset = self.fat_common_hdr_secreserved * self.fat_common_hdr_bytespersec
+        length = self.fat_common_hdr_secperfat * self.fat_common_hdr_bytespersec
+
+        #
+        # Use active FAT copy if FAT32 mirroring disabled
+        #
+        if self.fat_type == 'FAT32' and self.fat32_hdr_extflags & FAT32_EXTFLAGS_MIRROR_OFF != 0:
+            offset += (self.fat32_hdr_extflags & FAT32_EXTFLAGS_ACTIVE_FAT) * length
+
+        self.fat_table = array.array(self.fat_table_typecode)
+        self.fat_table.fromstring(self.image[offset:offset+length-(length%self.fat_table.itemsize)])
+
+        if sys.byteorder != 'little':
+            self.fat_table.byteswap()
+
+    #
+    # Get FAT cluster chain from first cluster
+    #
+    def get_fat_cluster_chain(self, cluster_num):
+        if self.fat_table is None:
+            self.load_fat_table()
+
+        chain = []
+        table = self.fat_table
+        table_len = len(table)
+        mask = self.fat_entry_mask
+        bad_cluster = self.fat_bad_cluster
+
+        while 2 <= cluster_num < bad_cluster and cluster_num < table_len:
+            chain.append(cluster_num)
+
+            #
+            # Cluster chain loops on corrupted FAT table
+            #
+            if len(chain) > table_len:
+                break
+
+            cluster_num = table[cluster_num] & mask
+
+        return chain
+
+    #
+    # Get FAT extents from first cluster, contiguous clusters in chain coalesced
+    #
+    # Extent is tuple of (first cluster, clusters num)
+    #
+    def get_fat_extents(self, cluster_num):
+        extents = []
+
+        for cluster in self.get_fat_cluster_chain(cluster_num):
+            if len(extents) > 0 and extents[-1][0] + extents[-1][1] == cluster:
+                extents[-1] = (extents[-1][0], extents[-1][1] + 1)
+            else:
+                extents.append((cluster, 1))
+
+        return extents
+
+    #
+    # Read FAT data of extents, up to length in bytes
+    #
+    def read_fat_extents(self, extents, length):
+        data = []
+
+        cluster_sz = self.fat_common_hdr_secpercluster * self.fat_common_hdr_bytespersec
+
+        for cluster_num, cluster_cnt in extents:
+            if length <= 0:
+                break
+
+            offset = self.get_fat16_cluster_sec(cluster_num) * FAT_SECTOR_SZ
+            n = min(cluster_cnt * cluster_sz, length)
+
+            data.append(self.image[offset:offset+n])
+            length -= n
+
+        return "".join(data)
+
     #
     # Read FAT binary file
     #
     def read_fat_bin(self, fat_dirent):
-        fat_bin = ""
+        return self.read_fat_extents(self.get_fat_extents(fat_dirent['file_firstcluster']), fat_dirent['file_bytesize'])
 
-        file_sz_real = fat_dirent['file_bytesize']
+    #
+    # Iterate over FAT binary file in chunks, without reading whole file
+    #
+    def iter_fat_bin(self, fat_bin):
+        length = fat_bin['file_bytesize']
 
         cluster_sz = self.fat_common_hdr_secpercluster * self.fat_common_hdr_bytespersec
 
-        file_cluster_total = (file_sz_real / cluster_sz)
-        if file_sz_real % cluster_sz != 0:
-            file_cluster_total += 1
+        for cluster_num, cluster_cnt in fat_bin['file_extents']:
+            if length <= 0:
+                break
 
-        first_cluster_num = fat_dirent['file_firstcluster']
+            offset = self.get_fat16_cluster_sec(cluster_num) * FAT_SECTOR_SZ
+            end = offset + min(cluster_cnt * cluster_sz, length)
+            length -= end - offset
 
-        for i in range(0, file_cluster_total, 1):
-            cluster_num = first_cluster_num + i
-            fat_bin += self.read_fat_cluster(cluster_num)
+            while offset < end:
+                n = min(FAT_DUMP_CHUNK_SZ, end - offset)
+                yield self.image[offset:offset+n]
+                offset += n
 
-        return fat_bin[0:file_sz_real]
+    #
+    # Write FAT binary file to file object in chunks
+    #
+    def write_fat_bin(self, fat_bin, fp):
+        for data in self.iter_fat_bin(fat_bin):
+            fp.write(data)
+
+    #
+    # Get SHA-256 digest of FAT binary file in chunks
+    #
+    def hash_fat_bin(self, fat_bin):
+        sha = hashlib.sha256()
+
+        for data in self.iter_fat_bin(fat_bin):
+            sha.update(data)
+
+        return sha.hexdigest()
+
+    #
+    # Look up FAT directory entry by path, case-insensitive
+    #
+    def lookup_fat_path(self, path):
+        file_path = self.fat_path_lookup.get(path.strip('/').lower())
+        if file_path is None:
+            return None
+
+        return self.fat_bin_list[file_path]
+
+    #
+    # List names in FAT directory by path
+    #
+    def list_fat_dir(self, path):
+        if path.strip('/') == '':
+            return list(self.fat_dir_index.get('', []))
+
+        fat_bin = self.lookup_fat_path(path)
+        if fat_bin is None or fat_bin['file_path'] not in self.fat_dir_index:
+            return None
+
+        return list(self.fat_dir_index[fat_bin['file_path']])
+
+    #
+    # Read FAT file content by path
+    #
+    def read_fat_file(self, path):
+        fat_bin = self.lookup_fat_path(path)
+        if fat_bin is None or fat_bin['file_attr'] & FAT_FILE_ATTR['DIRECTORY'] != 0:
+            return None
+
+        return self.read_fat_extents(fat_bin['file_extents'], fat_bin['file_bytesize'])
+
+    #
+    # Read FAT directory data in all clusters of its chain
+    #
+    def read_fat_dir(self, cluster_num):
+        extents = self.get_fat_extents(cluster_num)
+
+        cluster_sz = self.fat_common_hdr_secpercluster * self.fat_common_hdr_bytespersec
+
+        return self.read_fat_extents(extents, sum([e[1] for e in extents]) * cluster_sz)
 
     #
     # Read FAT directory entry
@@ -295,88 +562,153 @@ class FATParser(object):
         offset += 2
         self.fat_dirent['file_bytesize'] = self.str2int(cluster_data[offset:offset+4])
 
-    #
-    # Find FAT file entry
-    #
-    def find_fat_file_entry(self, cluster_num):
-        global is_pr_verb
-
-        cluster_data = self.read_fat_cluster(cluster_num)
-
         #
-        # Read FAT directory entry of '.'
+        # High 16 bits of first cluster take place of access right map in FAT32
         #
-        offset = 0
-        self.read_fat_dir_entry(cluster_data, offset)
-
-        #
-        # Check if directory entry is null
-        #
-        if self.fat_dirent['file_name'].strip('\x00').strip() == '' \
-                and self.fat_dirent['file_ext'].strip('\x00').strip() == '':
-            return
+        if self.fat_type == 'FAT32':
+            self.fat_dirent['file_firstcluster'] += self.fat_dirent['file_accessrightmap'] << 16
 
-        if is_pr_verb is True:
-            self.print_fat_dir_entry(self.fat_dirent)
+    #
+    # Get FAT 8.3 short name of directory entry
+    #
+    def get_fat_short_name(self, fat_dirent):
+        file_name = fat_dirent['file_name'].rstrip(' ')
+        file_ext = fat_dirent['file_ext'].rstrip(' ')
 
         #
-        # Read FAT directory entry of '..'
+        # 0x05 stands for 0xE5 as first character
         #
-        offset += FAT_DIR_ENT_LEN
-        self.read_fat_dir_entry(cluster_data, offset)
+        if file_name.startswith('\x05'):
+            file_name = '\xE5' + file_name[1:]
 
         #
-        # Check if directory entry is null
+        # Lower case flags of Windows NT
         #
-        if self.fat_dirent['file_name'].strip('\x00').strip() == '' \
-                and self.fat_dirent['file_ext'].strip('\x00').strip() == '':
-            return
-
-        if is_pr_verb is True:
-            self.print_fat_dir_entry(self.fat_dirent)
+        if fat_dirent['user_attr'] & FAT_NT_LOWER_NAME != 0:
+            file_name = file_name.lower()
+        if fat_dirent['user_attr'] & FAT_NT_LOWER_EXT != 0:
+            file_ext = file_ext.lower()
 
-        #
-        # Read FAT directory and file entry except '.' and '..'
-        #
-        offset += FAT_DIR_ENT_LEN
-        self.read_fat_dir_entry(cluster_data, offset)
+        if file_ext != '':
+            return file_name + '.' + file_ext
+        else:
+            return file_name
 
-        while (self.fat_dirent['file_name'].strip('\x00').strip() != ''):
-            file_name = self.fat_dirent['file_name'].strip().lower()+'.'+self.fat_dirent['file_ext'].strip().lower()
+    #
+    # Add FAT directory entry to path index
+    #
+    def add_fat_path_index(self, dir_path, name):
+        file_path = dir_path + '/' + name if dir_path != '' else name
 
-            self.fat_file_list.append(file_name)
+        fat_bin = dict(self.fat_dirent)
+        fat_bin['file_path'] = file_path
 
-            self.fat_bin_list[file_name] = self.read_fat_bin(self.fat_dirent)
+        if self.fat_dirent['file_attr'] & FAT_FILE_ATTR['DIRECTORY'] != 0:
+            fat_bin['file_extents'] = []
+            self.fat_dir_list.append(name.lower())
+            self.fat_dir_index[file_path] = []
+        else:
+            fat_bin['file_extents'] = self.get_fat_extents(self.fat_dirent['file_firstcluster'])
+            self.fat_file_list.append(name.lower())
 
-            if is_pr_verb is True:
-                self.print_fat_dir_entry(self.fat_dirent)
+        self.fat_bin_list[file_path] = fat_bin
+        self.fat_path_lookup[file_path.lower()] = file_path
+        self.fat_dir_index[dir_path].append(name)
 
-            offset += FAT_DIR_ENT_LEN
-            self.read_fat_dir_entry(cluster_data, offset)
+        return fat_bin
 
     #
     # Find FAT directory entry
     #
+    # Directory tree is walked depth first with explicit stack of (directory path,
+    # directory data, offset of next entry), each entry indexed by its full path
+    #
     def find_fat_dir_entry_helper(self, dir_cluster_data):
-        for i in range(0, len(dir_cluster_data), FAT_DIR_ENT_LEN):
+        global is_pr_verb
+
+        self.fat_dir_index[''] = []
+
+        stack = [['', dir_cluster_data, 0]]
+        visited = set()
+        lfn = None
+
+        while len(stack) > 0:
+            frame = stack[-1]
+            dir_path, dir_data, offset = frame
+
+            #
+            # First byte 0x00 marks end of directory
             #
-            # Read FAT directory entry
+            if offset + FAT_DIR_ENT_LEN > len(dir_data) or dir_data[offset] == '\x00':
+                stack.pop()
+                lfn = None
+                continue
+
+            frame[2] = offset + FAT_DIR_ENT_LEN
+
             #
-            self.read_fat_dir_entry(dir_cluster_data, i)
+            # Deleted entry
+            #
+            if dir_data[offset] == FAT_DIRENT_DELETED:
+                lfn = None
+                continue
+
+            self.read_fat_dir_entry(dir_data, offset)
 
             #
-            # Directory entry is found
+            # Long file name entry, collected in reverse order of sequence number
             #
-            if self.fat_dirent['file_attr'] & FAT_FILE_ATTR['DIRECTORY'] != 0:
-                self.fat_dir_list.append(self.fat_dirent['file_name'].strip().lower())
+            if self.fat_dirent['file_attr'] & FAT_LFN_ATTR_MASK == FAT_LFN_ATTR:
+                seq = ord(dir_data[offset])
+                chksum = ord(dir_data[offset+13])
+                part = dir_data[offset+1:offset+11] + dir_data[offset+14:offset+26] + dir_data[offset+28:offset+32]
+
+                if seq & FAT_LFN_LAST != 0:
+                    lfn = {'next': (seq & FAT_LFN_SEQ_MASK) - 1, 'chksum': chksum, 'parts': [part]}
+                elif lfn is not None and seq == lfn['next'] and chksum == lfn['chksum']:
+                    lfn['next'] -= 1
+                    lfn['parts'].append(part)
+                else:
+                    lfn = None
 
-                if is_pr_verb is True:
-                    self.print_fat_dir_entry(self.fat_dirent)
+                continue
 
-                self.find_fat_file_entry(self.fat_dirent['file_firstcluster'])
-            else:
+            #
+            # Volume label
+            #
+            if self.fat_dirent['file_attr'] & FAT_FILE_ATTR['VOLUME LABEL'] != 0:
+                lfn = None
                 continue
 
+            #
+            # Long file name matches short name only if all parts found and checksum equal
+            #
+            self.fat_dirent['file_lname'] = ""
+            if lfn is not None and lfn['next'] == 0 and lfn['chksum'] == get_fat_lfn_chksum(dir_data[offset:offset+11]):
+                self.fat_dirent['file_lname'] = decode_fat_lfn(lfn['parts'])
+            lfn = None
+
+            if is_pr_verb is True:
+                self.print_fat_dir_entry(self.fat_dirent)
+
+            name = self.fat_dirent['file_lname'] or self.get_fat_short_name(self.fat_dirent)
+            if name == '.' or name == '..':
+                continue
+
+            fat_bin = self.add_fat_path_index(dir_path, name)
+
+            if self.fat_dirent['file_attr'] & FAT_FILE_ATTR['DIRECTORY'] != 0:
+                cluster_num = self.fat_dirent['file_firstcluster']
+
+                #
+                # Directory loops on corrupted image
+                #
+                if cluster_num in visited:
+                    continue
+                visited.add(cluster_num)
+
+                stack.append([fat_bin['file_path'], self.read_fat_dir(cluster_num), 0])
+
     #
     # Find FAT16 directory entry
     #
@@ -478,6 +810,73 @@ class FATParser(object):
         offset += 448
         self.fat16_hdr_exec_marker = self.str2int(self.image[offset:offset+2])
 
+    #
+    # Parse FAT32 header
+    #
+    def parse_fat32_header(self):
+        offset = self.offset_fat16_hdr
+        self.fat32_hdr_secperfat = self.str2int(self.image[offset:offset+4])
+
+        offset += 4
+        self.fat32_hdr_extflags = self.str2int(self.image[offset:offset+2])
+
+        offset += 2
+        self.fat32_hdr_fsver = self.str2int(self.image[offset:offset+2])
+
+        offset += 2
+        self.fat32_hdr_rootcluster = self.str2int(self.image[offset:offset+4])
+
+        offset += 4
+        self.fat32_hdr_fsinfo_sec = self.str2int(self.image[offset:offset+2])
+
+        offset += 2
+        self.fat32_hdr_bkboot_sec = self.str2int(self.image[offset:offset+2])
+
+        #
+        # 12 bytes reserved
+        #
+        offset += 2 + 12
+        self.fat32_hdr_logicaldrive_num = self.str2int(self.image[offset:offset+2])
+
+        offset += 2
+        self.fat32_hdr_ext_sign = self.str2int(self.image[offset:offset+1])
+
+        offset += 1
+        self.fat32_hdr_ser_num = self.str2int(self.image[offset:offset+4])
+
+        offset += 4
+        self.fat32_hdr_vol_name = self.image[offset:offset+11]
+
+        offset += 11
+        self.fat32_hdr_fat_name = self.image[offset:offset+8]
+
+        offset = FAT_SECTOR_SZ - 2
+        self.fat32_hdr_exec_marker = self.str2int(self.image[offset:offset+2])
+
+        #
+        # Sectors per FAT of FAT32 used by common routines
+        #
+        self.fat_common_hdr_secperfat = self.fat32_hdr_secperfat
+
+    #
+    # Parse FAT32 FSInfo sector
+    #
+    def parse_fat32_fsinfo(self):
+        offset = self.fat32_hdr_fsinfo_sec * self.fat_common_hdr_bytespersec
+        self.fat32_fsinfo_lead_sig = self.str2int(self.image[offset:offset+4])
+
+        offset += 484
+        self.fat32_fsinfo_struct_sig = self.str2int(self.image[offset:offset+4])
+
+        offset += 4
+        self.fat32_fsinfo_free_count = self.str2int(self.image[offset:offset+4])
+
+        offset += 4
+        self.fat32_fsinfo_next_free = self.str2int(self.image[offset:offset+4])
+
+        offset += 4 + 12
+        self.fat32_fsinfo_trail_sig = self.str2int(self.image[offset:offset+4])
+
     #
     # Parse FAT16 entry
     #
@@ -491,6 +890,17 @@ class FATParser(object):
 
         self.find_fat16_dir_entry(dir_table_start, dir_table_len)
 
+    #
+    # Parse FAT32 entry
+    #
+    def parse_fat32_entry(self):
+        #
+        # Find directory entry in root directory cluster chain
+        #
+        dir_cluster_data = self.read_fat_dir(self.fat32_hdr_rootcluster)
+
+        self.find_fat_dir_entry_helper(dir_cluster_data)
+
     #
     # Print FAT common header info
     #
@@ -531,6 +941,46 @@ class FATParser(object):
 
         print("")
 
+    #
+    # Print FAT32 header info
+    #
+    def print_fat32_header_info(self):
+        print("----------------------------------------")
+        print("IMAGE FAT32 HEADER INFO\n")
+        print("Sector Per FAT      : " + str(self.fat32_hdr_secperfat))
+        print("Extended Flags      : %x" % self.fat32_hdr_extflags + " (Hex)")
+        print("FS Version          : " + str(self.fat32_hdr_fsver))
+        print("Root Cluster        : " + str(self.fat32_hdr_rootcluster))
+        print("FSInfo Sector       : " + str(self.fat32_hdr_fsinfo_sec))
+        print("Backup Boot Sector  : " + str(self.fat32_hdr_bkboot_sec))
+        print("Logical Drive Number: " + str(self.fat32_hdr_logicaldrive_num))
+        print("Ext Signature       : " + str(self.fat32_hdr_ext_sign))
+        print("Serial Number       : " + str(self.fat32_hdr_ser_num))
+        print("Volume Name         : " + str(self.fat32_hdr_vol_name.strip()))
+        print("FAT Name            : " + str(self.fat32_hdr_fat_name.strip()))
+        print("Exec Marker         : %x" % self.fat32_hdr_exec_marker + " (Hex)")
+
+        print("")
+
+    #
+    # Print FAT32 FSInfo info
+    #
+    def print_fat32_fsinfo_info(self):
+        s = lambda x : x == 0xFFFFFFFF and "unknown" or str(x)
+
+        print("----------------------------------------")
+        print("IMAGE FAT32 FSINFO INFO\n")
+
+        if self.fat32_fsinfo_lead_sig != FAT32_FSINFO_LEAD_SIG \
+                or self.fat32_fsinfo_struct_sig != FAT32_FSINFO_STRUCT_SIG \
+                or self.fat32_fsinfo_trail_sig != FAT32_FSINFO_TRAIL_SIG:
+            print("FSInfo signature invalid, ignored")
+        else:
+            print("Free Cluster Count  : " + s(self.fat32_fsinfo_free_count))
+            print("Next Free Cluster   : " + s(self.fat32_fsinfo_next_free))
+
+        print("")
+
     #
     # Print FAT directory entry info
     #
@@ -538,6 +988,8 @@ class FATParser(object):
         print("----------------------------------------")
         print("IMAGE FAT16 DIRECTORY ENTRY INFO\n")
         print("File Name              : " + str(fat_dirent['file_name'].strip()))
+        if fat_dirent.get('file_lname', "") != "":
+            print("Long File Name         : " + fat_dirent['file_lname'])
         print("File Extension         : " + str(fat_dirent['file_ext'].strip()))
 
         file_attr = []
@@ -609,6 +1061,8 @@ class FATParser(object):
         #
         fat_name = self.image[self.offset_fat16_hdr+18:self.offset_fat16_hdr+18+8]
         if fat_name.strip() == 'FAT16':
+            self.fat_type = 'FAT16'
+
             #
             # Parse FAT16 header
             #
@@ -624,11 +1078,34 @@ class FATParser(object):
             # Parse FAT16 entry
             #
             self.parse_fat16_entry()
-        else:
+        elif self.fat_common_hdr_secperfat == 0:
             #
-            # Parse FAT32
+            # Sectors per FAT of FAT16 header is 0 for FAT32
             #
-            pass
+            self.fat_type = 'FAT32'
+            self.fat_table_typecode = 'I'
+            self.fat_entry_mask = FAT32_ENTRY_MASK
+            self.fat_bad_cluster = FAT32_BAD_CLUSTER
+
+            #
+            # Parse FAT32 header and FSInfo sector
+            #
+            self.parse_fat32_header()
+            self.parse_fat32_fsinfo()
+
+            #
+            # Print FAT32 header and FSInfo info
+            #
+            if is_pr_verb is True:
+                self.print_fat32_header_info()
+                self.print_fat32_fsinfo_info()
+
+            #
+            # Parse FAT32 entry
+            #
+            self.parse_fat32_entry()
+        else:
+            print("\nERROR: unsupported FAT type!\n")
 
     #
     # Get FAT directory list
@@ -643,29 +1120,193 @@ class FATParser(object):
         return self.fat_file_list
 
     #
-    # Dump FAT image file to directory
+    # Get FAT path index
+    #
+    def get_path_index(self):
+        return self.fat_bin_list
+
+    #
+    # Get FAT files keyed by lower case file name, same name may be in several directories
+    #
+    def get_file_index(self):
+        file_index = {}
+
+        for v in self.fat_bin_list.values():
+            if v['file_attr'] & FAT_FILE_ATTR['DIRECTORY'] != 0:
+                continue
+
+            name = os.path.basename(v['file_path']).lower()
+            file_index.setdefault(name, []).append(v)
+
+        return file_index
+
+    #
+    # Check size and digest of FAT file against expected ones, run in thread of pool
+    #
+    # Any file of the same name that matches is accepted. Size is checked first,
+    # so only files of the right size are hashed.
+    #
+    def check_fat_file(self, args):
+        name, fat_bins, file_size, file_digest = args
+
+        reason = "size mismatched"
+
+        for fat_bin in fat_bins:
+            if file_size is not None and fat_bin['file_bytesize'] != file_size:
+                continue
+
+            if file_digest is None or self.hash_fat_bin(fat_bin) == file_digest:
+                return (name, None)
+
+            reason = "sha256 mismatched"
+
+        return (name, reason)
+
+    #
+    # Set file times from FAT directory entry, keep current time if date is invalid
+    #
+    def set_fat_file_times(self, path, fat_dirent):
+        mtime = get_fat_timestamp(fat_dirent['file_datelastmodified'], fat_dirent['file_timelastmodified'])
+        if mtime is None:
+            return
+
+        atime = get_fat_timestamp(fat_dirent['file_datelastaccessed'], 0)
+        if atime is None:
+            atime = mtime
+
+        os.utime(path, (atime, mtime))
+
+    #
+    # Dump FAT file to path, run in thread of pool
+    #
+    def dump_fat_file(self, args):
+        path, fat_bin = args
+
+        try:
+            fp = open(path, "wb")
+            try:
+                self.write_fat_bin(fat_bin, fp)
+            finally:
+                fp.close()
+
+            self.set_fat_file_times(path, fat_bin)
+        except (IOError, OSError), err:
+            return "ERROR: " + str(err)
+
+        return None
+
+    #
+    # Dump FAT image file to directory, keeping directory hierarchy
     #
     def dumpto(self, dumpdir):
         #
         # No sanity check here
         #
+        root_dir = os.path.join(os.getcwd(), dumpdir)
+
+        dir_list = []
+        file_list = []
+
+        #
+        # Parent directories come before children in path index
+        #
         for k, v in self.fat_bin_list.items():
-            file_dir = os.path.join(os.getcwd(), dumpdir)
+            path = os.path.join(root_dir, *k.split('/'))
+
+            if v['file_attr'] & FAT_FILE_ATTR['DIRECTORY'] != 0:
+                try:
+                    if os.path.isdir(path) is False:
+                        os.makedirs(path)
+                except OSError, err:
+                    print("ERROR: " + str(err))
+                    return False
+
+                dir_list.append((path, v))
+            else:
+                file_list.append((path, v))
+
+        #
+        # Writes to disk release GIL, so threads are enough here
+        #
+        ret = True
+
+        if self.jobs > 1 and len(file_list) > 1:
+            pool = multiprocessing.pool.ThreadPool(min(self.jobs, len(file_list)))
             try:
-                fp = open(os.path.join(file_dir, k), "wxb")
+                results = pool.imap_unordered(self.dump_fat_file, file_list)
+                for err in results:
+                    if err is not None:
+                        print(err)
+                        ret = False
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for item in file_list:
+                err = self.dump_fat_file(item)
+                if err is not None:
+                    print(err)
+                    ret = False
+
+        #
+        # Set directory times last, children first, since dumping files touches them
+        #
+        for path, v in reversed(dir_list):
+            try:
+                self.set_fat_file_times(path, v)
             except OSError, err:
                 print("ERROR: " + str(err))
-                return False
-
-            fp.write(v)
-            fp.close()
+                ret = False
 
-        return True
+        return ret
 
 #
 # Function Definition
 #
 
+#
+# Convert FAT date and time to local timestamp, None if date is invalid
+#
+def get_fat_timestamp(fat_date, fat_time):
+    year = ((fat_date >> 9) & 0x007F) + 1980
+    month = (fat_date >> 5) & 0x000F
+    day = fat_date & 0x001F
+
+    hour = (fat_time >> 11) & 0x001F
+    minute = (fat_time >> 5) & 0x003F
+    second = (fat_time & 0x001F) << 1
+
+    if month < 1 or month > 12 or day < 1 or hour > 23 or minute > 59 or second > 59:
+        return None
+
+    try:
+        return time.mktime((year, month, day, hour, minute, second, 0, 0, -1))
+    except (ValueError, OverflowError):
+        return None
+
+#
+# Get checksum of 8.3 short name, kept in each of its long file name entries
+#
+def get_fat_lfn_chksum(short_name):
+    chksum = 0
+
+    for c in short_name:
+        chksum = ((((chksum & 1) << 7) | (chksum >> 1)) + ord(c)) & 0xFF
+
+    return chksum
+
+#
+# Decode long file name from its UCS-2 parts, in order of sequence number
+#
+def decode_fat_lfn(parts):
+    name = "".join(reversed(parts)).decode('utf-16-le', 'replace')
+
+    end = name.find(u'\x00')
+    if end >= 0:
+        name = name[0:end]
+
+    return name.rstrip(u'\uffff').encode('utf-8')
+
 #
 # Verify if file is in FAT image
 #
@@ -678,38 +1319,116 @@ def is_file_in_compverify_list(verifylist, filename):
 #
 # Verify file completion in FAT image
 #
-def verify_file_in_compverify_list(file_list):
+# Returns files missed and files with mismatched size or digest, the latter
+# as (name, reason) list.
+#
+def verify_file_in_compverify_list(parser):
     global compverify_list
 
     file_missed = []
+    file_mismatched = []
 
-    for item in compverify_list:
-        if is_file_in_compverify_list(file_list, item) is False:
+    file_index = parser.get_file_index()
+    file_checked = []
+
+    for item, (file_size, file_digest) in compverify_list.items():
+        if is_file_in_compverify_list(file_index, item) is False:
             file_missed.append(item)
+        elif file_size is not None or file_digest is not None:
+            file_checked.append((item, file_index[item], file_size, file_digest))
         else:
             continue
 
-    return file_missed
+    #
+    # Hashing releases GIL, so threads are enough here
+    #
+    if parser.jobs > 1 and len(file_checked) > 1:
+        pool = multiprocessing.pool.ThreadPool(min(parser.jobs, len(file_checked)))
+        try:
+            results = pool.map(parser.check_fat_file, file_checked)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = map(parser.check_fat_file, file_checked)
+
+    for name, reason in results:
+        if reason is not None:
+            file_mismatched.append((name, reason))
+
+    return file_missed, file_mismatched
 
 #
 # Parse completion verification list
 #
+# Returns expected (size, digest) keyed by lower case file name, None if not given.
+#
 def parse_compverify_list(cv_list_file):
-    cv_list = []
+    cv_list = collections.OrderedDict()
 
     fp = open(cv_list_file, "rb")
     fp_data = fp.readlines()
     fp.close()
 
     for item in fp_data:
-        item_list = item.strip('\n').split(' ')
+        item_list = item.split()
 
         for i in item_list:
-            if i != '':
-                cv_list.append(i)
+            fields = i.split(':')
+
+            name = fields[0].lower()
+            if name == '':
+                continue
+
+            file_size = None
+            file_digest = None
+
+            try:
+                if len(fields) > 1 and fields[1] != '':
+                    file_size = int(fields[1], 0)
+                if len(fields) > 2 and fields[2] != '':
+                    file_digest = fields[2].lower()
+                    int(file_digest, 16)
+            except ValueError:
+                print("\nERROR: invalid entry '%s' in '%s' !\n" % (i, cv_list_file))
+                return collections.OrderedDict()
+
+            if file_digest is not None and len(file_digest) != hashlib.sha256().digest_size * 2:
+                print("\nERROR: invalid sha256 in entry '%s' !\n" % i)
+                return collections.OrderedDict()
+
+            cv_list[name] = (file_size, file_digest)
 
     return cv_list
 
+#
+# Map image file into memory read-only
+#
+# Pages are read in only when touched, so resident memory follows what
+# is parsed rather than the image size.
+#
+def mmap_image(image_file):
+    fp = open(image_file, "rb")
+
+    try:
+        image_data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        #
+        # Empty file can not be mapped
+        #
+        image_data = ""
+
+    fp.close()
+
+    return image_data
+
+#
+# Unmap image mapped by mmap_image()
+#
+def munmap_image(image_data):
+    if isinstance(image_data, mmap.mmap):
+        image_data.close()
+
 #
 # Parse image
 #
@@ -717,28 +1436,30 @@ def parse_fatimg(image_file):
     global is_comp_verified
     global is_fat_dumped
     global fat_dumpdir
+    global fat_jobs
 
     ret = False
 
-    fp = open(image_file, "rb")
-    image_data = fp.read()
-    fp.close()
+    image_data = mmap_image(image_file)
 
-    parser = FATParser(image_data)
+    parser = FATParser(image_data, fat_jobs)
     parser.run()
 
     if is_comp_verified is True:
         print("\nVerifying file completion in FAT image...")
 
-        file_list = parser.get_file_list()
-
-        file_missed = verify_file_in_compverify_list(file_list)
-        if len(file_missed) == 0:
+        file_missed, file_mismatched = verify_file_in_compverify_list(parser)
+        if len(file_missed) == 0 and len(file_mismatched) == 0:
             print("All files matched.")
             ret = True
         else:
-            print("The folling files mismatched!")
-            print(file_missed)
+            if len(file_missed) != 0:
+                print("The following files missed!")
+                print(file_missed)
+            if len(file_mismatched) != 0:
+                print("The following files mismatched!")
+                for name, reason in file_mismatched:
+                    print("%s: %s" % (name, reason))
             ret = False
     else:
         ret = True
@@ -752,6 +1473,8 @@ def parse_fatimg(image_file):
         else:
             print("Failed to dump file!")
 
+    munmap_image(image_data)
+
     ''' test only
     print(hex(ord(image_data[0])))
     data_hex = binascii.b2a_hex(image_data[1])
@@ -774,6 +1497,7 @@ def print_usage():
     print("  -c, --compverify Verify completion")
     print("  -s, --sigverify  Verify signature")
     print("  -d, --dump       Dump image file to directory")
+    print("  -j, --jobs       Threads to dump and verify files, 0 for all CPUs")
     print("  -v, --verbose    Verbose messages")
     print("  -h, --help       Display help message")
     print("")
@@ -787,6 +1511,7 @@ def main():
     global compverify_list
     global is_fat_dumped
     global fat_dumpdir
+    global fat_jobs
 
     ret = False
 
@@ -802,7 +1527,7 @@ def main():
     # Get args list
     #
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "f:c:s:d:vh", ["file=", "compverify=", "sigverify", "dump=", "verbose", "help"])
+        opts, args = getopt.getopt(sys.argv[1:], "f:c:s:d:j:vh", ["file=", "compverify=", "sigverify", "dump=", "jobs=", "verbose", "help"])
     except getopt.GetoptError, err:
         print str(err)
         print_usage()
@@ -820,6 +1545,18 @@ def main():
         elif o in ("-d", "--dump"):
             is_fat_dumped = True
             fat_dumpdir = a
+        elif o in ("-j", "--jobs"):
+            try:
+                fat_jobs = int(a)
+            except ValueError:
+                fat_jobs = -1
+
+            if fat_jobs < 0:
+                print("\nERROR: invalid parameter '%s' !\n" % a)
+                print_usage()
+                sys.exit(1)
+            elif fat_jobs == 0:
+                fat_jobs = multiprocessing.cpu_count()
         elif o in ("-v", "--verbose"):
             is_pr_verb = True
         elif o in ("-h", "--help"):
@@ -18,9 +18,27 @@
 # To parse *.mbn:
 # python mbnimg-parser.py -f test.mbn -v -s sigverify-list.txt
 #
+# To benchmark certification chain parsing:
+# python mbnimg-parser.py -f test.mbn -b
+#
+# To parse all *.mbn in directory, or matched by glob, in batch:
+# python mbnimg-parser.py -d firmware -s sigverify-list.txt
+# python mbnimg-parser.py -d 'firmware/*/*.mbn' -j 8
+#
+# To verify hash of code against signature:
+# python mbnimg-parser.py -f test.mbn -c
+#
 
 import os, sys
 import getopt
+import glob
+import time
+import multiprocessing
+import re
+import struct
+import hashlib
+import collections
+import mmap
 
 #
 # Global Variable Definition
@@ -44,6 +62,16 @@ is_pr_verb = False
 is_sig_verified = False
 sigverify_list = ""
 
+#
+# Verify hash of code against signature in image
+#
+is_code_verified = False
+
+#
+# Number of processes to parse images in batch, 0 for all CPUs
+#
+mbn_jobs = 0
+
 #
 # Maximum size of flash Auto-detected page
 #
@@ -141,6 +169,106 @@ class AttestCert:
 class SigCalc:
     SIGCALC = 0x140B04550306
 
+#
+# Length of OID marker of attest cert and signature calc
+#
+CERT_CHAIN_MARKER_SZ = 6
+
+#
+# Attest cert markers to be picked up, AttestCert.CN is not
+#
+CERT_CHAIN_ATTESTCERT_MARKERS = (AttestCert.C, AttestCert.ST, AttestCert.L, AttestCert.O, AttestCert.INFO)
+
+#
+# Build regex alternation of markers, each followed by length byte
+#
+def compile_cert_chain_markers(markers):
+    pattern = "|".join(re.escape(struct.pack('<Q', m)[0:CERT_CHAIN_MARKER_SZ]) for m in markers)
+
+    return re.compile("(?:" + pattern + ")(?=(.))", re.DOTALL)
+
+CERT_CHAIN_MARKER_RE = compile_cert_chain_markers(CERT_CHAIN_ATTESTCERT_MARKERS + (SigCalc.SIGCALC,))
+
+CERT_CHAIN_SIGCALC_MARKER = struct.pack('<Q', SigCalc.SIGCALC)[0:CERT_CHAIN_MARKER_SZ]
+
+CERT_CHAIN_ATTESTCERT_MARKER_SET = frozenset(struct.pack('<Q', m)[0:CERT_CHAIN_MARKER_SZ] for m in CERT_CHAIN_ATTESTCERT_MARKERS)
+
+#
+# Certification chain type names
+#
+CERT_CHAIN_TYPE_NAME = {
+    CertChain.SIGNATURE : 'Signature',
+    CertChain.CERT      : 'Attestation Cert',
+    CertChain.CA        : 'CA Cert',
+    CertChain.ROOT      : 'Root Cert',
+    }
+
+#
+# DER tags used in X.509 certificate
+#
+DER_TAG_INTEGER          = 0x02
+DER_TAG_BIT_STRING       = 0x03
+DER_TAG_OCTET_STRING     = 0x04
+DER_TAG_OID              = 0x06
+DER_TAG_UTC_TIME         = 0x17
+DER_TAG_GENERALIZED_TIME = 0x18
+DER_TAG_SEQUENCE         = 0x30
+DER_TAG_SET              = 0x31
+DER_TAG_X509_VERSION     = 0xA0
+
+#
+# Short names of OIDs in X.509 certificate
+#
+X509_OID_NAME = {
+    '2.5.4.3'               : 'CN',
+    '2.5.4.5'               : 'SERIALNUMBER',
+    '2.5.4.6'               : 'C',
+    '2.5.4.7'               : 'L',
+    '2.5.4.8'               : 'ST',
+    '2.5.4.10'              : 'O',
+    '2.5.4.11'              : 'OU',
+    '1.2.840.113549.1.9.1'  : 'E',
+    '1.2.840.113549.1.1.1'  : 'rsaEncryption',
+    '1.2.840.113549.1.1.5'  : 'sha1WithRSAEncryption',
+    '1.2.840.113549.1.1.10' : 'RSASSA-PSS',
+    '1.2.840.113549.1.1.11' : 'sha256WithRSAEncryption',
+    '1.2.840.113549.1.1.12' : 'sha384WithRSAEncryption',
+    }
+
+#
+# Parsed X.509 certificates keyed by SHA-256 of DER, root and CA certs
+# recur in every image of a release
+#
+X509_CERT_CACHE_SZ = 32
+
+x509_cert_cache = collections.OrderedDict()
+
+#
+# Chunk size to hash code from mapped image
+#
+MBN_HASH_CHUNK_SZ = 1024 * 1024
+
+#
+# Hash algorithms of signed hash, by digest size
+#
+MBN_HASH_ALG = {
+    20 : 'sha1',
+    32 : 'sha256',
+    48 : 'sha384',
+    }
+
+#
+# Pads of SW_ID and HW_ID in signed hash:
+# H(HW_ID ^ OPAD, H(SW_ID ^ IPAD, H(code)))
+#
+MBN_SIGCALC_IPAD = 0x3636363636363636
+MBN_SIGCALC_OPAD = 0x5C5C5C5C5C5C5C5C
+
+#
+# Rounds of certification chain parsing in benchmark
+#
+MBN_BENCHMARK_ROUNDS = 100
+
 #
 # Class Definition For Parser
 #
@@ -234,6 +362,7 @@ class Parser(object):
         self.cert_chain_sig_sz = 0
         self.cert_chain_attestcert = []
         self.cert_chain_sigcalc = []
+        self.cert_chain_certs = []
 
     #
     # Convert string to integer
@@ -381,14 +510,63 @@ class Parser(object):
             '''
 
     #
-    # Parse certification chain
+    # Get certification chain data following code and signature
     #
-    def parse_cert_chain(self):
+    def get_cert_chain_data(self):
         offset = self.hdr_code_sz + self.hdr_sig_sz
         cert_cacert_rootcert_sz = self.hdr_image_sz - offset
-        image_data = self.image[self.hdr_image_src+offset:self.hdr_image_src+offset+cert_cacert_rootcert_sz]
 
-        index = 0
+        return self.image[self.hdr_image_src+offset:self.hdr_image_src+offset+cert_cacert_rootcert_sz]
+
+    #
+    # Search attest cert and signature calc markers in certification chain
+    #
+    # All markers are found in one pass of compiled regex. Length byte is
+    # matched by lookahead, so that marker may start right at it as in
+    # byte-by-byte scan.
+    #
+    def search_cert_chain_markers(self):
+        image_data = self.get_cert_chain_data()
+
+        for m in CERT_CHAIN_MARKER_RE.finditer(image_data):
+            i = m.end()
+            length = ord(m.group(1))
+
+            if m.group(0) == CERT_CHAIN_SIGCALC_MARKER:
+                self.cert_chain_sigcalc.append(image_data[i+1:i+1+length])
+            else:
+                self.cert_chain_attestcert.append(image_data[i+1:i+1+length])
+
+    #
+    # Parse certification chain
+    #
+    # Certs are walked as DER, attest cert and signature calc are picked up
+    # from issuer and subject RDNs, in the order they appear in image.
+    # Markers are searched instead if no cert could be parsed.
+    #
+    def parse_cert_chain(self):
+        self.cert_chain_certs = parse_x509_cert_chain(self.get_cert_chain_data())
+
+        if len(self.cert_chain_certs) == 0:
+            self.search_cert_chain_markers()
+            return
+
+        for cert in self.cert_chain_certs:
+            for oid, tag, value in cert['issuer'] + cert['subject']:
+                marker = chr(DER_TAG_OID) + chr(len(oid)) + oid + chr(tag)
+
+                if marker in CERT_CHAIN_ATTESTCERT_MARKER_SET:
+                    self.cert_chain_attestcert.append(value)
+                elif marker == CERT_CHAIN_SIGCALC_MARKER:
+                    self.cert_chain_sigcalc.append(value)
+
+    #
+    # Parse certification chain byte by byte, for benchmark only
+    #
+    def parse_cert_chain_legacy(self):
+        image_data = self.get_cert_chain_data()
+        cert_cacert_rootcert_sz = len(image_data)
+
         for i in range(0, cert_cacert_rootcert_sz, 1):
             if self.str2int(image_data[i:i+6]) == AttestCert.C \
                     or self.str2int(image_data[i:i+6]) == AttestCert.ST \
@@ -402,6 +580,112 @@ class Parser(object):
                 length = self.str2int(image_data[i+6])
                 self.cert_chain_sigcalc.append(image_data[i+7:i+7+length])
 
+    #
+    # Get hash of code in chunks, without copying mapped image
+    #
+    def get_code_hash(self, hash_alg):
+        h = hashlib.new(hash_alg)
+
+        offset = self.hdr_image_src
+        end = min(offset + self.hdr_code_sz, len(self.image))
+
+        while offset < end:
+            n = min(MBN_HASH_CHUNK_SZ, end - offset)
+            h.update(buffer(self.image, offset, n))
+            offset += n
+
+        return h.digest()
+
+    #
+    # Recover signed hash from signature with public key of attestation cert
+    #
+    # Signature is RSA PKCS#1 v1.5 over raw hash, DigestInfo is accepted too.
+    # Returns None if it can not be recovered.
+    #
+    def get_signed_hash(self):
+        if len(self.cert_chain_certs) == 0 or self.cert_chain_certs[0]['public_key'] is None:
+            return None
+
+        modulus, exponent = self.cert_chain_certs[0]['public_key']
+        modulus_sz = (modulus.bit_length() + 7) / 8
+
+        offset = self.hdr_image_src + self.hdr_code_sz
+        sig = self.image[offset:offset+self.hdr_sig_sz]
+        if len(sig) != modulus_sz:
+            return None
+
+        em = "%0*x" % (modulus_sz * 2, pow(int(sig.encode('hex'), 16), exponent, modulus))
+        em = em.decode('hex')
+
+        #
+        # 00 01 FF .. FF 00 payload
+        #
+        end = em.find('\x00', 2)
+        if em[0:2] != '\x00\x01' or end < 10 or em[2:end] != '\xff' * (end - 2):
+            return None
+
+        payload = em[end+1:]
+
+        if len(payload) not in MBN_HASH_ALG:
+            try:
+                start, stop = read_der_expected(payload, 0, len(payload), DER_TAG_SEQUENCE)
+                start, offset = read_der_expected(payload, start, stop, DER_TAG_SEQUENCE)
+                start, offset = read_der_expected(payload, offset, stop, DER_TAG_OCTET_STRING)
+            except ValueError:
+                return None
+
+            payload = payload[start:offset]
+
+        return payload
+
+    #
+    # Get SW_ID and HW_ID from signature calc, zero if not found
+    #
+    def get_sigcalc_ids(self):
+        sw_id = 0
+        hw_id = 0
+
+        for item in self.cert_chain_sigcalc:
+            fields = item.split()
+            if len(fields) != 3:
+                continue
+
+            try:
+                if fields[2] == 'SW_ID':
+                    sw_id = int(fields[1], 16)
+                elif fields[2] == 'HW_ID':
+                    hw_id = int(fields[1], 16)
+            except ValueError:
+                continue
+
+        return sw_id, hw_id
+
+    #
+    # Verify hash of code against signed hash, return (result, reason)
+    #
+    def verify_code_hash(self):
+        signed_hash = self.get_signed_hash()
+        if signed_hash is None:
+            return (False, "signed hash not recovered")
+
+        hash_alg = MBN_HASH_ALG.get(len(signed_hash))
+        if hash_alg is None:
+            return (False, "unknown hash size %d" % len(signed_hash))
+
+        if self.hdr_image_src + self.hdr_code_sz > len(self.image):
+            return (False, "code truncated")
+
+        sw_id, hw_id = self.get_sigcalc_ids()
+
+        code_hash = self.get_code_hash(hash_alg)
+        code_hash = hashlib.new(hash_alg, struct.pack('>Q', sw_id ^ MBN_SIGCALC_IPAD) + code_hash).digest()
+        code_hash = hashlib.new(hash_alg, struct.pack('>Q', hw_id ^ MBN_SIGCALC_OPAD) + code_hash).digest()
+
+        if code_hash != signed_hash:
+            return (False, hash_alg + " mismatched")
+
+        return (True, hash_alg + " matched")
+
     #
     # Print header info
     #
@@ -463,8 +747,20 @@ class Parser(object):
         print("")
         print("Signature Calc  :")
         print(self.cert_chain_sigcalc)
-        print("")
-        print("Root Cert       : IGNORED HERE")
+
+        for cert in self.cert_chain_certs:
+            print("")
+            print(CERT_CHAIN_TYPE_NAME[cert['type']] + ":")
+            print("Offset          : " + str(cert['offset']))
+            print("Size            : " + str(cert['size']))
+            print("Version         : " + str(cert['version']))
+            print("Serial Number   : " + cert['serial'])
+            print("Signature Alg   : " + cert['sig_alg'])
+            print("Issuer          : " + get_x509_name_str(cert['issuer']))
+            print("Subject         : " + get_x509_name_str(cert['subject']))
+            print("Not Before      : " + cert['not_before'])
+            print("Not After       : " + cert['not_after'])
+            print("SHA-256         : " + cert['digest'])
 
     #
     # Run routine
@@ -519,10 +815,248 @@ class Parser(object):
     def get_cert_chain_sigcalc(self):
         return self.cert_chain_sigcalc
 
+    #
+    # Get certifiaction chain certs parsed from DER
+    #
+    def get_cert_chain_certs(self):
+        return self.cert_chain_certs
+
 #
 # Function Definition
 #
 
+#
+# Read DER tag and length at offset, return tag and range of value
+#
+def read_der_tlv(data, offset, end):
+    if offset + 2 > end:
+        raise ValueError("truncated DER header at %d" % offset)
+
+    tag = ord(data[offset])
+    length = ord(data[offset+1])
+    offset += 2
+
+    if tag & 0x1F == 0x1F:
+        raise ValueError("unsupported DER tag at %d" % offset)
+
+    #
+    # Long form length, number of length bytes in low 7 bits
+    #
+    if length & 0x80:
+        length_sz = length & 0x7F
+        if length_sz == 0 or length_sz > 4 or offset + length_sz > end:
+            raise ValueError("invalid DER length at %d" % offset)
+
+        length = 0
+        for c in data[offset:offset+length_sz]:
+            length = (length << 8) | ord(c)
+        offset += length_sz
+
+    if offset + length > end:
+        raise ValueError("DER value overflows at %d" % offset)
+
+    return tag, offset, offset + length
+
+#
+# Read DER value with expected tag at offset, return range of value
+#
+def read_der_expected(data, offset, end, expected):
+    tag, start, stop = read_der_tlv(data, offset, end)
+    if tag != expected:
+        raise ValueError("expected DER tag 0x%02x but 0x%02x at %d" % (expected, tag, offset))
+
+    return start, stop
+
+#
+# Decode OID to dotted string
+#
+def decode_der_oid(oid):
+    arcs = []
+    value = 0
+
+    for c in oid:
+        value = (value << 7) | (ord(c) & 0x7F)
+        if ord(c) & 0x80 == 0:
+            arcs.append(value)
+            value = 0
+
+    if len(arcs) == 0:
+        return ""
+
+    first = min(arcs[0] / 40, 2)
+
+    return ".".join(str(i) for i in [first, arcs[0] - first * 40] + arcs[1:])
+
+#
+# Get short name of OID in DER, dotted string if unknown
+#
+def get_x509_oid_name(oid):
+    oid_str = decode_der_oid(oid)
+
+    return X509_OID_NAME.get(oid_str, oid_str)
+
+#
+# Decode UTCTime or GeneralizedTime, raw string if not in 'Z' form
+#
+def decode_x509_time(tag, value):
+    if tag == DER_TAG_UTC_TIME and len(value) == 13 and value.endswith('Z'):
+        year = int(value[0:2])
+        value = str(year < 50 and 2000 + year or 1900 + year) + value[2:]
+    elif tag != DER_TAG_GENERALIZED_TIME or len(value) != 15 or value.endswith('Z') is False:
+        return value
+
+    return "%s-%s-%s %s:%s:%s UTC" % (value[0:4], value[4:6], value[6:8], value[8:10], value[10:12], value[12:14])
+
+#
+# Parse X.509 Name, return list of (OID, value tag, value) in RDN order
+#
+def parse_x509_name(data, offset, end):
+    rdns = []
+
+    while offset < end:
+        set_start, set_end = read_der_expected(data, offset, end, DER_TAG_SET)
+        offset = set_end
+
+        while set_start < set_end:
+            atv_start, atv_end = read_der_expected(data, set_start, set_end, DER_TAG_SEQUENCE)
+            set_start = atv_end
+
+            oid_start, oid_end = read_der_expected(data, atv_start, atv_end, DER_TAG_OID)
+            tag, value_start, value_end = read_der_tlv(data, oid_end, atv_end)
+
+            rdns.append((data[oid_start:oid_end], tag, data[value_start:value_end]))
+
+    return rdns
+
+#
+# Get string of X.509 Name
+#
+def get_x509_name_str(rdns):
+    return ", ".join("%s=%s" % (get_x509_oid_name(oid), value) for oid, tag, value in rdns)
+
+#
+# Parse X.509 certificate in DER, only fields of TBSCertificate up to subject
+#
+def parse_x509_cert_internal(der):
+    cert_start, cert_end = read_der_expected(der, 0, len(der), DER_TAG_SEQUENCE)
+    tbs_start, tbs_end = read_der_expected(der, cert_start, cert_end, DER_TAG_SEQUENCE)
+
+    cert = {}
+
+    #
+    # Version is explicitly tagged and defaults to v1
+    #
+    offset = tbs_start
+    tag, start, stop = read_der_tlv(der, offset, tbs_end)
+    if tag == DER_TAG_X509_VERSION:
+        version_start, version_end = read_der_expected(der, start, stop, DER_TAG_INTEGER)
+        cert['version'] = int(der[version_start:version_end].encode('hex'), 16) + 1
+        offset = stop
+    else:
+        cert['version'] = 1
+
+    start, offset = read_der_expected(der, offset, tbs_end, DER_TAG_INTEGER)
+    cert['serial'] = der[start:offset].encode('hex')
+
+    start, offset = read_der_expected(der, offset, tbs_end, DER_TAG_SEQUENCE)
+    oid_start, oid_end = read_der_expected(der, start, offset, DER_TAG_OID)
+    cert['sig_alg'] = get_x509_oid_name(der[oid_start:oid_end])
+
+    start, offset = read_der_expected(der, offset, tbs_end, DER_TAG_SEQUENCE)
+    cert['issuer'] = parse_x509_name(der, start, offset)
+
+    start, offset = read_der_expected(der, offset, tbs_end, DER_TAG_SEQUENCE)
+    tag, time_start, time_end = read_der_tlv(der, start, offset)
+    cert['not_before'] = decode_x509_time(tag, der[time_start:time_end])
+    tag, time_start, time_end = read_der_tlv(der, time_end, offset)
+    cert['not_after'] = decode_x509_time(tag, der[time_start:time_end])
+
+    start, offset = read_der_expected(der, offset, tbs_end, DER_TAG_SEQUENCE)
+    cert['subject'] = parse_x509_name(der, start, offset)
+
+    cert['self_signed'] = cert['issuer'] == cert['subject']
+
+    #
+    # RSA public key as (modulus, exponent), None for other key types
+    #
+    spki_start, spki_end = read_der_expected(der, offset, tbs_end, DER_TAG_SEQUENCE)
+    start, offset = read_der_expected(der, spki_start, spki_end, DER_TAG_SEQUENCE)
+    oid_start, oid_end = read_der_expected(der, start, offset, DER_TAG_OID)
+    cert['key_alg'] = get_x509_oid_name(der[oid_start:oid_end])
+    cert['public_key'] = None
+
+    if cert['key_alg'] == 'rsaEncryption':
+        start, offset = read_der_expected(der, offset, spki_end, DER_TAG_BIT_STRING)
+        key_start, key_end = read_der_expected(der, start + 1, offset, DER_TAG_SEQUENCE)
+        start, offset = read_der_expected(der, key_start, key_end, DER_TAG_INTEGER)
+        modulus = int(der[start:offset].encode('hex'), 16)
+        start, offset = read_der_expected(der, offset, key_end, DER_TAG_INTEGER)
+        exponent = int(der[start:offset].encode('hex'), 16)
+        cert['public_key'] = (modulus, exponent)
+
+    return cert
+
+#
+# Parse X.509 certificate in DER with cache, None if malformed
+#
+def parse_x509_cert(der):
+    global x509_cert_cache
+
+    digest = hashlib.sha256(der).hexdigest()
+
+    cert = x509_cert_cache.pop(digest, None)
+    if cert is None:
+        try:
+            cert = parse_x509_cert_internal(der)
+        except ValueError:
+            return None
+
+        cert['digest'] = digest
+        cert['size'] = len(der)
+
+        if len(x509_cert_cache) >= X509_CERT_CACHE_SZ:
+            x509_cert_cache.popitem(last=False)
+
+    x509_cert_cache[digest] = cert
+
+    return cert
+
+#
+# Parse X.509 certificates in chain one by one until padding
+#
+# The first one is attestation cert, the last one is root cert if more than
+# one, and the others are CA certs.
+#
+def parse_x509_cert_chain(data):
+    certs = []
+
+    offset = 0
+    end = len(data)
+
+    while offset < end and ord(data[offset]) == DER_TAG_SEQUENCE:
+        try:
+            tag, start, stop = read_der_tlv(data, offset, end)
+        except ValueError:
+            break
+
+        cert = parse_x509_cert(data[offset:stop])
+        if cert is None:
+            break
+
+        cert = dict(cert)
+        cert['offset'] = offset
+        cert['type'] = CertChain.CA
+        certs.append(cert)
+
+        offset = stop
+
+    if len(certs) > 0:
+        certs[0]['type'] = CertChain.CERT
+    if len(certs) > 1:
+        certs[-1]['type'] = CertChain.ROOT
+
+    return certs
+
 #
 # Verify if attest cert is in mbn image
 #
@@ -565,17 +1099,44 @@ def parse_sigverify_list(sv_list_file):
 
     return sv_list
 
+#
+# Map image file into memory read-only
+#
+# Pages are read in only when touched, so resident memory follows what
+# is parsed rather than the image size.
+#
+def mmap_image(image_file):
+    fp = open(image_file, "rb")
+
+    try:
+        image_data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+        #
+        # Empty file can not be mapped
+        #
+        image_data = ""
+
+    fp.close()
+
+    return image_data
+
+#
+# Unmap image mapped by mmap_image()
+#
+def munmap_image(image_data):
+    if isinstance(image_data, mmap.mmap):
+        image_data.close()
+
 #
 # Parse *.mbn image
 #
 def parse_mbnimg(image_file):
     global is_sig_verified
+    global is_code_verified
 
     ret = False
 
-    fp = open(image_file, "rb")
-    image_data = fp.read()
-    fp.close()
+    image_data = mmap_image(image_file)
 
     parser = Parser(image_data)
     parser.run()
@@ -593,6 +1154,18 @@ def parse_mbnimg(image_file):
     else:
         ret = True
 
+    if is_code_verified is True:
+        print("\nVerifying code hash in mbn image...")
+
+        code_ret, reason = parser.verify_code_hash()
+        if code_ret is True:
+            print("The code hash matched (%s)." % reason)
+        else:
+            print("The code hash is NOT matched (%s)!" % reason)
+            ret = False
+
+    munmap_image(image_data)
+
     ''' test only
     print(hex(ord(image_data[0])))
     data_hex = binascii.b2a_hex(image_data[1])
@@ -601,6 +1174,237 @@ def parse_mbnimg(image_file):
 
     return ret
 
+#
+# Get list of *.mbn in directory, or of files matched by glob
+#
+def get_mbnimg_list(pattern):
+    if os.path.isdir(pattern) is True:
+        pattern = os.path.join(pattern, "*.mbn")
+
+    return sorted(f for f in glob.glob(pattern) if os.path.isfile(f) is True)
+
+#
+# Parse *.mbn image in batch, run in process of pool
+#
+# Only header and certification chain are parsed, so only pages of them
+# are read in from mapped image, unless code is verified, in which case
+# the whole code region is hashed.
+#
+def parse_mbnimg_worker(image_file):
+    global is_sig_verified
+    global is_code_verified
+
+    result = {
+        'file'        : image_file,
+        'valid'       : False,
+        'signed'      : None,
+        'code'        : None,
+        'code_reason' : "",
+        'certs'       : 0,
+        'error'       : "",
+        'time'        : 0.0,
+        }
+
+    start = time.time()
+
+    try:
+        image_data = mmap_image(image_file)
+    except (IOError, OSError), err:
+        result['error'] = str(err)
+        result['time'] = time.time() - start
+        return result
+
+    try:
+        parser = Parser(image_data)
+
+        if len(image_data) == 0:
+            result['error'] = "empty image"
+        elif parser.check_image_id() is True:
+            parser.parse_header()
+            parser.parse_cert_chain()
+
+            result['valid'] = True
+            result['certs'] = len(parser.get_cert_chain_certs())
+
+            if is_sig_verified is True:
+                result['signed'] = verify_attestcert_in_sigverify_list(parser.get_cert_chain_attestcert())
+
+            if is_code_verified is True:
+                result['code'], result['code_reason'] = parser.verify_code_hash()
+        else:
+            result['error'] = "invalid image type"
+    except Exception, err:
+        #
+        # One broken image should not stop the whole batch
+        #
+        result['error'] = str(err)
+    finally:
+        munmap_image(image_data)
+
+    result['time'] = time.time() - start
+
+    return result
+
+#
+# Parse *.mbn images in batch with process pool and print report
+#
+def parse_mbnimg_batch(image_list):
+    global mbn_jobs
+    global is_sig_verified
+    global is_code_verified
+
+    jobs = mbn_jobs
+    if jobs == 0:
+        jobs = multiprocessing.cpu_count()
+
+    start = time.time()
+
+    if jobs > 1 and len(image_list) > 1:
+        pool = multiprocessing.Pool(min(jobs, len(image_list)))
+        try:
+            results = pool.map(parse_mbnimg_worker, image_list, 1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = map(parse_mbnimg_worker, image_list)
+
+    wall_time = time.time() - start
+
+    name_len = max(len(os.path.basename(r['file'])) for r in results)
+
+    print("----------------------------------------")
+    print("MBN BATCH REPORT\n")
+
+    valid_num = 0
+    signed_num = 0
+    code_num = 0
+    cpu_time = 0.0
+
+    for r in results:
+        if r['valid'] is False:
+            status = "ERROR: " + r['error']
+        elif r['signed'] is True:
+            status = "SIGNED"
+        elif r['signed'] is False:
+            status = "NOT SIGNED"
+        else:
+            status = "PARSED"
+
+        if r['code'] is True:
+            status += ", CODE " + r['code_reason']
+        elif r['code'] is False:
+            status += ", CODE NOT MATCHED: " + r['code_reason']
+
+        if r['valid'] is True:
+            valid_num += 1
+        if r['signed'] is True:
+            signed_num += 1
+        if r['code'] is True:
+            code_num += 1
+        cpu_time += r['time']
+
+        print("%-*s  %8.2f ms  %d certs  %s" % (name_len, os.path.basename(r['file']), r['time'] * 1000, r['certs'], status))
+
+    print("")
+    print("Images                  : " + str(len(results)))
+    print("Parsed                  : " + str(valid_num))
+    if is_sig_verified is True:
+        print("Signed                  : " + str(signed_num))
+    if is_code_verified is True:
+        print("Code hash matched       : " + str(code_num))
+    print("Processes               : " + str(min(jobs, len(results))))
+    print("Time of images          : %.2f ms" % (cpu_time * 1000))
+    print("Wall-clock time         : %.2f ms" % (wall_time * 1000))
+
+    if valid_num != len(results):
+        return False
+
+    if is_sig_verified is True and signed_num != len(results):
+        return False
+
+    if is_code_verified is True and code_num != len(results):
+        return False
+
+    return True
+
+#
+# Benchmark certification chain parsing
+#
+def benchmark_mbnimg(image_file):
+    image_data = mmap_image(image_file)
+
+    parser = Parser(image_data)
+
+    if parser.check_image_id() is False:
+        print("\nERROR: invalid image type!\n")
+        munmap_image(image_data)
+        return False
+
+    parser.parse_header()
+
+    cert_chain_sz = len(parser.get_cert_chain_data())
+
+    #
+    # Byte by byte with str2int()
+    #
+    start = time.time()
+    for i in range(0, MBN_BENCHMARK_ROUNDS, 1):
+        parser.cert_chain_attestcert = []
+        parser.cert_chain_sigcalc = []
+        parser.parse_cert_chain_legacy()
+    legacy_time = time.time() - start
+    legacy_result = (parser.cert_chain_attestcert, parser.cert_chain_sigcalc)
+
+    #
+    # Single pass with compiled regex
+    #
+    start = time.time()
+    for i in range(0, MBN_BENCHMARK_ROUNDS, 1):
+        parser.cert_chain_attestcert = []
+        parser.cert_chain_sigcalc = []
+        parser.search_cert_chain_markers()
+    search_time = time.time() - start
+    search_result = (parser.cert_chain_attestcert, parser.cert_chain_sigcalc)
+
+    #
+    # DER walk without cache
+    #
+    start = time.time()
+    for i in range(0, MBN_BENCHMARK_ROUNDS, 1):
+        x509_cert_cache.clear()
+        parse_x509_cert_chain(parser.get_cert_chain_data())
+    der_time = time.time() - start
+
+    #
+    # DER walk with cache
+    #
+    start = time.time()
+    for i in range(0, MBN_BENCHMARK_ROUNDS, 1):
+        parse_x509_cert_chain(parser.get_cert_chain_data())
+    cached_time = time.time() - start
+
+    rate = lambda t : t > 0 and "%.0f" % (MBN_BENCHMARK_ROUNDS / t) or "n/a"
+
+    print("\n----------------------------------------")
+    print("MBN CERTIFICATION CHAIN PARSING BENCHMARK\n")
+
+    print("Certification chain size  : " + str(cert_chain_sz))
+    print("Rounds                    : " + str(MBN_BENCHMARK_ROUNDS))
+    print("str2int byte by byte      : " + rate(legacy_time) + " chains/s")
+    print("Compiled regex            : " + rate(search_time) + " chains/s")
+    print("DER walk                  : " + rate(der_time) + " chains/s")
+    print("DER walk with cache       : " + rate(cached_time) + " chains/s")
+
+    if search_time > 0:
+        print("Speedup                   : %.1fx" % (legacy_time / search_time))
+
+    print("Results matched           : " + str(legacy_result == search_result))
+
+    munmap_image(image_data)
+
+    return legacy_result == search_result
+
 #
 # Print usage
 #
@@ -612,7 +1416,11 @@ def print_usage():
     print("")
     print("OPTIONS:")
     print("  -f, --file       Image file to be parsed")
+    print("  -d, --dir        Directory or glob of image files to be parsed in batch")
+    print("  -j, --jobs       Processes to parse images in batch, 0 for all CPUs")
     print("  -s, --sigverify  Verify signature")
+    print("  -c, --codeverify Verify code hash against signature")
+    print("  -b, --benchmark  Benchmark certification chain parsing")
     print("  -v, --verbose    Verbose messages")
     print("  -h, --help       Display help message")
     print("")
@@ -624,10 +1432,15 @@ def main():
     global is_pr_verb
     global is_sig_verified
     global sigverify_list
+    global is_code_verified
+    global mbn_jobs
 
     ret = False
 
+    image_file = ""
+    image_dir = ""
     sv_list = ""
+    is_benchmarked = False
 
     #
     # Display banner
@@ -638,7 +1451,7 @@ def main():
     # Get args list
     #
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "f:s:vh", ["file=", "sigverify=", "verbose", "help"])
+        opts, args = getopt.getopt(sys.argv[1:], "f:d:j:s:cbvh", ["file=", "dir=", "jobs=", "sigverify=", "codeverify", "benchmark", "verbose", "help"])
     except getopt.GetoptError, err:
         print str(err)
         print_usage()
@@ -647,9 +1460,25 @@ def main():
     for o, a in opts:
         if o in ("-f", "--file"):
             image_file = a
+        elif o in ("-d", "--dir"):
+            image_dir = a
+        elif o in ("-j", "--jobs"):
+            try:
+                mbn_jobs = int(a)
+            except ValueError:
+                mbn_jobs = -1
+
+            if mbn_jobs < 0:
+                print("\nERROR: invalid parameter '%s' !\n" % a)
+                print_usage()
+                sys.exit(1)
         elif o in ("-s", "--sigverify"):
             is_sig_verified = True
             sv_list = a
+        elif o in ("-c", "--codeverify"):
+            is_code_verified = True
+        elif o in ("-b", "--benchmark"):
+            is_benchmarked = True
         elif o in ("-v", "--verbose"):
             is_pr_verb = True
         elif o in ("-h", "--help"):
@@ -673,12 +1502,35 @@ def main():
             print_usage()
             sys.exit(1)
 
+    #
+    # Parse mbn images in batch
+    #
+    if image_dir != "":
+        image_list = get_mbnimg_list(os.path.join(os.getcwd(), image_dir))
+        if len(image_list) == 0:
+            print("\nERROR: no image found in '%s' !\n" % image_dir)
+            print_usage()
+            sys.exit(1)
+
+        print("\nParsing %d mbn images...\n" % len(image_list))
+        ret = parse_mbnimg_batch(image_list)
+        if ret is True:
+            print("\nDone!\n")
+        else:
+            print("\nFailed!\n")
+
+        return ret
+
     #
     # Parse mbn image
     #
-    if os.access(os.path.join(os.getcwd(), image_file), os.F_OK) is True:
-        print("\nParsing mbn image...\n")
-        ret = parse_mbnimg(os.path.join(os.getcwd(), image_file))
+    if image_file != "" and os.access(os.path.join(os.getcwd(), image_file), os.F_OK) is True:
+        if is_benchmarked is True:
+            print("\nBenchmarking mbn image...\n")
+            ret = benchmark_mbnimg(os.path.join(os.getcwd(), image_file))
+        else:
+            print("\nParsing mbn image...\n")
+            ret = parse_mbnimg(os.path.join(os.getcwd(), image_file))
         if ret is True:
             print("\nDone!\n")
         else: